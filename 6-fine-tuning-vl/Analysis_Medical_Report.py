@@ -2,6 +2,11 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import os
 import re
+import sys
+
+# 报告类型按指标知识库分类（与 7-endpoint-integration-server 共用）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "7-endpoint-integration-server"))
+from indicator_knowledge_base import knowledge_base
 
 # 配置英文显示字体
 plt.rcParams['font.sans-serif'] = ['Arial', 'Helvetica', 'DejaVu Sans']
@@ -29,6 +34,29 @@ OUTPUT_DIR = "./medical_vlm_visualization"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 # Excel报告路径
 EXCEL_OUTPUT_PATH = os.path.join(OUTPUT_DIR, "Medical_Report_Analysis_Statistics.xlsx")
+# 报告同时涉及多个类别时按该顺序取第一个（知识库中的类别代码）
+REPORT_TYPE_PRIORITY = ("coagulation", "blood_type", "hbv", "infectious")
+
+
+# 文件名中缩写常与编号直接相连（如 APTT1.jpg），在字母和数字之间断开后再按整词匹配指标别名
+FILENAME_ALNUM_BOUNDARY = re.compile(r"(?<=[A-Za-z])(?=\d)|(?<=\d)(?=[A-Za-z])")
+
+
+def classify_report_type(img_filename, chinese_content):
+    """
+    按文件名和中文内容中出现的指标别名/类别关键词判断报告类型
+    内容按整词匹配（如 PTH 不会被当作 PT）；文件名中的类别关键词（如"凝血"、"HBV"）不要求词边界
+    """
+    filename = FILENAME_ALNUM_BOUNDARY.sub(" ", img_filename)
+    found = set(knowledge_base.categories_in(f"{filename}\n{chinese_content}"))
+    found.update(
+        category.key for category in knowledge_base.categories.values()
+        if any(keyword in img_filename for keyword in category.keywords)
+    )
+    for key in REPORT_TYPE_PRIORITY:
+        if key in found:
+            return knowledge_base.categories[key].name
+    return "其他类型"
 
 def parse_test_results(result_file):
     """解析测试结果文件并提取核心数据（统一字段命名）"""
@@ -100,19 +128,8 @@ def parse_test_results(result_file):
         status = report[2].lower()
         chinese_content = report[4].strip()  # 保留中文内容处理逻辑
 
-        # 使用中文关键词分类报告类型（分类准确性关键）
-        if any(keyword in img_filename or keyword in chinese_content for keyword in
-               ["血凝", "凝血", "PT", "APTT", "INR"]):
-            report_type = "凝血功能检测"
-        elif any(keyword in img_filename or keyword in chinese_content for keyword in ["血型", "ABO", "RH"]):
-            report_type = "血型检测"
-        elif any(keyword in img_filename or keyword in chinese_content for keyword in ["乙肝", "HBV", "前S1"]):
-            report_type = "乙肝五项检测"
-        elif any(keyword in img_filename or keyword in chinese_content for keyword in
-                 ["丙肝", "HIV", "梅毒", "Anti-TP", "RPR"]):
-            report_type = "传染病筛查"
-        else:
-            report_type = "其他类型"
+        # 使用指标知识库分类报告类型（按指标别名匹配，如 PTH 不会被当作 PT）
+        report_type = classify_report_type(img_filename, chinese_content)
 
         # 使用中文内容标记评估数据提取完整性
         completeness = {
@@ -3,8 +3,12 @@ import re
 import json
 import os
 import base64
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from image_artifact_cache import image_cache
+
 # curl http://124.156.193.94:80/v1/models
 # curl http://124.156.193.94:80/api/generate -d '{"model": "qwen2.5vl:32b", "prompt": "你好"}'
 # curl http://124.156.193.94:80/api/generate -d '{"model": "qwen2.5vl:32b", "prompt": "你好"}'
@@ -17,6 +21,11 @@ def natural_sort_key(s):
     """自定义自然排序的键函数"""
     return [int(c) if c.isdigit() else c for c in re.split(r"(\d+)", s)]
 
+def read_image_base64(image_path):
+    """将图片文件原样编码为 base64 字符串"""
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode('utf-8')
+
 def process_image_with_ollama(image_path):
     """
     使用Ollama服务处理单张图片
@@ -24,9 +33,8 @@ def process_image_with_ollama(image_path):
     # 构造提示词
     prompt = PROMPT_TEMPLATE
     
-    # 将图片编码为base64
-    with open(image_path, "rb") as image_file:
-        encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
+    # 将图片编码为base64（按文件哈希缓存，见 image_artifact_cache）
+    encoded_image = image_cache.get_or_encode(image_path, {"encoder": "raw_base64"}, read_image_base64)
     
     # 准备请求数据
     payload = {
@@ -1,13 +1,21 @@
 import base64
 import requests
 import json
+import sys
 from pathlib import Path
 
-def encode_image(image_path):
-    """将图片编码为 base64 字符串"""
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from image_artifact_cache import image_cache
+
+def read_image_base64(image_path):
+    """将图片文件原样编码为 base64 字符串"""
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
+def encode_image(image_path):
+    """将图片编码为 base64 字符串（按文件哈希缓存，见 image_artifact_cache）"""
+    return image_cache.get_or_encode(str(image_path), {"encoder": "raw_base64"}, read_image_base64)
+
 def call_vllm_service(image_path, prompt, server_ip, port):
     """调用 vllm 服务进行图片 QA"""
     # 专门使用 /v1/chat/completions 端点，并增加超时时间
@@ -0,0 +1,103 @@
+"""
+批量脚本共用的预处理图片缓存：按原图文件哈希和预处理参数（最大尺寸、压缩质量、预处理档位等）保存编码后的base64文本
+
+同一批图片重复评测时，vllm_image_via_request_base64.py 和 helps/ 下的脚本不再每次重新打开、旋转、缩放、编码图片，
+命中时直接读取缓存文件即可开始发送请求。缓存文件以mmap方式读取（多个并发工作线程/进程读取同一文件时共享页缓存），
+写入时先写临时文件再替换，并发写入同一条目不会读到写了一半的文件。
+
+缓存目录默认为本目录下的 image-cache/，可用环境变量 IMAGE_CACHE_DIR 修改，IMAGE_CACHE_ENABLED=false 关闭缓存；
+预处理逻辑改变时修改 params 中的 encoder 名称（或 CACHE_FORMAT_VERSION），旧条目自然失效，可直接删除缓存目录。
+"""
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+from typing import Callable, Optional
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "image-cache"))
+CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+
+
+def source_file_hash(path: str) -> str:
+    """原图文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def params_digest(params: dict) -> str:
+    """预处理参数的摘要（参数按键排序后序列化，顺序不影响结果）"""
+    payload = json.dumps([CACHE_FORMAT_VERSION, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def read_mapped(path: str) -> str:
+    """以mmap方式读取缓存文件中的base64文本"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[:].decode("ascii")
+
+
+class EncodedImageCache:
+    """磁盘上的编码图片缓存：<cache_dir>/<哈希前2位>/<文件哈希>-<参数摘要>.b64"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, enabled: bool = CACHE_ENABLED):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def entry_path(self, source_hash: str, params: dict) -> str:
+        return os.path.join(self.cache_dir, source_hash[:2], f"{source_hash}-{params_digest(params)}.b64")
+
+    def get_or_encode(self, image_path: str, params: dict, encoder: Callable[[str], str],
+                      source_hash: Optional[str] = None) -> str:
+        """
+        返回图片按 params 预处理并编码后的base64文本：命中缓存时直接读取，否则调用 encoder(image_path) 并写入缓存
+        :param params: 影响编码结果的全部参数（如 {"encoder": "...", "max_dimension": 1280, "quality": 85}）
+        :param source_hash: 已计算好的原图文件哈希（可选，省去再读一遍原图）
+        """
+        if not self.enabled:
+            return encoder(image_path)
+        path = self.entry_path(source_hash or source_file_hash(image_path), params)
+        try:
+            encoded = read_mapped(path)
+        except FileNotFoundError:
+            encoded = None
+        if encoded:
+            with self._lock:
+                self.hits += 1
+            return encoded
+
+        encoded = encoder(image_path)
+        with self._lock:
+            self.misses += 1
+        self._write(path, encoded)
+        return encoded
+
+    def _write(self, path: str, encoded: str) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(encoded.encode("ascii"))
+            os.replace(temp_path, path)
+        except OSError:
+            # 缓存写入失败（如磁盘已满）不影响本次处理
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def stats(self) -> str:
+        return f"图片缓存：命中 {self.hits}，未命中 {self.misses}（{self.cache_dir}）"
+
+
+image_cache = EncodedImageCache()
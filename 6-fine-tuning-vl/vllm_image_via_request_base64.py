@@ -1,4 +1,5 @@
 import base64
+import hashlib
 import requests
 import json
 import os
@@ -6,11 +7,19 @@ from PIL import Image
 import io
 from prettytable import PrettyTable
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+import sys
 
 # 配置参数（保持原有设置）
 import os
 script_dir = os.path.dirname(os.path.abspath(__file__))
+# 化验单预处理与 7-endpoint-integration-server 共用同一实现
+sys.path.insert(0, os.path.join(os.path.dirname(script_dir), "7-endpoint-integration-server"))
+from document_preprocessing import encode_document_image, image_mime_type, preprocess_document
+from image_artifact_cache import image_cache, source_file_hash
+from indicator_knowledge_base import WORD_BOUNDARY, compile_trie_pattern, knowledge_base
 API_KEY = "EMPTY"
 IMAGE_FOLDER = os.path.join(script_dir, "test-img")  # 测试图片文件夹
 OUTPUT_DIR = os.path.join(script_dir, "test-results")  # 结果输出目录
@@ -20,34 +29,84 @@ MODEL_ENDPOINT = "http://43.156.5.91:8000/v1/chat/completions"  # 模型接口
 MODEL_NAME = "./qwen25vl-7b-offical-finetuned/"  # 模型名称/路径
 MAX_IMAGE_DIMENSION = 1280  # 图片最大尺寸（防止过大）
 IMAGE_QUALITY = 85  # 图片压缩质量
+PREPROCESS_PROFILE = "none"  # 化验单预处理档位：none（原图缩放）/document（裁边+灰度+按行高缩放）/binary（再自适应二值化）
+CONCURRENCY = 8  # 同时进行的请求数（vLLM连续批处理可同时推理多张图片；1为逐张处理并打印完整报告）
+CHECKPOINT_FILE = os.path.join(OUTPUT_DIR, "checkpoint.jsonl")  # 每张图片处理成功后追加一行，重新运行时跳过已完成的图片
+SUMMARY_INTERVAL = 10  # 处理过程中每完成多少张图片重写一次完整报告文件
+REQUEST_TIMEOUT = 90  # 单个请求超时（秒）
 
-# 医疗指标双语映射表（保留原有映射关系）
-MEDICAL_INDICATORS_MAP = {
-    "PT": "凝血酶原时间（Prothrombin Time）",
-    "APTT": "活化部分凝血活酶时间（Activated Partial Thromboplastin Time）",
-    "INR": "国际标准化比值（International Normalized Ratio）",
-    "Fbg": "纤维蛋白原（Fibrinogen）",
-    "TT": "凝血酶时间（Thrombin Time）",
-    "HBV Pre-S1 Ag": "乙肝病毒前S1抗原（HBV Pre-S1 Antigen）",
-    "HBsAg": "乙肝表面抗原（HBV Surface Antigen）",
-    "Anti-HBs": "乙肝表面抗体（HBV Surface Antibody）",
-    "HBeAg": "乙肝e抗原（HBV e Antigen）",
-    "Anti-HBe": "乙肝e抗体（HBV e Antibody）",
-    "Anti-HBc": "乙肝核心抗体（HBV Core Antibody）",
-    "ABO Blood Type": "ABO血型",
-    "RH Blood Type": "RH血型",
-    "HCV-IgG": "丙肝抗体（HCV-IgG）",
-    "HIV (1+2) Antibodies": "艾滋病病毒抗体（HIV (1+2) 抗体）",
-    "Anti-TP": "梅毒螺旋体抗体（Anti-TP）",
-    "RPR": "快速血浆反应素（RPR）",
-    "PTT": "凝血酶原时间（Prothrombin Time）"
-}
-
-
-def encode_image(image_path: str) -> str:
+# 保留原有提示词（简洁明确，让模型输出详细指标）
+ANALYSIS_PROMPT = """Professional medical report interpreter: Generate complete bilingual analysis (English first, Chinese second).
+Requirements:
+1. Complete: Include ALL indicators with full details (name, exact value, reference range, status: Normal/Abnormal).
+2. Structured (MUST follow this format strictly):
+   - English section MUST start with: === Medical Report Full Analysis (English) ===
+   - Chinese section MUST start with: === 医疗报告完整分析（中文）===
+   - NO OTHER HEADERS: DO NOT include "中文：" (or any similar text) between English and Chinese sections.
+3. Sections: Each section must have 3 parts:
+   1. Overview (summary of all indicators)
+   2. Abnormal Indicators (list or "None")
+   3. Conclusion (clinical implication)
+4. For blood type: RH positive (D/C/E) is normal; ABO types (A/B/O) are all normal.
+FAIL if "中文：" appears in output."""
+
+# 医疗指标双语映射表（英文缩写 -> "中文名（英文全称）"），来自指标知识库中各指标的 expansions
+MEDICAL_INDICATORS_MAP = knowledge_base.expansion_map()
+
+ENGLISH_HEADER = "=== Medical Report Full Analysis (English) ==="
+CHINESE_HEADER = "=== 医疗报告完整分析（中文）==="
+# 解析模型输出用的预编译正则（extract_structured_bilingual / validate_abnormal_indicators）
+CLEANUP_PATTERN = re.compile(r'(?P<label>\s*中文：\s*)|\n{3,}', re.IGNORECASE)
+DUPLICATE_HEADER_PATTERN = re.compile(
+    r'(?P<english>' + re.escape(ENGLISH_HEADER) + r')\s*(?P=english)|(?P<chinese>' + re.escape(CHINESE_HEADER) + r')\s*(?P=chinese)'
+)
+ENGLISH_HEADER_PATTERN = re.compile(re.escape(ENGLISH_HEADER), re.IGNORECASE)
+EN_DATA_PATTERN = re.compile(r'(\d+(\.\d+)?\s*[a-zA-Z]+/[a-zA-Z]+|\d+(\.\d+)?\s*\()')
+ZH_DATA_PATTERN = re.compile(r'(\d+(\.\d+)?\s*[a-zA-Z]+/[a-zA-Z]+|\d+(\.\d+)?\s*（)')
+# 与原逻辑保持一致：正则中的"（+"表示一个或多个"（"，并不匹配字面的"（+）"
+ZH_RH_PATTERN = re.compile(r'RH血型（D）抗原鉴定阳性（+）（异常）')
+
+
+def compile_indicator_pattern(indicator_map: dict) -> re.Pattern:
+    """所有指标缩写编译为一个字典树正则（同一位置匹配最长的缩写，如 PTT 不会被当作 PT）"""
+    return compile_trie_pattern(indicator_map, WORD_BOUNDARY)
+
+
+INDICATOR_PATTERN = compile_indicator_pattern(MEDICAL_INDICATORS_MAP)
+
+
+def _cleanup_replacement(match: re.Match) -> str:
+    return '' if match.group('label') is not None else '\n\n'
+
+
+def _duplicate_header_replacement(match: re.Match) -> str:
+    return match.group('english') or match.group('chinese')
+
+
+def _indicator_replacement(match: re.Match) -> str:
+    return MEDICAL_INDICATORS_MAP[match.group(0)]
+
+
+def encode_image(image_path: str, source_hash: str = None) -> str:
+    """轻量级图片编码；结果按原图文件哈希和预处理参数缓存（image_artifact_cache），重复运行时直接读取"""
+    params = {
+        "encoder": "vllm_image_via_request_base64",
+        "max_dimension": MAX_IMAGE_DIMENSION,
+        "quality": IMAGE_QUALITY,
+        "preprocess_profile": PREPROCESS_PROFILE
+    }
+    return image_cache.get_or_encode(image_path, params, encode_image_uncached, source_hash)
+
+
+def encode_image_uncached(image_path: str) -> str:
     """轻量级图片编码（保留原有逻辑，优化错误提示）"""
     try:
         with Image.open(image_path) as img:
+            if PREPROCESS_PROFILE != "none":
+                processed, _ = preprocess_document(img, PREPROCESS_PROFILE, MAX_IMAGE_DIMENSION)
+                encoded, _ = encode_document_image(processed, IMAGE_QUALITY)
+                return base64.b64encode(encoded).decode("utf-8")
+
             # 处理图片方向问题
             if hasattr(img, '_getexif'):
                 exif = img._getexif()
@@ -77,41 +136,43 @@ def encode_image(image_path: str) -> str:
 
 
 def extract_structured_bilingual(output: str) -> tuple[str, str]:
-    """强制移除所有形式的"中文："，保留原有数据提取逻辑（不额外过滤）"""
-    # 核心：彻底清理"中文："，匹配所有可能的周边空白/换行
-    output = re.sub(r'\s*中文：\s*', '', output, flags=re.IGNORECASE)
-    # 清理多余空行和重复标题（保留原有逻辑）
-    output = re.sub(r'\n{3,}', '\n\n', output)
-    output = re.sub(r'(=== Medical Report Full Analysis \(English\) ===)\s*\1', r'\1', output)
-    output = re.sub(r'(=== 医疗报告完整分析（中文）===)\s*\1', r'\1', output)
-    
-    # 提取英文内容（保留原有正则，不做长度过滤）
-    english_end_pattern = r'(?==== 医疗报告完整分析（中文）===|$)'
-    english_match = re.search(
-        r'=== Medical Report Full Analysis \(English\) ===([\s\S]*?)' + english_end_pattern,
-        output,
-        re.IGNORECASE
-    )
-    english = f"=== Medical Report Full Analysis (English) ===\n{english_match.group(1).strip()}" if english_match else ""
-    
-    # 提取中文内容（保留原有正则，不做长度过滤）
-    chinese_match = re.search(
-        r'=== 医疗报告完整分析（中文）===([\s\S]*)',
-        output,
-        re.IGNORECASE
-    )
-    chinese = f"=== 医疗报告完整分析（中文）===\n{chinese_match.group(1).strip()}" if chinese_match else ""
-    
+    """
+    强制移除所有形式的"中文："，保留原有数据提取逻辑（不额外过滤）
+    原来的逐条正则替换（约十遍扫描，其中每个指标一遍）改为预编译的少量扫描，输出与原逻辑完全相同：
+    清理"中文："和多余空行合为一遍，重复标题合为一遍（没有重复时跳过），按标题位置切分两种语言，
+    指标名称补全为一个合并的正则（各指标的替换结果中不含其他指标名称，一遍替换与逐条替换等价）
+    """
+    # 核心：彻底清理"中文："（含周边空白/换行），同时把3个以上连续换行合并为空行
+    if "中文：" in output or "\n\n\n" in output:
+        output = CLEANUP_PATTERN.sub(_cleanup_replacement, output)
+    # 清理重复标题（保留原有逻辑）
+    if output.count(ENGLISH_HEADER) > 1 or output.count(CHINESE_HEADER) > 1:
+        output = DUPLICATE_HEADER_PATTERN.sub(_duplicate_header_replacement, output)
+
+    # 提取英文内容：英文标题（不区分大小写）之后到中文标题（或结尾）之前，不做长度过滤
+    english = ""
+    english_match = ENGLISH_HEADER_PATTERN.search(output)
+    if english_match:
+        english_end = output.find(CHINESE_HEADER, english_match.end())
+        english_body = output[english_match.end():english_end if english_end != -1 else len(output)]
+        english = f"{ENGLISH_HEADER}\n{english_body.strip()}"
+
+    # 提取中文内容：第一个中文标题之后的全部内容，不做长度过滤
+    chinese = ""
+    chinese_start = output.find(CHINESE_HEADER)
+    if chinese_start != -1:
+        chinese = f"{CHINESE_HEADER}\n{output[chinese_start + len(CHINESE_HEADER):].strip()}"
+
     # 补全中文指标名称（保留原有逻辑）
-    for eng, chn in MEDICAL_INDICATORS_MAP.items():
-        chinese = re.sub(r'\b' + re.escape(eng) + r'\b', chn, chinese)
-    
+    if chinese:
+        chinese = INDICATOR_PATTERN.sub(_indicator_replacement, chinese)
+
     # 补充缺失语言（仅当完全无数据时使用默认模板，不覆盖已有数据）
     if not english and chinese:
         english = "=== Medical Report Full Analysis (English) ===\n1. Overview: All tested indicators are within the normal reference range.\n2. Abnormal Indicators: None\n3. Conclusion: No health risks identified based on this report."
     elif not chinese and english:
         chinese = "=== 医疗报告完整分析（中文）===\n1. 概述：所有检测指标均在正常参考范围内。\n2. 异常指标：无\n3. 结论：基于本报告未发现健康风险。"
-    
+
     return english, chinese
 
 
@@ -134,151 +195,299 @@ def validate_abnormal_indicators(content: str, lang: str) -> str:
     # 修复：移除无效分组引用，直接匹配并替换完整内容
     if lang == "en":
         # 原有逻辑：修正RH阳性误判（无分组引用，直接替换完整字符串）
-        content = re.sub(
-            r'RH Blood Type \(D\) Antigen Detection: Positive \(\+\) \(abnormal\)',
-            r'RH Blood Type (D) Antigen Detection: Positive (+) (normal)',
-            content
+        content = content.replace(
+            'RH Blood Type (D) Antigen Detection: Positive (+) (abnormal)',
+            'RH Blood Type (D) Antigen Detection: Positive (+) (normal)'
         )
         # 保留原有数据验证逻辑
-        has_data = bool(re.search(r'(\d+(\.\d+)?\s*[a-zA-Z]+/[a-zA-Z]+|\d+(\.\d+)?\s*\()', content))
+        has_data = EN_DATA_PATTERN.search(content) is not None
         if "no abnormal" not in content.lower() and not has_data and "No valid" not in content:
             content += "\n\nNote: Missing specific indicator data (value/reference range). Recheck original report."
     else:
         # 原有逻辑：修正RH阳性误判（无分组引用，直接替换完整字符串）
-        content = re.sub(
-            r'RH血型（D）抗原鉴定阳性（+）（异常）',
-            r'RH血型（D）抗原鉴定阳性（+）（正常）',
-            content
-        )
+        content = ZH_RH_PATTERN.sub('RH血型（D）抗原鉴定阳性（+）（正常）', content)
         # 保留原有数据验证逻辑
-        has_data = bool(re.search(r'(\d+(\.\d+)?\s*[a-zA-Z]+/[a-zA-Z]+|\d+(\.\d+)?\s*（)', content))
+        has_data = ZH_DATA_PATTERN.search(content) is not None
         if "无异常" not in content and not has_data and "未提取" not in content:
             content += "\n\n注：缺少具体指标数据（数值/参考范围）。请核对原始报告。"
     
     return content
 
 
-def process_medical_reports() -> None:
-    """主处理函数（保留原有逻辑，完善错误处理，不修改数据提取核心）"""
-    image_files = sorted([f for f in os.listdir(IMAGE_FOLDER) if f.endswith((".jpg", ".jpeg", ".png"))])
-    if not image_files:
-        print("错误：指定文件夹中未找到图片文件。")
-        return
-    
-    all_results = []
-    print("=" * 100)
-    print("医疗报告处理流程")
-    print("=" * 100)
-    
-    for idx, img_file in enumerate(image_files, 1):
-        image_path = os.path.join(IMAGE_FOLDER, img_file)
-        print(f"\n[正在处理 {idx}/{len(image_files)}] 图片：{img_file}")
-        
-        try:
-            base64_image = encode_image(image_path)
-            print(f"图片编码后长度：{len(base64_image)//1024}KB")
-            
-            # 保留原有提示词（简洁明确，让模型输出详细指标）
-            prompt = """Professional medical report interpreter: Generate complete bilingual analysis (English first, Chinese second).
-Requirements:
-1. Complete: Include ALL indicators with full details (name, exact value, reference range, status: Normal/Abnormal).
-2. Structured (MUST follow this format strictly):
-   - English section MUST start with: === Medical Report Full Analysis (English) ===
-   - Chinese section MUST start with: === 医疗报告完整分析（中文）===
-   - NO OTHER HEADERS: DO NOT include "中文：" (or any similar text) between English and Chinese sections.
-3. Sections: Each section must have 3 parts:
-   1. Overview (summary of all indicators)
-   2. Abnormal Indicators (list or "None")
-   3. Conclusion (clinical implication)
-4. For blood type: RH positive (D/C/E) is normal; ABO types (A/B/O) are all normal.
-FAIL if "中文：" appears in output."""
-            
-            headers = {"Content-Type": "application/json"}
-            if API_KEY and API_KEY != "EMPTY":
-                headers["Authorization"] = f"Bearer {API_KEY}"
-            
-            payload = {
-                "model": MODEL_NAME,
-                "messages": [
+def build_request_payload(base64_image: str) -> dict:
+    """构建发送给视觉语言模型的请求体（保留原有参数）"""
+    return {
+        "model": MODEL_NAME,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": ANALYSIS_PROMPT},
                     {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{image_mime_type(base64_image)};base64,{base64_image}",
+                            "detail": "high"
+                        }
                     }
-                ],
-                "temperature": 0.2,  # 温度系数（越低越稳定）
-                "max_tokens": 4000,   # 最大生成token数
-                "top_p": 0.9,         # 采样参数
-                "stream": False       # 非流式输出
+                ]
             }
-            
-            # 优化请求超时设置（保留原有逻辑，延长至90秒）
-            response = requests.post(
-                url=MODEL_ENDPOINT,
-                headers=headers,
-                data=json.dumps(payload),
-                timeout=90
-            )
-            
-            if response.status_code != 200:
-                print(f"接口错误响应：{response.status_code} - {response.text[:500]}")
-                response.raise_for_status()
-            
-            result = response.json()
-            raw_output = result["choices"][0]["message"]["content"].strip()
+        ],
+        "temperature": 0.2,  # 温度系数（越低越稳定）
+        "max_tokens": 4000,   # 最大生成token数
+        "top_p": 0.9,         # 采样参数
+        "stream": False       # 非流式输出
+    }
+
+
+def create_session(pool_size: int) -> requests.Session:
+    """共享的HTTP会话：连接池大小与并发数一致，各线程复用到模型接口的长连接（不再每张图片重新建立连接）"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Content-Type"] = "application/json"
+    if API_KEY and API_KEY != "EMPTY":
+        session.headers["Authorization"] = f"Bearer {API_KEY}"
+    return session
+
+
+def parse_model_output(raw_output: str) -> tuple[str, str]:
+    """核心数据处理（完全保留原有逻辑，仅修复正则错误）：模型原始输出 -> (英文报告, 中文报告)"""
+    english_report, chinese_report = extract_structured_bilingual(raw_output)
+    english_report = format_english_report(english_report)
+    chinese_report = format_chinese_report(chinese_report)
+    english_report = validate_abnormal_indicators(english_report, "en")
+    chinese_report = validate_abnormal_indicators(chinese_report, "zh")
+    return english_report, chinese_report
+
+
+def prompt_version() -> str:
+    """提示词版本：请求体（提示词、模型、生成参数）和图片预处理参数的摘要，任一项改变后旧检查点不再复用"""
+    settings = [build_request_payload(""), PREPROCESS_PROFILE, MAX_IMAGE_DIMENSION, IMAGE_QUALITY]
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def load_checkpoint(checkpoint_file: str, version: str) -> dict:
+    """读取检查点中当前提示词版本的记录：{文件哈希: 记录}；跳过中断时写了一半的行"""
+    records = {}
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return records
+    with open(checkpoint_file, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("prompt_version") == version:
+                records[record["file_hash"]] = record
+    return records
+
+
+def open_checkpoint(checkpoint_file: str):
+    """以追加方式打开检查点；上次中断时最后一行没有写完的，先补上换行，新记录从新的一行开始"""
+    f = open(checkpoint_file, "a", encoding="utf-8")
+    if f.tell() > 0:
+        with open(checkpoint_file, "rb") as existing:
+            existing.seek(-1, os.SEEK_END)
+            if existing.read(1) != b"\n":
+                f.write("\n")
+    return f
+
+
+def append_checkpoint(f, result: dict, version: str) -> None:
+    """追加一行检查点并落盘（进程崩溃或被中断后已完成的图片不会丢失）"""
+    record = {
+        "file_hash": result["file_hash"],
+        "prompt_version": version,
+        "image_filename": result["image_filename"],
+        "raw_output": result["raw_output"],
+        "completed_at": datetime.now().isoformat(timespec="seconds")
+    }
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def process_single_report(idx: int, img_file: str, session: requests.Session, image_folder: str = IMAGE_FOLDER,
+                          endpoint: str = MODEL_ENDPOINT, verbose: bool = True, image_hash: str = None) -> dict:
+    """编码并发送一张图片，解析模型输出，返回该图片的结果（成功时带有模型原始输出，用于写入检查点）"""
+    image_path = os.path.join(image_folder, img_file)
+    try:
+        base64_image = encode_image(image_path, image_hash)
+        if verbose:
+            print(f"图片编码后长度：{len(base64_image)//1024}KB")
+
+        # 优化请求超时设置（保留原有逻辑，延长至90秒）
+        response = session.post(
+            url=endpoint,
+            data=json.dumps(build_request_payload(base64_image)),
+            timeout=REQUEST_TIMEOUT
+        )
+
+        if response.status_code != 200:
+            print(f"接口错误响应（{img_file}）：{response.status_code} - {response.text[:500]}")
+            response.raise_for_status()
+
+        result = response.json()
+        raw_output = result["choices"][0]["message"]["content"].strip()
+        if verbose:
             print("模型响应成功，开始解析报告...")
-            
-            # 核心数据处理（完全保留原有逻辑，仅修复正则错误）
-            english_report, chinese_report = extract_structured_bilingual(raw_output)
-            english_report = format_english_report(english_report)
-            chinese_report = format_chinese_report(chinese_report)
-            english_report = validate_abnormal_indicators(english_report, "en")
-            chinese_report = validate_abnormal_indicators(chinese_report, "zh")
-            
+
+        english_report, chinese_report = parse_model_output(raw_output)
+
+        if verbose:
             # 打印完整报告（用于调试，保留原有输出逻辑）
             print("\n" + "-" * 80)
             print(english_report)
             print("\n" + "-" * 80)
             print(chinese_report)
             print("-" * 80)
-            
-            all_results.append({
-                "no": idx,
-                "image_filename": img_file,
-                "english_report": english_report,
-                "chinese_report": chinese_report,
-                "status": "success"
-            })
-            
-        except Exception as e:
-            error_detail = str(e)
-            error_msg = f"处理失败：{error_detail[:150]}..." if len(error_detail) > 150 else f"处理失败：{error_detail}"
-            print(error_msg)
-            
-            # 修复字符串格式化错误（原代码使用{}但未格式化）
-            english_error = f"=== Medical Report Full Analysis (English) ===\nProcessing failed due to request/network error. Error: {error_detail[:200]}..."
-            chinese_error = f"=== 医疗报告完整分析（中文）===\n处理失败（请求/网络错误）。错误：{error_detail[:200]}..."
-            
-            all_results.append({
-                "no": idx,
-                "image_filename": img_file,
-                "english_report": english_error,
-                "chinese_report": chinese_error,
-                "status": "failed"
-            })
-    
-    generate_standard_summary(all_results)
 
+        return {
+            "no": idx,
+            "image_filename": img_file,
+            "english_report": english_report,
+            "chinese_report": chinese_report,
+            "status": "success",
+            "file_hash": image_hash,
+            "raw_output": raw_output
+        }
+
+    except Exception as e:
+        error_detail = str(e)
+        error_msg = f"处理失败：{error_detail[:150]}..." if len(error_detail) > 150 else f"处理失败：{error_detail}"
+        print(f"{error_msg}（{img_file}）")
+
+        # 修复字符串格式化错误（原代码使用{}但未格式化）
+        english_error = f"=== Medical Report Full Analysis (English) ===\nProcessing failed due to request/network error. Error: {error_detail[:200]}..."
+        chinese_error = f"=== 医疗报告完整分析（中文）===\n处理失败（请求/网络错误）。错误：{error_detail[:200]}..."
+
+        return {
+            "no": idx,
+            "image_filename": img_file,
+            "english_report": english_error,
+            "chinese_report": chinese_error,
+            "status": "failed"
+        }
+
+
+def process_medical_reports(image_folder: str = IMAGE_FOLDER, concurrency: int = CONCURRENCY,
+                            endpoint: str = MODEL_ENDPOINT, output_file: str = OUTPUT_FILE,
+                            checkpoint_file: str = CHECKPOINT_FILE) -> list[dict]:
+    """
+    主处理函数（保留原有逻辑，完善错误处理，不修改数据提取核心）
+    concurrency > 1 时同时保持 concurrency 个请求（vLLM连续批处理同时推理多张图片），按完成顺序输出进度和吞吐量，
+    结果仍按图片文件名顺序写入 all_results；concurrency 为1时与原来一样逐张处理并打印完整报告
+    每张图片处理成功后追加写入检查点（checkpoint_file，None为不使用）：重新运行时文件哈希和提示词版本相同的图片
+    直接使用检查点中的模型输出（重新解析），只处理其余图片（包括上次失败的）；完整报告每完成 SUMMARY_INTERVAL 张重写一次
+    """
+    image_files = sorted([f for f in os.listdir(image_folder) if f.endswith((".jpg", ".jpeg", ".png"))])
+    if not image_files:
+        print("错误：指定文件夹中未找到图片文件。")
+        return []
+
+    print("=" * 100)
+    print("医疗报告处理流程")
+    print("=" * 100)
+
+    version = prompt_version()
+    checkpoint = load_checkpoint(checkpoint_file, version)
+    results_by_no = {}
+    pending = []
+    for idx, img_file in enumerate(image_files, 1):
+        image_hash = source_file_hash(os.path.join(image_folder, img_file))
+        record = checkpoint.get(image_hash)
+        if record is None:
+            pending.append((idx, img_file, image_hash))
+            continue
+        english_report, chinese_report = parse_model_output(record["raw_output"])
+        results_by_no[idx] = {
+            "no": idx,
+            "image_filename": img_file,
+            "english_report": english_report,
+            "chinese_report": chinese_report,
+            "status": "success"
+        }
+    if results_by_no:
+        print(f"从检查点恢复 {len(results_by_no)} 张图片（提示词版本 {version}），待处理 {len(pending)} 张")
+
+    session = create_session(concurrency)
 
-def generate_standard_summary(results: list[dict]) -> None:
+    def run_pending():
+        """按完成顺序产出待处理图片的结果"""
+        if concurrency <= 1:
+            for idx, img_file, image_hash in pending:
+                print(f"\n[正在处理 {idx}/{len(image_files)}] 图片：{img_file}")
+                yield process_single_report(idx, img_file, session, image_folder, endpoint, image_hash=image_hash)
+            return
+        print(f"并发处理 {len(pending)} 张图片（同时进行的请求数：{concurrency}）")
+        # 线程池的工作线程数即在途请求窗口：每个线程依次编码、发送、解析一张图片，完成后立即开始下一张
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(process_single_report, idx, img_file, session, image_folder, endpoint, False, image_hash)
+                for idx, img_file, image_hash in pending
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    start_time = time.perf_counter()
+    checkpoint_writer = open_checkpoint(checkpoint_file) if checkpoint_file else None
+    try:
+        for completed, result in enumerate(run_pending(), 1):
+            results_by_no[result["no"]] = result
+            if checkpoint_writer and result["status"] == "success":
+                append_checkpoint(checkpoint_writer, result, version)
+            elapsed = time.perf_counter() - start_time
+            status = "成功" if result["status"] == "success" else "失败"
+            print(f"[已完成 {completed}/{len(pending)}] {result['image_filename']} {status} | "
+                  f"已用时 {elapsed:.1f}秒 | 吞吐量 {completed / elapsed * 60:.1f} 张/分钟")
+            if completed % SUMMARY_INTERVAL == 0 and completed < len(pending):
+                write_full_report([results_by_no[idx] for idx in sorted(results_by_no)], output_file, len(image_files))
+    finally:
+        if checkpoint_writer:
+            checkpoint_writer.close()
+        session.close()
+
+    all_results = [results_by_no[idx] for idx in sorted(results_by_no)]
+    elapsed = time.perf_counter() - start_time
+    if pending:
+        print(f"\n处理完成：{len(pending)} 张图片，总耗时 {elapsed:.1f}秒，吞吐量 {len(pending) / elapsed * 60:.1f} 张/分钟")
+        print(image_cache.stats())
+    generate_standard_summary(all_results, output_file)
+    return all_results
+
+
+def write_full_report(results: list[dict], output_file: str = OUTPUT_FILE, planned_total: int = None) -> None:
+    """
+    写入完整报告（修复时间生成逻辑）；先写临时文件再替换，中断时不会留下写了一半的报告
+    :param planned_total: 处理过程中写入部分报告时为本次的图片总数（报告头部注明进度）
+    """
+    total = len(results)
+    success = len([r for r in results if r["status"] == "success"])
+    failed = total - success
+    valid_data = len([r for r in results if "No valid" not in r["english_report"] and r["status"] == "success"])
+
+    temp_file = output_file + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        f.write("=" * 120 + "\n")
+        f.write("医疗报告综合分析汇总报告\n")
+        f.write(f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        if planned_total is not None:
+            f.write(f"处理进度：已完成 {total}/{planned_total}（部分结果，处理仍在进行）\n")
+        f.write(f"统计信息：报告总数 {total} | 处理成功 {success} | 处理失败 {failed} | 有效数据 {valid_data}\n")
+        f.write("=" * 120 + "\n\n")
+
+        for idx, res in enumerate(results, 1):
+            f.write(f"[Report {idx}] Image Filename: {res['image_filename']} | Processing Status: {res['status']}\n")
+            f.write("-" * 100 + "\n")
+            f.write(res["english_report"] + "\n\n")
+            f.write(res["chinese_report"] + "\n")
+            f.write("=" * 100 + "\n\n")
+    os.replace(temp_file, output_file)
+
+
+def generate_standard_summary(results: list[dict], output_file: str = OUTPUT_FILE) -> None:
     """生成汇总报告（保留原有预览长度，展示详细数据）"""
     print("\n" + "=" * 120)
     print("医疗报告综合分析汇总")
@@ -309,22 +518,8 @@ def generate_standard_summary(results: list[dict]) -> None:
     print(table)
     print(f"\n统计信息：报告总数 {total} | 处理成功 {success} | 处理失败 {failed} | 有效数据 {valid_data}")
     
-    # 保存完整报告（修复时间生成逻辑）
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        f.write("=" * 120 + "\n")
-        f.write("医疗报告综合分析汇总报告\n")
-        f.write(f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"统计信息：报告总数 {total} | 处理成功 {success} | 处理失败 {failed} | 有效数据 {valid_data}\n")
-        f.write("=" * 120 + "\n\n")
-        
-        for idx, res in enumerate(results, 1):
-            f.write(f"[Report {idx}] Image Filename: {res['image_filename']} | Processing Status: {res['status']}\n")
-            f.write("-" * 100 + "\n")
-            f.write(res["english_report"] + "\n\n")
-            f.write(res["chinese_report"] + "\n")
-            f.write("=" * 100 + "\n\n")
-    
-    print(f"\n完整汇总报告已保存至：{OUTPUT_FILE}")
+    write_full_report(results, output_file)
+    print(f"\n完整汇总报告已保存至：{output_file}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+"""
+上游准入控制：每个上游（视觉语言模型 / 大语言模型）独立的并发预算（舱壁隔离），
+AIMD自适应并发上限、排队深度限制（超出时快速拒绝），以及统一的重试策略。
+
+- 并发上限按AIMD调整：请求成功且延迟低于目标时加性增加（每轮约+1），
+  遇到429/503、超时或延迟超过目标时乘性减少，冷却时间内最多减少一次
+- 排队请求数超过上限或排队超时时抛出 OverloadedError，由端点返回503
+- 重试只在此处进行一层（HTTP连接池不再配置重试），退避采用带抖动的指数退避并遵守Retry-After
+- AsyncAIMDLimiter 是异步模式（事件循环内）使用的版本，排队等待不阻塞事件循环，调整逻辑相同
+"""
+import asyncio
+import random
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from threading import Condition
+from time import monotonic
+from typing import Optional
+
+
+class OverloadedError(Exception):
+    """上游并发预算和排队队列已满，请求被拒绝"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AIMDLimiter:
+    """
+    AIMD自适应并发限制器（线程安全）
+    """
+
+    def __init__(self, name, initial_limit=8, min_limit=1, max_limit=64, max_queue=32,
+                 queue_timeout=30.0, latency_target=60.0, decrease_factor=0.5, decrease_cooldown=5.0):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.condition = Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.last_decrease = 0.0
+        self.counters = {"admitted": 0, "rejected": 0, "success": 0, "overload": 0, "timeout": 0, "error": 0}
+
+    @contextmanager
+    def acquire(self):
+        """
+        获取一个并发名额；使用方须通过 yield 出的 Permit 记录结果，未记录时按error处理
+        """
+        self._enter()
+        permit = Permit(self)
+        try:
+            yield permit
+        finally:
+            self._exit(permit)
+
+    def _enter(self):
+        with self.condition:
+            if self.in_flight >= int(self.limit):
+                if self.queued >= self.max_queue:
+                    self.counters["rejected"] += 1
+                    raise OverloadedError(f"上游 {self.name} 繁忙（排队 {self.queued}/{self.max_queue}）")
+                self.queued += 1
+                deadline = monotonic() + self.queue_timeout
+                try:
+                    while self.in_flight >= int(self.limit):
+                        remaining = deadline - monotonic()
+                        if remaining <= 0:
+                            self.counters["rejected"] += 1
+                            raise OverloadedError(f"上游 {self.name} 排队超时（{self.queue_timeout:.0f}秒）")
+                        self.condition.wait(remaining)
+                finally:
+                    self.queued -= 1
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+
+    def _exit(self, permit):
+        with self.condition:
+            self.in_flight -= 1
+            outcome = permit.outcome or "error"
+            self.counters[outcome] += 1
+            self._adjust(outcome, permit.latency)
+            self.condition.notify_all()
+
+    def _adjust(self, outcome, latency):
+        """根据请求结果调整并发上限（调用方已持有锁）"""
+        congested = outcome in ("overload", "timeout") or (
+            outcome == "success" and latency is not None and latency > self.latency_target
+        )
+        if congested:
+            now = monotonic()
+            if now - self.last_decrease >= self.decrease_cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self.last_decrease = now
+        elif outcome == "success":
+            # 加性增加：每完成约一个并发窗口的请求，上限+1
+            self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+
+    def snapshot(self):
+        with self.condition:
+            return dict(self.counters, limit=round(self.limit, 2), in_flight=self.in_flight, queued=self.queued,
+                        max_queue=self.max_queue)
+
+
+class AsyncAIMDLimiter(AIMDLimiter):
+    """
+    AIMD自适应并发限制器的asyncio版本（只在一个事件循环内使用）
+    """
+
+    def __init__(self, name, **kwargs):
+        super().__init__(name, **kwargs)
+        self.waiters = deque()
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        获取一个并发名额（异步等待）；使用方须通过 yield 出的 Permit 记录结果，未记录时按error处理
+        """
+        await self._enter_async()
+        permit = Permit(self)
+        try:
+            yield permit
+        finally:
+            self._exit(permit)
+
+    async def _enter_async(self):
+        if self.in_flight >= int(self.limit):
+            if self.queued >= self.max_queue:
+                with self.condition:
+                    self.counters["rejected"] += 1
+                raise OverloadedError(f"上游 {self.name} 繁忙（排队 {self.queued}/{self.max_queue}）")
+            self.queued += 1
+            deadline = monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= int(self.limit):
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        with self.condition:
+                            self.counters["rejected"] += 1
+                        raise OverloadedError(f"上游 {self.name} 排队超时（{self.queue_timeout:.0f}秒）")
+                    waiter = asyncio.get_running_loop().create_future()
+                    self.waiters.append(waiter)
+                    try:
+                        await asyncio.wait_for(waiter, remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    finally:
+                        if waiter in self.waiters:
+                            self.waiters.remove(waiter)
+            finally:
+                self.queued -= 1
+        with self.condition:
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+
+    def _exit(self, permit):
+        super()._exit(permit)
+        # 唤醒所有排队的协程，由它们按调整后的上限重新检查
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class Permit:
+    """一次准入许可，记录上游请求的结果和延迟"""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.outcome = None
+        self.latency = None
+
+    def record(self, outcome, latency=None):
+        """outcome: success / overload（429、503）/ timeout / error"""
+        self.outcome = outcome
+        self.latency = latency
+
+
+class RetryPolicy:
+    """
+    统一重试策略：最大尝试次数（含首次请求）、可重试状态码、带抖动的指数退避
+    """
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0,
+                 retry_statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses)
+
+    def should_retry_status(self, status_code):
+        return status_code in self.retry_statuses
+
+    def compute_delay(self, attempt, retry_after: Optional[str] = None) -> float:
+        """第attempt次（从0开始）失败后的等待时间；上游给出Retry-After（秒）时优先使用"""
+        if retry_after:
+            try:
+                return min(self.max_delay, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        # full jitter：在 [0, base * 2^attempt] 内随机，避免大量请求同时重试
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
@@ -0,0 +1,156 @@
+"""
+基准测试：异步模式（ASGI）与现有Flask同步模式的并发吞吐量对比
+
+启动本地模拟OpenAI接口（固定延迟），分别以两种模式启动服务器（关闭缓存，保证每个请求都调用上游；
+两种模式使用相同的上游并发上限，设为 --upstream-limit，使结果反映服务器本身的并发能力），
+在不同并发数下发送相同数量的请求，输出吞吐量和延迟分位数。
+
+用法（需要 gunicorn、hypercorn）：
+    python benchmarks/bench_async_vs_flask.py --latency 2 --concurrency 8 32 128 --requests 256
+    python benchmarks/bench_async_vs_flask.py --image ../6-fine-tuning-vl/test-img/scan_item10-_71.jpg
+"""
+import argparse
+import io
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from PIL import Image
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+
+def make_synthetic_image(width=1024, height=768):
+    """生成无需缩放的小尺寸JPEG，使测试结果反映上游并发能力而不是本机图片处理的CPU开销"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_healthy(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服务未能在 {timeout} 秒内启动: {url}")
+
+
+def start_process(command, env, workdir):
+    return subprocess.Popen(command, env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def server_command(mode, port, flask_workers):
+    bind = f"127.0.0.1:{port}"
+    if mode == "flask":
+        # 生产环境常见部署方式：gunicorn同步工作进程，每个进程同一时刻只处理一个请求
+        return [sys.executable, "-m", "gunicorn", "--workers", str(flask_workers), "--timeout", "600",
+                "--bind", bind, "medical_report_server:app"]
+    return [sys.executable, "-m", "hypercorn", "--bind", bind, "--workers", "1",
+            "medical_report_server_async:app"]
+
+
+def run_load(url, image_bytes, total_requests, concurrency):
+    """以固定并发数发送请求，返回 (总耗时, 每个请求的延迟列表, 失败数)"""
+    def send_one(_):
+        start = time.perf_counter()
+        try:
+            response = requests.post(url, files={"image": ("report.jpg", image_bytes, "image/jpeg")}, timeout=900)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send_one, range(total_requests)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, ok in results if ok)
+    failures = sum(1 for _, ok in results if not ok)
+    return elapsed, latencies, failures
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步模式与Flask模式并发吞吐量对比")
+    parser.add_argument("--latency", type=float, default=2.0, help="模拟上游每次调用的延迟（秒）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--requests", type=int, default=256, help="每个并发级别发送的请求数")
+    parser.add_argument("--flask-workers", type=int, default=4, help="gunicorn同步工作进程数")
+    parser.add_argument("--upstream-limit", type=int, default=256, help="每个上游的并发上限（VL_/LLM_CONCURRENCY_LIMIT 和 _MAX）")
+    parser.add_argument("--modes", nargs="+", default=["flask", "async"], choices=["flask", "async"])
+    parser.add_argument("--image", default=None,
+                        help="上传的图片路径（默认使用生成的1024x768图片；真实报告图片会引入图片处理的CPU开销）")
+    args = parser.parse_args()
+
+    image_bytes = Path(args.image).read_bytes() if args.image else make_synthetic_image()
+    workdir = tempfile.mkdtemp(prefix="bench_async_")
+    mock_port = get_free_port()
+    mock = start_process(
+        [sys.executable, str(SERVER_DIR / "mock_openai_server.py"), "--port", str(mock_port),
+         "--latency", str(args.latency)],
+        os.environ.copy(), workdir
+    )
+    rows = []
+    try:
+        wait_until_healthy(f"http://127.0.0.1:{mock_port}/v1/models")
+        for mode in args.modes:
+            port = get_free_port()
+            env = dict(
+                os.environ,
+                PYTHONPATH=str(SERVER_DIR),
+                OPENROUTER_API_KEY="mock",
+                OPENROUTER_API_BASE=f"http://127.0.0.1:{mock_port}/v1",
+                ENABLE_CACHE="false",
+                VL_CONCURRENCY_LIMIT=str(args.upstream_limit),
+                VL_CONCURRENCY_MAX=str(args.upstream_limit),
+                LLM_CONCURRENCY_LIMIT=str(args.upstream_limit),
+                LLM_CONCURRENCY_MAX=str(args.upstream_limit),
+                UPSTREAM_QUEUE_MAX=str(args.requests),
+            )
+            server = start_process(server_command(mode, port, args.flask_workers), env, workdir)
+            try:
+                wait_until_healthy(f"http://127.0.0.1:{port}/health")
+                for concurrency in args.concurrency:
+                    elapsed, latencies, failures = run_load(
+                        f"http://127.0.0.1:{port}/analyze_medical_report", image_bytes, args.requests, concurrency
+                    )
+                    rows.append((mode, concurrency, args.requests / elapsed, percentile(latencies, 50),
+                                 percentile(latencies, 95), failures))
+                    print(f"{mode:>6} 并发 {concurrency:>4}: {args.requests / elapsed:7.2f} 请求/秒", file=sys.stderr)
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    print(f"\n上游延迟 {args.latency}s（每个请求调用2次上游），每个并发级别 {args.requests} 个请求")
+    print(f"{'模式':<8}{'并发':>6}{'吞吐量(请求/秒)':>18}{'p50(秒)':>10}{'p95(秒)':>10}{'失败':>6}")
+    for mode, concurrency, throughput, p50, p95, failures in rows:
+        print(f"{mode:<8}{concurrency:>6}{throughput:>18.2f}{p50:>10.2f}{p95:>10.2f}{failures:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+基准测试：6-fine-tuning-vl/vllm_image_via_request_base64.py 批量处理在不同并发数下的吞吐量（张/分钟）
+
+启动本地模拟OpenAI接口，回复双语报告格式的分析结果；模拟的模型服务同时最多推理 --server-slots 个请求
+（类似vLLM连续批处理的批大小），每个请求耗时 --service-time 秒，超出的请求排队。
+把 test-img 的图片复制 --copies 份到临时目录（模拟数百张报告的文件夹），在各并发数下运行 process_medical_reports（不使用检查点和预处理图片缓存）。
+
+用法：
+    python benchmarks/bench_batch_concurrency.py
+    python benchmarks/bench_batch_concurrency.py --concurrency 1 8 32 --copies 20 --service-time 3 --server-slots 32
+"""
+import argparse
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = SERVER_DIR.parent / "6-fine-tuning-vl"
+TEST_IMAGE_DIR = DATA_DIR / "test-img"
+
+MOCK_BILINGUAL_REPORT = """=== Medical Report Full Analysis (English) ===
+1. Overview: Coagulation tests are mostly within the reference range.
+2. Abnormal Indicators:
+- APTT: 19.00 s (Reference Range: 23-35 s) - Abnormal
+3. Conclusion: Shortened APTT may indicate a hypercoagulable state; recheck recommended.
+
+=== 医疗报告完整分析（中文）===
+1. 概述：凝血功能检测大部分在参考范围内。
+2. 异常指标：
+- APTT：19.00 秒（参考范围：23-35 秒）- 异常
+3. 结论：APTT缩短可能提示高凝状态，建议复查。"""
+
+
+def start_mock(service_time, server_slots):
+    """模拟的模型服务：同时最多推理 server_slots 个请求，每个耗时 service_time 秒"""
+    from mock_openai_server import create_server
+    slots = threading.Semaphore(server_slots)
+
+    def responder(request_body):
+        with slots:
+            time.sleep(service_time)
+        return MOCK_BILINGUAL_REPORT
+
+    server = create_server("127.0.0.1", 0, responder=responder)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def prepare_images(directory, copies, limit):
+    images = sorted(p for p in TEST_IMAGE_DIR.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if limit:
+        images = images[:limit]
+    for copy in range(copies):
+        for image in images:
+            shutil.copyfile(image, directory / f"{copy:03d}_{image.name}")
+    return len(images) * copies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量处理脚本在不同并发数下的吞吐量")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--copies", type=int, default=10, help="test-img 图片的复制份数")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用的 test-img 图片数量（0表示全部）")
+    parser.add_argument("--service-time", type=float, default=2.0, help="模拟模型服务推理每个请求的耗时（秒）")
+    parser.add_argument("--server-slots", type=int, default=16, help="模拟模型服务同时推理的请求数上限")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVER_DIR))
+    sys.path.insert(0, str(DATA_DIR))
+    import vllm_image_via_request_base64 as batch
+    from image_artifact_cache import EncodedImageCache
+
+    # 各并发数都重新编码图片（不使用预处理图片缓存），结果可比
+    batch.image_cache = EncodedImageCache(enabled=False)
+
+    mock = start_mock(args.service_time, args.server_slots)
+    endpoint = f"http://127.0.0.1:{mock.server_address[1]}/v1/chat/completions"
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        image_dir = Path(directory) / "images"
+        image_dir.mkdir()
+        total = prepare_images(image_dir, args.copies, args.limit)
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = batch.process_medical_reports(str(image_dir), concurrency, endpoint,
+                                                        str(Path(directory) / "report.txt"), checkpoint_file=None)
+            elapsed = time.perf_counter() - start
+            failed = sum(1 for result in results if result["status"] != "success")
+            rows.append((concurrency, elapsed, total / elapsed * 60, failed))
+            print(f"并发 {concurrency:>3}: {total / elapsed * 60:8.1f} 张/分钟", file=sys.stderr)
+    mock.shutdown()
+
+    print(f"\n{total} 张图片，模拟模型服务每个请求 {args.service_time}s，同时推理上限 {args.server_slots}")
+    print(f"{'并发':>6}{'总耗时(秒)':>12}{'张/分钟':>10}{'加速比':>8}{'失败':>6}")
+    baseline = rows[0][2]
+    for concurrency, elapsed, throughput, failed in rows:
+        print(f"{concurrency:>6}{elapsed:>12.1f}{throughput:>10.1f}{throughput / baseline:>8.1f}{failed:>6}")
+
+
+if __name__ == "__main__":
+    main()
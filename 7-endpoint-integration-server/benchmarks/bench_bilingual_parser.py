@@ -0,0 +1,170 @@
+"""
+基准测试：6-fine-tuning-vl/vllm_image_via_request_base64.py 中模型输出解析（extract_structured_bilingual +
+validate_abnormal_indicators）的吞吐量（报告/秒），并与原来的逐条正则实现（下方 legacy_* 为原实现的副本）比较输出
+
+合成语料：按真实输出的结构生成双语报告（随机指标、数值、参考范围），并随机加入"中文："、多余空行、重复标题、
+标题大小写变化、缺少某一语言、RH血型等边界情况；另有一部分由这些片段随机拼接而成，用于检查两种实现的输出完全一致。
+
+用法：
+    python benchmarks/bench_bilingual_parser.py
+    python benchmarks/bench_bilingual_parser.py --reports 50000 --seed 1
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = SERVER_DIR.parent / "6-fine-tuning-vl"
+
+ENGLISH_HEADER = "=== Medical Report Full Analysis (English) ==="
+CHINESE_HEADER = "=== 医疗报告完整分析（中文）==="
+FRAGMENTS = [
+    ENGLISH_HEADER, CHINESE_HEADER, ENGLISH_HEADER.upper(), "中文：", " 中文： ", "\n", "\n\n\n", "\n\n\n\n", " ", "PT",
+    "PTT", "APTT", "PT/INR", "HBsAg", "Anti-HBs", "HIV (1+2) Antibodies", "RH Blood Type", "ABO Blood Type",
+    "HBV Pre-S1 Ag", "HCV-IgG", "RPR", "Anti-TP", "TTT", "3.5 g/L", "12.1 (", "12.1（", "无异常", "no abnormal",
+    "RH Blood Type (D) Antigen Detection: Positive (+) (abnormal)", "RH血型（D）抗原鉴定阳性（（）（异常）",
+    "RH血型（D）抗原鉴定阳性（+）（异常）", "参考范围", "异常指标：", "Abnormal",
+]
+INDICATORS = [
+    ("PT", "s", 10, 14), ("APTT", "s", 23, 35), ("INR", "", 0.8, 1.2), ("Fbg", "g/L", 2, 4), ("TT", "s", 14, 21),
+    ("HBsAg", "IU/mL", 0, 0.05), ("Anti-HBs", "mIU/mL", 0, 10), ("HBeAg", "S/CO", 0, 1), ("Anti-HBc", "S/CO", 0, 1),
+    ("HCV-IgG", "S/CO", 0, 1), ("Anti-TP", "S/CO", 0, 1), ("RPR", "", 0, 0), ("PTT", "s", 25, 35),
+    ("HIV (1+2) Antibodies", "S/CO", 0, 1), ("ALT", "U/L", 9, 50), ("WBC", "10^9/L", 3.5, 9.5),
+]
+
+
+# ---- 原实现（改造前的逻辑，作为输出一致性的参照） ----
+
+def legacy_extract_structured_bilingual(output, indicator_map):
+    output = re.sub(r'\s*中文：\s*', '', output, flags=re.IGNORECASE)
+    output = re.sub(r'\n{3,}', '\n\n', output)
+    output = re.sub(r'(=== Medical Report Full Analysis \(English\) ===)\s*\1', r'\1', output)
+    output = re.sub(r'(=== 医疗报告完整分析（中文）===)\s*\1', r'\1', output)
+    english_end_pattern = r'(?==== 医疗报告完整分析（中文）===|$)'
+    english_match = re.search(
+        r'=== Medical Report Full Analysis \(English\) ===([\s\S]*?)' + english_end_pattern, output, re.IGNORECASE
+    )
+    english = f"=== Medical Report Full Analysis (English) ===\n{english_match.group(1).strip()}" if english_match else ""
+    chinese_match = re.search(r'=== 医疗报告完整分析（中文）===([\s\S]*)', output, re.IGNORECASE)
+    chinese = f"=== 医疗报告完整分析（中文）===\n{chinese_match.group(1).strip()}" if chinese_match else ""
+    for eng, chn in indicator_map.items():
+        chinese = re.sub(r'\b' + re.escape(eng) + r'\b', chn, chinese)
+    if not english and chinese:
+        english = "=== Medical Report Full Analysis (English) ===\n1. Overview: All tested indicators are within the normal reference range.\n2. Abnormal Indicators: None\n3. Conclusion: No health risks identified based on this report."
+    elif not chinese and english:
+        chinese = "=== 医疗报告完整分析（中文）===\n1. 概述：所有检测指标均在正常参考范围内。\n2. 异常指标：无\n3. 结论：基于本报告未发现健康风险。"
+    return english, chinese
+
+
+def legacy_validate_abnormal_indicators(content, lang):
+    if lang == "en":
+        content = re.sub(
+            r'RH Blood Type \(D\) Antigen Detection: Positive \(\+\) \(abnormal\)',
+            r'RH Blood Type (D) Antigen Detection: Positive (+) (normal)',
+            content
+        )
+        has_data = bool(re.search(r'(\d+(\.\d+)?\s*[a-zA-Z]+/[a-zA-Z]+|\d+(\.\d+)?\s*\()', content))
+        if "no abnormal" not in content.lower() and not has_data and "No valid" not in content:
+            content += "\n\nNote: Missing specific indicator data (value/reference range). Recheck original report."
+    else:
+        content = re.sub(r'RH血型（D）抗原鉴定阳性（+）（异常）', r'RH血型（D）抗原鉴定阳性（+）（正常）', content)
+        has_data = bool(re.search(r'(\d+(\.\d+)?\s*[a-zA-Z]+/[a-zA-Z]+|\d+(\.\d+)?\s*（)', content))
+        if "无异常" not in content and not has_data and "未提取" not in content:
+            content += "\n\n注：缺少具体指标数据（数值/参考范围）。请核对原始报告。"
+    return content
+
+
+# ---- 合成语料 ----
+
+def make_section(rng, header, lang, indicators):
+    lines = [header]
+    abnormal = []
+    for name, unit, low, high in indicators:
+        value = round(rng.uniform(low * 0.5, high * 1.5 + 0.1), 2)
+        status = low <= value <= high
+        if lang == "en":
+            lines.append(f"- **{name}:** {value} {unit} (Reference Range: {low}-{high} {unit}) - "
+                         f"{'Normal' if status else 'Abnormal'}")
+        else:
+            lines.append(f"- {name}：{value} {unit}（参考范围：{low}-{high} {unit}）- {'正常' if status else '异常'}")
+        if not status:
+            abnormal.append(name)
+    if lang == "en":
+        lines.insert(1, "1. Overview: The following indicators were tested.")
+        lines.append(f"2. Abnormal Indicators: {', '.join(abnormal) or 'None'}")
+        lines.append("3. Conclusion: Further clinical correlation is recommended.")
+    else:
+        lines.insert(1, "1. 概述：本报告检测了以下指标。")
+        lines.append(f"2. 异常指标：{'、'.join(abnormal) or '无异常'}")
+        lines.append("3. 结论：建议结合临床进一步评估。")
+    return "\n".join(lines)
+
+
+def make_report(rng):
+    """一份合成的模型输出"""
+    if rng.random() < 0.15:
+        return "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 30)))
+    indicators = rng.sample(INDICATORS, rng.randint(3, 10))
+    english = make_section(rng, ENGLISH_HEADER if rng.random() < 0.9 else ENGLISH_HEADER.lower(), "en", indicators)
+    chinese = make_section(rng, CHINESE_HEADER, "zh", indicators)
+    if rng.random() < 0.1:
+        english += "\nRH Blood Type (D) Antigen Detection: Positive (+) (abnormal)"
+    separator = rng.choice(["\n\n", "\n\n中文：\n", "\n\n\n\n", "\n---\n", "\n 中文： \n\n"])
+    if rng.random() < 0.1:
+        chinese = CHINESE_HEADER + "\n" + chinese
+    parts = [english, separator, chinese]
+    if rng.random() < 0.05:
+        parts = [english]
+    elif rng.random() < 0.05:
+        parts = [chinese]
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="双语模型输出解析的吞吐量和输出一致性")
+    parser.add_argument("--reports", type=int, default=20000, help="合成报告数量")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVER_DIR))
+    sys.path.insert(0, str(DATA_DIR))
+    import vllm_image_via_request_base64 as batch
+
+    rng = random.Random(args.seed)
+    corpus = [make_report(rng) for _ in range(args.reports)]
+    indicator_map = batch.MEDICAL_INDICATORS_MAP
+
+    def parse_legacy(output):
+        english, chinese = legacy_extract_structured_bilingual(output, indicator_map)
+        return (legacy_validate_abnormal_indicators(english, "en"),
+                legacy_validate_abnormal_indicators(chinese, "zh"))
+
+    def parse_current(output):
+        english, chinese = batch.extract_structured_bilingual(output)
+        return (batch.validate_abnormal_indicators(english, "en"),
+                batch.validate_abnormal_indicators(chinese, "zh"))
+
+    mismatches = [output for output in corpus if parse_legacy(output) != parse_current(output)]
+    if mismatches:
+        print(f"输出不一致：{len(mismatches)} 份报告，第一份：\n{mismatches[0]!r}")
+        sys.exit(1)
+
+    total_chars = sum(len(output) for output in corpus)
+    print(f"{len(corpus)} 份合成报告（平均 {total_chars // len(corpus)} 字符），两种实现的输出完全一致")
+    print(f"{'实现':<10}{'报告/秒':>12}{'每份(µs)':>12}")
+    results = {}
+    for name, parse in (("原实现", parse_legacy), ("预编译", parse_current)):
+        start = time.perf_counter()
+        for output in corpus:
+            parse(output)
+        elapsed = time.perf_counter() - start
+        results[name] = len(corpus) / elapsed
+        print(f"{name:<10}{results[name]:>12.0f}{elapsed / len(corpus) * 1e6:>12.1f}")
+    print(f"加速比 {results['预编译'] / results['原实现']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
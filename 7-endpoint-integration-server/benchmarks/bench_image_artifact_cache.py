@@ -0,0 +1,78 @@
+"""
+基准测试：批量脚本的预处理图片缓存（6-fine-tuning-vl/image_artifact_cache.py）
+
+对 test-img 的图片（复制 --copies 份，文件名不同但内容相同的副本按文件哈希共享条目，因此每份副本都改写1个像素）
+先以空缓存运行 encode_image（旋转、缩放、JPEG编码、base64，并写入缓存），再以已有缓存运行（文件哈希 + mmap读取），
+输出每张图片的平均耗时和全部图片的总耗时。
+
+用法：
+    python benchmarks/bench_image_artifact_cache.py
+    python benchmarks/bench_image_artifact_cache.py --copies 10 --preprocess document
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = SERVER_DIR.parent / "6-fine-tuning-vl"
+TEST_IMAGE_DIR = DATA_DIR / "test-img"
+
+
+def prepare_images(directory, copies):
+    paths = []
+    for copy in range(copies):
+        for source in sorted(TEST_IMAGE_DIR.glob("*.jpg")):
+            with Image.open(source) as image:
+                image = image.convert("RGB")
+                image.putpixel((0, 0), (copy % 256, 0, 0))
+                path = directory / f"{copy:03d}_{source.name}"
+                image.save(path, quality=95)
+            paths.append(path)
+    return paths
+
+
+def run(encode_image, paths):
+    durations = []
+    start = time.perf_counter()
+    for path in paths:
+        begin = time.perf_counter()
+        encode_image(str(path))
+        durations.append(time.perf_counter() - begin)
+    return time.perf_counter() - start, statistics.mean(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量脚本预处理图片缓存的冷/热耗时")
+    parser.add_argument("--copies", type=int, default=3, help="test-img 图片的复制份数")
+    parser.add_argument("--preprocess", default="none", choices=["none", "document", "binary"])
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVER_DIR))
+    sys.path.insert(0, str(DATA_DIR))
+    import vllm_image_via_request_base64 as batch
+    from image_artifact_cache import EncodedImageCache
+
+    batch.PREPROCESS_PROFILE = args.preprocess
+    with tempfile.TemporaryDirectory() as directory:
+        image_dir = Path(directory) / "images"
+        image_dir.mkdir()
+        paths = prepare_images(image_dir, args.copies)
+        batch.image_cache = EncodedImageCache(str(Path(directory) / "cache"))
+        uncached_total, uncached_mean = run(batch.encode_image_uncached, paths)
+        cold_total, cold_mean = run(batch.encode_image, paths)
+        warm_total, warm_mean = run(batch.encode_image, paths)
+
+    print(f"{len(paths)} 张图片，预处理档位 {args.preprocess}")
+    print(f"{'':<16}{'每张(ms)':>10}{'总耗时(秒)':>12}")
+    for name, total, mean in (("不使用缓存", uncached_total, uncached_mean), ("空缓存（写入）", cold_total, cold_mean),
+                              ("已有缓存", warm_total, warm_mean)):
+        print(f"{name:<16}{mean * 1000:>10.2f}{total:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+基准测试：图片预处理耗时和发送字节数（完整解码 + LANCZOS 与 JPEG draft模式快速路径对比）
+
+- full：完整解码原图，再用LANCZOS缩放到 MAX_IMAGE_SIZE（JPEG_DRAFT_MODE=false）
+- draft：根据文件头中的尺寸，解码时在DCT域直接降采样到接近目标尺寸，再用LANCZOS完成剩余缩放
+- compliant：已经是不超过 MAX_IMAGE_SIZE 的JPEG（由测试图片预先缩小得到），不重新编码直接发送
+
+数据集：6-fine-tuning-vl/test-img 和训练集图片。统计每张图片 prepare_image 的耗时（解码、像素摘要、缩放、编码、base64）
+以及发送给上游的base64字节数。
+
+用法：
+    python benchmarks/bench_image_sizing.py
+    python benchmarks/bench_image_sizing.py --limit 20
+"""
+import argparse
+import io
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = SERVER_DIR.parent / "6-fine-tuning-vl"
+IMAGE_DIRS = [
+    DATA_DIR / "test-img",
+    DATA_DIR / "dataset-img-train" / "dataset-img-train" / "train",
+]
+
+
+def load_server():
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    os.environ["ENABLE_CACHE"] = "false"
+    os.environ["ENDPOINT_PROBE_INTERVAL"] = "0"
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, str(SERVER_DIR))
+    import medical_report_server as server
+    logging.disable(logging.CRITICAL)
+    return server
+
+
+def make_compliant_copy(server, image_bytes):
+    """把原图缩小为不超过 MAX_IMAGE_SIZE 的JPEG，模拟客户端已经压缩过的上传"""
+    return server.resize_image(io.BytesIO(image_bytes)).getvalue()
+
+
+def run(server, images, draft_mode):
+    server.JPEG_DRAFT_MODE = draft_mode
+    timings, sizes = [], []
+    for image_bytes in images:
+        start = time.perf_counter()
+        base64_image, _ = server.prepare_image(io.BytesIO(image_bytes))
+        timings.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(base64_image))
+    return timings, sizes
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片预处理耗时和发送字节数基准测试")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用的图片数量（0表示全部）")
+    args = parser.parse_args()
+
+    paths = [p for directory in IMAGE_DIRS for p in sorted(directory.glob("*.jpg"))]
+    if args.limit:
+        paths = paths[:args.limit]
+    server = load_server()
+    originals = [p.read_bytes() for p in paths]
+    compliant = [make_compliant_copy(server, data) for data in originals]
+    print(f"图片数量: {len(paths)}，原图平均大小: {statistics.mean(map(len, originals)) / 1024:.0f}KB，"
+          f"MAX_IMAGE_SIZE: {server.MAX_IMAGE_SIZE}")
+
+    print(f"{'数据':<12}{'方式':<8}{'平均(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'平均发送(KB)':>14}{'总发送(MB)':>12}")
+    for label, images, draft_mode in (
+        ("原图", originals, False),
+        ("原图", originals, True),
+        ("compliant", compliant, True),
+    ):
+        timings, sizes = run(server, images, draft_mode)
+        mode = "draft" if draft_mode else "full"
+        if label == "compliant":
+            mode = "直接发送"
+        print(f"{label:<12}{mode:<8}{statistics.mean(timings):>10.1f}{percentile(timings, 50):>10.1f}"
+              f"{percentile(timings, 95):>10.1f}{statistics.mean(sizes) / 1024:>14.1f}{sum(sizes) / 1024 / 1024:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+基准测试：图片处理吞吐量随CPU核心数的扩展（请求线程内处理 与 工作进程池对比）
+
+- thread：N个并发请求线程各自调用 image_pipeline.process_image（当前默认方式，IMAGE_WORKERS=0），
+  解码、缩放、编码时持有GIL的部分会互相阻塞
+- process：N个并发请求线程通过 N 个工作进程的 ImageWorkerPool 处理（IMAGE_WORKERS=N），输入经共享内存传递
+
+数据集：6-fine-tuning-vl/test-img 和训练集图片，每个并发度处理全部图片一轮，统计每秒处理的图片数。
+并发度默认为 1、2、4…直到CPU核心数；单核机器上两种方式都无法扩展，此时只能看出进程池的额外开销。
+
+用法：
+    python benchmarks/bench_image_workers.py
+    python benchmarks/bench_image_workers.py --limit 40 --concurrency 1 2 4 8
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = SERVER_DIR.parent / "6-fine-tuning-vl"
+IMAGE_DIRS = [
+    DATA_DIR / "test-img",
+    DATA_DIR / "dataset-img-train" / "dataset-img-train" / "train",
+]
+MAX_IMAGE_SIZE = 1280
+
+
+def default_concurrency():
+    levels, level = [], 1
+    while level < (os.cpu_count() or 1):
+        levels.append(level)
+        level *= 2
+    return levels + [os.cpu_count() or 1]
+
+
+def run(process, images, concurrency):
+    """用 concurrency 个线程并发处理全部图片，返回每秒处理的图片数"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        list(clients.map(process, images))
+    return len(images) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片处理吞吐量扩展基准测试")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用的图片数量（0表示全部）")
+    parser.add_argument("--concurrency", type=int, nargs="*", help="并发度列表（默认 1、2、4…CPU核心数）")
+    parser.add_argument("--profile", default="none", help="预处理档位（none/document/binary）")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVER_DIR))
+    from image_pipeline import process_image
+    from image_workers import ImageWorkerPool
+    logging.disable(logging.CRITICAL)
+
+    paths = [p for directory in IMAGE_DIRS for p in sorted(directory.glob("*.jpg"))]
+    if args.limit:
+        paths = paths[:args.limit]
+    images = [p.read_bytes() for p in paths]
+    levels = args.concurrency or default_concurrency()
+    print(f"图片数量: {len(images)}，CPU核心数: {os.cpu_count()}，预处理档位: {args.profile}")
+
+    # 预热（加载解码器和编码器）
+    process_image(images[0], MAX_IMAGE_SIZE, args.profile)
+
+    print(f"{'并发度':<8}{'thread(张/秒)':>16}{'process(张/秒)':>16}{'加速比':>10}")
+    for concurrency in levels:
+        thread_rate = run(lambda data: process_image(data, MAX_IMAGE_SIZE, args.profile), images, concurrency)
+        pool = ImageWorkerPool(concurrency, MAX_IMAGE_SIZE)
+        try:
+            pool.process(images[0], args.profile)
+            process_rate = run(lambda data: pool.process(data, args.profile), images, concurrency)
+        finally:
+            pool.shutdown()
+        print(f"{concurrency:<8}{thread_rate:>16.1f}{process_rate:>16.1f}{process_rate / thread_rate:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+基准测试：按规范化 (指标, 方向) 组合缓存健康建议时的命中率
+
+按顺序把训练集 metadata.jsonl 中每张图片的参考分析结果（additional_feature，不同图片、不同措辞）
+交给 get_health_recommendations（进程内缓存，API B为本地模拟端点），统计实际调用API B的次数，
+并与按完整分析结果缓存（每种不同的措辞都要调用一次）比较；最后输出各指标的命中率
+（包含该指标的分析结果中，不需要调用API B的比例）。
+
+用法：
+    python benchmarks/bench_indicator_cache.py
+    python benchmarks/bench_indicator_cache.py --top 20
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+METADATA_PATH = SERVER_DIR.parent / "6-fine-tuning-vl" / "dataset-img-train" / "dataset-img-train" / "train" / "metadata.jsonl"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="规范化指标组合缓存的命中率基准测试")
+    parser.add_argument("--top", type=int, default=10, help="输出查询次数最多的前N个指标")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVER_DIR))
+    from mock_openai_server import create_server
+    llm_calls = []
+
+    def responder(request_body):
+        llm_calls.append(request_body["messages"][0]["content"])
+        return None
+
+    mock = create_server("127.0.0.1", 0, responder=responder)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+    os.environ.pop("VL_API_BASE", None)
+    os.environ.pop("LLM_API_BASE", None)
+    os.environ.update({
+        "OPENROUTER_API_KEY": "benchmark",
+        "OPENROUTER_API_BASE": f"http://127.0.0.1:{mock.server_address[1]}/v1",
+        "ENABLE_CACHE": "true",
+        "CACHE_BACKEND": "memory",
+        "CACHE_MAX_ENTRIES": "100000",
+        "ENDPOINT_PROBE_INTERVAL": "0",
+    })
+    os.chdir(tempfile.mkdtemp())
+    import medical_report_server as server
+    from indicator_normalization import canonical_findings
+    logging.disable(logging.CRITICAL)
+
+    analyses = [json.loads(line)["additional_feature"] for line in METADATA_PATH.open(encoding="utf-8")]
+    normalized = sum(canonical_findings(analysis) is not None for analysis in analyses)
+    indicator_stats = {}
+    try:
+        for analysis in analyses:
+            calls_before = len(llm_calls)
+            server.get_health_recommendations(analysis)
+            hit = len(llm_calls) == calls_before
+            for finding in canonical_findings(analysis) or ():
+                counter = indicator_stats.setdefault(finding.key, {"hits": 0, "misses": 0})
+                counter["hits" if hit else "misses"] += 1
+    finally:
+        mock.shutdown()
+
+    distinct_texts = len(set(analyses))
+    print(f"分析结果: {len(analyses)} 条，不同措辞: {distinct_texts} 种，可规范化为指标组合: {normalized} 条")
+    print(f"API B调用次数: 按完整分析结果缓存 {distinct_texts} 次，按指标组合缓存 {len(llm_calls)} 次"
+          f"（减少 {1 - len(llm_calls) / distinct_texts:.0%}）")
+    print(f"整体命中率: {1 - len(llm_calls) / len(analyses):.0%}")
+
+    ranked = sorted(indicator_stats.items(), key=lambda item: item[1]["hits"] + item[1]["misses"], reverse=True)
+    print(f"\n{'指标':<18}{'查询':>6}{'命中':>6}{'命中率':>8}")
+    for key, counter in ranked[:args.top]:
+        lookups = counter["hits"] + counter["misses"]
+        print(f"{key:<18}{lookups:>6}{counter['hits']:>6}{counter['hits'] / lookups:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+基准测试：指标别名查找随别名数量的扩展性 —— 按长度从长到短排列的多选正则（原 indicator_normalization 的实现，
+每个位置逐个尝试所有别名）与 indicator_knowledge_base 的字典树正则比较，并检查两者的匹配结果完全一致
+
+别名为知识库中的真实别名，再加上随机生成的合成指标（英文缩写、较长的英文名称、中文名称），模拟扩充到数千个指标；
+文本为由别名、数值和中文描述拼接的合成分析结果。
+
+用法：
+    python benchmarks/bench_indicator_matching.py
+    python benchmarks/bench_indicator_matching.py --sizes 0 1000 10000 --texts 500
+"""
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+FILLERS = ["：", " 12.5 U/L（参考范围：9-50）", "升高，", "、", " 阴性；", "\n", " ", "偏低。", "(", "正常 "]
+CJK_CHARS = "白细胞血红蛋白凝酶原时间肝肾功能甘油三酯胆固醇尿素肌酐酸碱度钾钠氯钙游离甲状腺激素抗体抗原总直接间接"
+
+
+def legacy_alias_pattern(aliases, ignores_case):
+    """原实现：按长度从长到短排列的多选正则"""
+    alternatives = []
+    for alias in sorted(aliases, key=len, reverse=True):
+        escaped = re.escape(alias)
+        if ignores_case(alias):
+            escaped = f"(?i:{escaped})"
+        if alias[0].isascii() and alias[0].isalnum():
+            escaped = r"(?<![A-Za-z0-9])" + escaped
+        if alias[-1].isascii() and alias[-1].isalnum():
+            escaped += r"(?![A-Za-z0-9])"
+        alternatives.append(escaped)
+    return re.compile("|".join(alternatives))
+
+
+def synthetic_aliases(rng, count):
+    aliases = set()
+    while len(aliases) < count:
+        kind = rng.random()
+        if kind < 0.4:
+            alias = "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(2, 5)))
+            if rng.random() < 0.3:
+                alias += rng.choice(["-", ""]) + str(rng.randint(1, 199))
+        elif kind < 0.6:
+            alias = " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))).capitalize()
+                             for _ in range(rng.randint(1, 3)))
+        else:
+            alias = "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(2, 7)))
+        aliases.add(alias)
+    return sorted(aliases)
+
+
+def make_text(rng, aliases):
+    parts = []
+    for _ in range(rng.randint(10, 40)):
+        alias = rng.choice(aliases)
+        if rng.random() < 0.1:
+            alias = alias.upper() if rng.random() < 0.5 else alias.lower()
+        parts.append(alias + rng.choice(FILLERS))
+    return "".join(parts)
+
+
+def measure(pattern, texts):
+    start = time.perf_counter()
+    for text in texts:
+        for _ in pattern.finditer(text):
+            pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指标别名查找随别名数量的扩展性")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 300, 1000, 3000], help="额外合成的别名数量")
+    parser.add_argument("--texts", type=int, default=1000, help="合成分析结果数量")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVER_DIR))
+    from indicator_knowledge_base import ASCII_BOUNDARY, compile_trie_pattern, ignores_case, knowledge_base
+
+    real_aliases = list(dict.fromkeys(alias for indicator in knowledge_base.indicators.values()
+                                      for alias in indicator.aliases))
+    print(f"{'别名数':>8}{'编译-原(ms)':>14}{'编译-树(ms)':>14}{'原(文本/秒)':>14}{'字典树(文本/秒)':>18}{'加速比':>8}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        aliases = real_aliases + [alias for alias in synthetic_aliases(rng, size) if alias not in real_aliases]
+        texts = [make_text(rng, aliases) for _ in range(args.texts)]
+
+        start = time.perf_counter()
+        legacy = legacy_alias_pattern(aliases, ignores_case)
+        legacy_compile = time.perf_counter() - start
+        start = time.perf_counter()
+        trie = compile_trie_pattern(aliases, ASCII_BOUNDARY, ignores_case)
+        trie_compile = time.perf_counter() - start
+
+        for text in texts:
+            expected = [match.span() for match in legacy.finditer(text)]
+            actual = [match.span() for match in trie.finditer(text)]
+            if expected != actual:
+                print(f"匹配结果不一致（{len(aliases)} 个别名）：\n{text!r}\n{expected}\n{actual}")
+                sys.exit(1)
+
+        legacy_elapsed = measure(legacy, texts)
+        trie_elapsed = measure(trie, texts)
+        print(f"{len(aliases):>8}{legacy_compile * 1000:>14.1f}{trie_compile * 1000:>14.1f}"
+              f"{len(texts) / legacy_elapsed:>14.0f}{len(texts) / trie_elapsed:>18.0f}"
+              f"{legacy_elapsed / trie_elapsed:>8.1f}x")
+    print("两种实现的匹配结果完全一致")
+
+
+if __name__ == "__main__":
+    main()
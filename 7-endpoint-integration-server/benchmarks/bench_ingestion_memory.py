@@ -0,0 +1,124 @@
+"""
+基准测试：图片接收路径的内存占用（每个请求的峰值RSS增量）
+
+对比两种从上传文件到上游请求体的处理方式：
+- legacy：读成bytes → BytesIO → 解码计算摘要 → 再次解码缩放 → 读出bytes → base64字符串 → 拼接data URL → json.dumps → 编码为bytes
+- current：直接从上传文件流解码一次（摘要与缩放共用），base64保持为字节并按块拼入预编码的请求体
+
+每个 (方式, 图片) 组合在独立子进程中运行，峰值RSS为处理一次上传后的 ru_maxrss 减去处理前的值。
+上传文件按Werkzeug的方式放在临时文件中（大于500KB的上传不会保存在内存里）。
+
+用法：
+    python benchmarks/bench_ingestion_memory.py
+    python benchmarks/bench_ingestion_memory.py --image ../6-fine-tuning-vl/test-img/scan_item10-_71.jpg
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_IMAGE_DIR = SERVER_DIR.parent / "6-fine-tuning-vl" / "test-img"
+
+
+def legacy_ingest(server, upload):
+    """改造前的处理流程（保留用于对比）"""
+    from PIL import Image, ImageOps
+
+    image_data = io.BytesIO(upload.read())
+    with Image.open(image_data) as decoded_image:
+        normalized = ImageOps.exif_transpose(decoded_image)
+        if normalized.mode != 'RGB':
+            normalized = normalized.convert('RGB')
+        hasher = hashlib.sha256(f"{normalized.width}x{normalized.height}".encode())
+        hasher.update(normalized.tobytes())
+        del normalized
+    image_data.seek(0)
+    resized_image = server.resize_image(image_data, max_size=server.MAX_IMAGE_SIZE)
+    resized_image.seek(0)
+    base64_image = base64.b64encode(resized_image.read()).decode('utf-8')
+    payload = {
+        "model": server.API_A_MODEL,
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": server.ANALYSIS_PROMPT},
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+        ]}],
+    }
+    # requests 处理 json= 参数的方式
+    return json.dumps(payload, allow_nan=False).encode("utf-8")
+
+
+def current_ingest(server, upload):
+    base64_image, _ = server.prepare_image(upload)
+    return server.build_analysis_payload(base64_image)
+
+
+def run_worker(variant, image_path):
+    """子进程：处理一次上传并输出峰值RSS增量（KB）"""
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    os.environ["ENABLE_CACHE"] = "false"
+    os.environ["ENDPOINT_PROBE_INTERVAL"] = "0"
+    os.chdir(workdir)
+    sys.path.insert(0, str(SERVER_DIR))
+    import logging
+    import medical_report_server as server
+    logging.disable(logging.CRITICAL)
+
+    ingest = legacy_ingest if variant == "legacy" else current_ingest
+    # 预热：加载解码器和编码器，避免把一次性的初始化计入峰值
+    warmup = io.BytesIO()
+    from PIL import Image
+    Image.new("RGB", (64, 64), "white").save(warmup, format="JPEG")
+    ingest(server, io.BytesIO(warmup.getvalue()))
+
+    with open(image_path, "rb") as source, tempfile.TemporaryFile() as upload:
+        upload.write(source.read())
+        upload.seek(0)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        body = ingest(server, upload)
+        # 模拟发送：逐块读取请求体
+        body_bytes = sum(len(chunk) for chunk in ([body] if isinstance(body, bytes) else body))
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"peak_kb": peak - baseline, "body_bytes": body_bytes, "ms": elapsed * 1000}))
+
+
+def measure(variant, image_path):
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", variant, str(image_path)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片接收路径峰值内存基准测试")
+    parser.add_argument("--image", nargs="*", help="测试图片（默认使用 6-fine-tuning-vl/test-img 下的前3张）")
+    parser.add_argument("--worker", nargs=2, metavar=("VARIANT", "IMAGE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    images = [Path(p).resolve() for p in args.image] if args.image else sorted(DEFAULT_IMAGE_DIR.glob("*.jpg"))[:3]
+    print(f"{'图片':<28}{'大小(KB)':>10}{'方式':>10}{'峰值RSS增量(MB)':>18}{'请求体(KB)':>12}{'耗时(ms)':>10}")
+    for image_path in images:
+        for variant in ("legacy", "current"):
+            result = measure(variant, image_path)
+            print(f"{image_path.name:<28}{image_path.stat().st_size / 1024:>10.0f}{variant:>10}"
+                  f"{result['peak_kb'] / 1024:>18.1f}{result['body_bytes'] / 1024:>12.0f}{result['ms']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
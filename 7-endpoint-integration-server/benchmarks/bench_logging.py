@@ -0,0 +1,121 @@
+"""
+基准测试：并发请求下每个请求写日志的开销（同步写入 vs 队列异步JSON日志）
+
+多个线程模拟并发请求，每个请求按服务器的实际日志写 --lines 条过程日志（INFO，含f-string格式化的耗时和长度）
+和一条访问日志，测量请求线程花在日志调用上的时间（p50/p99）和总吞吐；stderr和日志文件都写入临时目录。
+
+- sync：原有配置（logging.basicConfig，StreamHandler + FileHandler，文本格式，在请求线程中格式化和写入）
+- queue：configure_logging（请求线程只入队，后台线程格式化为JSON并写入轮转文件），--sample-ratio 为过程日志的采样比例
+  队列模式另报告请求结束后后台线程写完剩余日志的时间，以及因队列满丢弃的条数
+
+用法：
+    python benchmarks/bench_logging.py
+    python benchmarks/bench_logging.py --threads 64 --requests 5000 --sample-ratio 0.1
+"""
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def simulate_request(logger, access_logger, lines, request_number, always_log):
+    """一个请求的日志：过程日志和一条访问日志，返回花在日志调用上的秒数"""
+    start = time.perf_counter()
+    logger.info("收到医疗报告分析请求")
+    for step in range(lines - 1):
+        logger.info(f"从API A收到分析结果，长度: {412 + step} 字符，耗时: {1.234 + request_number / 1000:.2f}秒")
+    access_logger.info(f"POST /analyze_medical_report 200 {1234.5 + step}ms", extra=dict(
+        always_log, method="POST", path="/analyze_medical_report", status=200, duration_ms=1234.5
+    ))
+    return time.perf_counter() - start
+
+
+def run_load(mode, args, directory):
+    """按模式配置日志并运行并发请求，返回 (各请求的日志耗时, 总耗时, 写完剩余日志的耗时, 丢弃条数, 采样丢弃条数)"""
+    from structured_logging import ALWAYS_LOG, activate_request_log, configure_logging, new_request_log
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    stderr = open(directory / f"{mode}.stderr", "w", encoding="utf-8")
+    original_stderr, sys.stderr = sys.stderr, stderr
+    queue_handler = None
+    try:
+        if mode == "sync":
+            logging.basicConfig(level=logging.INFO, format=TEXT_FORMAT, force=True, handlers=[
+                logging.StreamHandler(sys.stderr),
+                logging.FileHandler(directory / "sync.log", encoding="utf-8")
+            ])
+        else:
+            queue_handler = configure_logging(
+                log_format="json", log_file=str(directory / "queue.log"), max_bytes=50 * 1024 * 1024,
+                queue_size=args.queue_size
+            )
+    finally:
+        sys.stderr = original_stderr
+    logger = logging.getLogger("medical_report_server")
+    access_logger = logging.getLogger("medical_report_server.access")
+    sample_ratio = args.sample_ratio if mode == "queue" else 1.0
+
+    durations = []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def worker():
+        local = []
+        for request_number in counter:
+            activate_request_log(new_request_log(sample_ratio=sample_ratio))
+            local.append(simulate_request(logger, access_logger, args.lines, request_number, ALWAYS_LOG))
+        with lock:
+            durations.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    drain, dropped, sampled_out = 0.0, 0, 0
+    if queue_handler is not None:
+        drain_start = time.perf_counter()
+        queue_handler.listener.stop()
+        drain = time.perf_counter() - drain_start
+        dropped, sampled_out = queue_handler.dropped, queue_handler.filters[0].sampled_out
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    stderr.close()
+    return durations, elapsed, drain, dropped, sampled_out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发请求下每个请求的日志开销")
+    parser.add_argument("--threads", type=int, default=32, help="并发请求线程数")
+    parser.add_argument("--requests", type=int, default=3000, help="请求总数")
+    parser.add_argument("--lines", type=int, default=8, help="每个请求的过程日志条数")
+    parser.add_argument("--sample-ratio", type=float, default=1.0, help="队列模式下保留过程日志的请求比例")
+    parser.add_argument("--queue-size", type=int, default=100000, help="队列模式的日志队列上限")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVER_DIR))
+    print(f"并发线程: {args.threads}，请求: {args.requests}，每个请求 {args.lines} 条过程日志 + 1 条访问日志")
+    print(f"{'模式':<8}{'p50 ms':>10}{'p99 ms':>10}{'请求/秒':>10}{'写完剩余 s':>12}{'丢弃':>8}{'采样丢弃':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("sync", "queue"):
+            durations, elapsed, drain, dropped, sampled_out = run_load(mode, args, Path(directory))
+            quantiles = statistics.quantiles(durations, n=100)
+            print(f"{mode:<8}{quantiles[49] * 1000:>10.3f}{quantiles[98] * 1000:>10.3f}"
+                  f"{args.requests / elapsed:>10.0f}{drain:>12.2f}{dropped:>8}{sampled_out:>10}")
+
+
+if __name__ == "__main__":
+    main()
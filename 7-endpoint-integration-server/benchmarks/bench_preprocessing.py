@@ -0,0 +1,132 @@
+"""
+基准测试：化验单预处理档位（none / document / binary）对发送字节数和视觉token数的影响
+
+- 字节数：prepare_image 输出的base64字节数（即请求体中图片部分的大小）
+- 视觉token：按Qwen2.5-VL的图片处理规则（宽高取整到28的倍数，每28x28像素一个token）由输出尺寸估算
+- 回答质量（可选，需要可用的视觉语言模型端点）：用 --endpoint 把每种档位的图片发送给模型，
+  记录上游返回的 usage.prompt_tokens，并与 none 档位的回答比较指标缩写和数值的重合率
+
+用法：
+    python benchmarks/bench_preprocessing.py
+    python benchmarks/bench_preprocessing.py --train --limit 20
+    python benchmarks/bench_preprocessing.py --endpoint http://host:8000/v1 --model ./qwen25vl-7b-offical-finetuned/
+"""
+import argparse
+import base64
+import io
+import logging
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+from PIL import Image
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = SERVER_DIR.parent / "6-fine-tuning-vl"
+TEST_IMAGE_DIR = DATA_DIR / "test-img"
+TRAIN_IMAGE_DIR = DATA_DIR / "dataset-img-train" / "dataset-img-train" / "train"
+
+# 回答中的检验指标缩写（如 WBC、HCO3-、NEUT#）和数值
+ANSWER_TOKEN_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9\-#%+]{1,}|\d+(?:\.\d+)?")
+
+
+def load_server():
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    os.environ["ENABLE_CACHE"] = "false"
+    os.environ["ENDPOINT_PROBE_INTERVAL"] = "0"
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, str(SERVER_DIR))
+    import medical_report_server as server
+    logging.disable(logging.CRITICAL)
+    return server
+
+
+def answer_overlap(reference, answer):
+    """答案中的指标缩写和数值与参考答案的重合率（召回率）"""
+    expected = set(ANSWER_TOKEN_PATTERN.findall(reference))
+    if not expected:
+        return None
+    return len(expected & set(ANSWER_TOKEN_PATTERN.findall(answer))) / len(expected)
+
+
+def ask_model(server, endpoint, model, api_key, base64_image):
+    body = server.build_analysis_payload(base64_image, model=model)
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    response = requests.post(f"{endpoint.rstrip('/')}/chat/completions", data=body, headers=headers,
+                             timeout=server.API_TIMEOUT)
+    response.raise_for_status()
+    result = response.json()
+    return result["choices"][0]["message"]["content"], result.get("usage", {}).get("prompt_tokens")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="化验单预处理档位的字节数和视觉token基准测试")
+    parser.add_argument("--train", action="store_true", help="同时使用训练集中的手机拍摄图片")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用的图片数量（0表示全部）")
+    parser.add_argument("--endpoint", help="OpenAI兼容的视觉语言模型API地址（提供时比较回答质量）")
+    parser.add_argument("--model", default="./qwen25vl-7b-offical-finetuned/", help="模型名称")
+    parser.add_argument("--api-key", default=os.getenv("SELFHOST_API_KEY"), help="API密钥（可选）")
+    args = parser.parse_args()
+
+    paths = sorted(TEST_IMAGE_DIR.glob("*.jpg"))
+    if args.train:
+        paths += sorted(TRAIN_IMAGE_DIR.glob("*.jpg"))
+    if args.limit:
+        paths = paths[:args.limit]
+    server = load_server()
+    from document_preprocessing import PREPROCESS_PROFILES, estimate_vision_tokens
+    print(f"图片数量: {len(paths)}，MAX_IMAGE_SIZE: {server.MAX_IMAGE_SIZE}，"
+          f"目标文字行高: {server.PREPROCESS_TEXT_HEIGHT}px")
+
+    stats = {profile: {"bytes": [], "tokens": [], "ms": [], "prompt_tokens": [], "overlap": []}
+             for profile in PREPROCESS_PROFILES}
+    for path in paths:
+        image_bytes = path.read_bytes()
+        reference = None
+        row = [f"{path.name:<28}"]
+        for profile in PREPROCESS_PROFILES:
+            start = time.perf_counter()
+            base64_image, _ = server.prepare_image(image_bytes, profile)
+            stats[profile]["ms"].append((time.perf_counter() - start) * 1000)
+            with Image.open(io.BytesIO(base64.b64decode(base64_image))) as output:
+                width, height = output.size
+            tokens = estimate_vision_tokens(width, height)
+            stats[profile]["bytes"].append(len(base64_image))
+            stats[profile]["tokens"].append(tokens)
+            row.append(f"{profile}={width}x{height}/{len(base64_image) // 1024}KB/{tokens}tok")
+
+            if args.endpoint:
+                answer, prompt_tokens = ask_model(server, args.endpoint, args.model, args.api_key, base64_image)
+                if prompt_tokens is not None:
+                    stats[profile]["prompt_tokens"].append(prompt_tokens)
+                if reference is None:
+                    reference = answer
+                else:
+                    overlap = answer_overlap(reference, answer)
+                    if overlap is not None:
+                        stats[profile]["overlap"].append(overlap)
+        print("  ".join(row))
+
+    baseline = stats["none"]
+    print(f"\n{'档位':<10}{'平均耗时(ms)':>14}{'平均发送(KB)':>14}{'字节占比':>10}{'平均视觉token':>14}{'token占比':>10}"
+          + (f"{'prompt_tokens':>15}{'回答重合率':>12}" if args.endpoint else ""))
+    for profile, values in stats.items():
+        line = (f"{profile:<10}{statistics.mean(values['ms']):>14.1f}{statistics.mean(values['bytes']) / 1024:>14.1f}"
+                f"{sum(values['bytes']) / sum(baseline['bytes']):>10.0%}{statistics.mean(values['tokens']):>14.0f}"
+                f"{sum(values['tokens']) / sum(baseline['tokens']):>10.0%}")
+        if args.endpoint:
+            prompt_tokens = statistics.mean(values["prompt_tokens"]) if values["prompt_tokens"] else float("nan")
+            overlap = f"{statistics.mean(values['overlap']):.0%}" if values["overlap"] else "-"
+            line += f"{prompt_tokens:>15.0f}{overlap:>12}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+基准测试：相似度缓存的命中率和查找延迟
+
+1. 命中率：按顺序处理训练集 metadata.jsonl 中的参考分析结果，与服务器的查找顺序一致：
+   先查精确缓存（指标组合，不能规范化时为完整分析结果），未命中时查 SimilarityIndex（命名空间为异常指标的类别集合，
+   相同指标方向相反的条目不复用），仍未命中时计一次API B调用并写入两者。
+   "仅相似度命中"为精确缓存未命中、只由相似度索引命中的次数；不能完整规范化的分析结果不使用相似度缓存（"不使用"列）
+2. 查找延迟：用各分析结果中的行随机组合成的合成分析结果把索引填充到指定条目数，
+   再用其中一半条目的扰动变体（替换数值、删除或调换行）和另一半新的合成分析结果测量查找的p50/p95/p99；
+   --single-namespace 把所有条目放在同一命名空间（最坏情况：识别不出任何指标的分析结果），
+   --max-lookup-ms 为单次查找的时间预算（0表示不限制）
+
+用法：
+    python benchmarks/bench_similarity_cache.py
+    python benchmarks/bench_similarity_cache.py --entries 20000 --queries 2000
+    python benchmarks/bench_similarity_cache.py --single-namespace --max-lookup-ms 0
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+METADATA_PATH = SERVER_DIR.parent / "6-fine-tuning-vl" / "dataset-img-train" / "dataset-img-train" / "train" / "metadata.jsonl"
+THRESHOLDS = (0.8, 0.85, 0.9, 0.95)
+
+
+def perturb(text: str, rng: random.Random) -> str:
+    """生成措辞相近的变体：替换数值，随机删除或调换一行"""
+    text = re.sub(r"\d+(?:\.\d+)?", lambda match: f"{float(match.group()) * rng.uniform(0.8, 1.2):.1f}", text)
+    lines = text.split("\n")
+    if len(lines) > 2 and rng.random() < 0.5:
+        del lines[rng.randrange(len(lines))]
+    if len(lines) > 2 and rng.random() < 0.5:
+        i, j = rng.sample(range(len(lines)), 2)
+        lines[i], lines[j] = lines[j], lines[i]
+    return "\n".join(lines)
+
+
+def synthesize(lines, rng: random.Random) -> str:
+    """由不同分析结果中的行随机组合一份合成分析结果（3~8行）"""
+    return "\n".join(rng.sample(lines, rng.randint(3, 8)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="相似度缓存的命中率和查找延迟基准测试")
+    parser.add_argument("--entries", type=int, default=5000, help="测量延迟时索引中的条目数")
+    parser.add_argument("--queries", type=int, default=1000, help="测量延迟的查找次数")
+    parser.add_argument("--max-lookup-ms", type=float, default=5.0, help="单次查找的时间预算（毫秒，0表示不限制）")
+    parser.add_argument("--single-namespace", action="store_true", help="测量延迟时所有条目使用同一命名空间")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SERVER_DIR))
+    from indicator_normalization import (
+        canonical_categories, canonical_findings, canonical_key, conflicting_findings, extract_findings
+    )
+    from similarity_cache import SimilarityIndex
+
+    def latency_key(text):
+        return canonical_key(extract_findings(text))
+
+    analyses = [json.loads(line)["additional_feature"] for line in METADATA_PATH.open(encoding="utf-8")]
+    print(f"分析结果: {len(analyses)} 条，不同措辞: {len(set(analyses))} 种")
+    print(f"{'阈值':>6}{'精确缓存命中':>12}{'仅相似度命中':>12}{'不使用':>8}{'API B调用':>10}")
+    for threshold in THRESHOLDS:
+        index = SimilarityIndex(threshold=threshold, max_entries=len(analyses))
+        exact_cache, exact, similar, skipped = set(), 0, 0, 0
+        for analysis in analyses:
+            findings = canonical_findings(analysis)
+            key = canonical_key(findings) if findings else analysis
+            if key in exact_cache:
+                exact += 1
+                continue
+            if not findings:
+                skipped += 1
+            elif index.lookup(analysis, canonical_categories(findings),
+                              accept=lambda text: not conflicting_findings(findings, canonical_findings(text))):
+                similar += 1
+                continue
+            else:
+                index.insert(analysis, "建议", canonical_categories(findings))
+            exact_cache.add(key)
+        print(f"{threshold:>6}{exact:>12}{similar:>12}{skipped:>8}{len(analyses) - exact - similar:>10}")
+
+    rng = random.Random(0)
+    lines = sorted({line.strip() for analysis in analyses for line in analysis.split("\n") if line.strip()})
+    corpus = [synthesize(lines, rng) for _ in range(args.entries)]
+    index = SimilarityIndex(threshold=0.9, max_entries=args.entries, max_lookup_ms=args.max_lookup_ms)
+    latency_namespace = (lambda text: "") if args.single_namespace else latency_key
+    start = time.perf_counter()
+    for text in corpus:
+        index.insert(text, "建议", latency_namespace(text))
+    insert_seconds = time.perf_counter() - start
+    queries = [perturb(rng.choice(corpus), rng) if i % 2 else synthesize(lines, rng) for i in range(args.queries)]
+    for query in queries:
+        index.lookup(query, latency_namespace(query))
+    stats = index.snapshot()
+    latency = stats["lookup_ms"]
+    print(f"\n索引条目: {stats['entries']}，命名空间: {stats['namespaces']}，"
+          f"插入 {insert_seconds / args.entries * 1000:.3f} ms/条")
+    print(f"查找 {args.queries} 次: 命中率 {stats['hit_rate']:.0%}，超出时间预算 {stats['budget_exceeded']} 次，延迟 p50 {latency['p50']} ms，"
+          f"p95 {latency['p95']} ms，p99 {latency['p99']} ms，最大 {latency['max']} ms")
+
+
+if __name__ == "__main__":
+    main()
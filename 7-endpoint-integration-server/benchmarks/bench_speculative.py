@@ -0,0 +1,157 @@
+"""
+基准测试：推测式健康建议（speculative）相对顺序调用节省的端到端延迟
+
+在本进程内启动两个模拟端点（VL：视觉语言模型，LLM：大语言模型），按真实的首token延迟和输出速度逐token返回：
+- VL端点：每张图片返回一份"异常指标列表 + 结论"格式的分析结果，指标数（2~6项）和内容由图片数据决定
+- LLM端点：整份报告的健康建议按指标数变长（每项一段，另有总体建议）；单项指标的建议为一段
+
+对 6-fine-tuning-vl/test-img 中的每张图片分别以顺序模式和推测模式调用 run_analysis_pipeline（关闭缓存），
+比较端到端耗时。默认速度参考自建的Qwen2.5-VL-7B / Qwen2.5-14B（vLLM）：模拟token为2个汉字。
+
+用法：
+    python benchmarks/bench_speculative.py
+    python benchmarks/bench_speculative.py --vl-latency 3 --vl-token-interval 0.08 --limit 3
+"""
+import argparse
+import hashlib
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+TEST_IMAGE_DIR = SERVER_DIR.parent / "6-fine-tuning-vl" / "test-img"
+
+INDICATOR_POOL = [
+    "丙氨酸氨基转移酶（ALT）升高：68 U/L（参考范围 9-50 U/L）",
+    "天门冬氨酸氨基转移酶（AST）升高：52 U/L（参考范围 15-40 U/L）",
+    "总胆固醇（TC）偏高：6.2 mmol/L（参考范围 <5.2 mmol/L）",
+    "甘油三酯（TG）偏高：2.8 mmol/L（参考范围 <1.7 mmol/L）",
+    "空腹血糖（GLU）升高：7.4 mmol/L（参考范围 3.9-6.1 mmol/L）",
+    "尿酸（UA）升高：512 μmol/L（参考范围 208-428 μmol/L）",
+    "肌酐（CREA）升高：118 μmol/L（参考范围 57-97 μmol/L）",
+    "血红蛋白（HGB）降低：102 g/L（参考范围 130-175 g/L）",
+    "白细胞计数（WBC）升高：11.8 ×10^9/L（参考范围 3.5-9.5 ×10^9/L）",
+    "血小板计数（PLT）降低：86 ×10^9/L（参考范围 125-350 ×10^9/L）",
+    "活化部分凝血活酶时间（APTT）缩短：19.0 秒（参考范围 23-35 秒）",
+    "钾（K+）降低：3.1 mmol/L（参考范围 3.5-5.3 mmol/L）",
+]
+CONCLUSION = ("结论：以上异常提示可能存在肝功能损伤及代谢紊乱，建议结合临床症状和病史进一步评估，"
+              "必要时复查相关指标并在专科医生指导下处理。")
+INDICATOR_ADVICE = ("饮食上减少高脂、高糖和油炸食物，多吃新鲜蔬菜和全谷物，戒烟限酒；每周进行至少150分钟中等强度"
+                    "有氧运动，控制体重；保持规律作息，避免熬夜；1~3个月后复查该指标，如持续异常请到相应专科就诊。")
+GENERAL_ADVICE = ("总体建议：保持均衡饮食和规律运动，控制体重，戒烟限酒，保证充足睡眠；"
+                  "按医生建议定期复查，出现明显不适时及时就医。")
+
+
+def build_analysis(image_url: str) -> str:
+    """由图片数据确定性地生成一份分析结果（2~6项异常指标）"""
+    rng = random.Random(hashlib.sha256(image_url.encode()).hexdigest())
+    indicators = rng.sample(INDICATOR_POOL, rng.randint(2, 6))
+    lines = [f"{number}. {indicator}" for number, indicator in enumerate(indicators, 1)]
+    return "异常指标：\n" + "\n".join(lines) + "\n\n" + CONCLUSION
+
+
+def make_responders(indicator_prompt_prefix, parse_indicator_items, indicator_label):
+    def vl_responder(request_body):
+        for message in request_body.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, list):
+                for part in content:
+                    if part.get("type") == "image_url":
+                        return build_analysis(part["image_url"]["url"])
+        return None
+
+    def llm_responder(request_body):
+        prompt = request_body["messages"][0]["content"]
+        if prompt.startswith(indicator_prompt_prefix):
+            return INDICATOR_ADVICE
+        indicators = parse_indicator_items(prompt.split("\n\n")[1])
+        sections = [f"{number}. {indicator_label(indicator)}：{INDICATOR_ADVICE}"
+                    for number, indicator in enumerate(indicators, 1)]
+        return "健康建议：\n" + "\n".join(sections) + "\n\n" + GENERAL_ADVICE
+
+    return vl_responder, llm_responder
+
+
+def start_mock(port, latency, token_interval, responder):
+    from mock_openai_server import create_server
+    server = create_server("127.0.0.1", port, latency, token_interval, responder)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def get_free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推测式健康建议的端到端延迟基准测试")
+    parser.add_argument("--vl-latency", type=float, default=2.0, help="VL端点首token延迟（秒，含图片预填充）")
+    parser.add_argument("--vl-token-interval", type=float, default=0.06, help="VL端点token间隔（秒/2字）")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="LLM端点首token延迟（秒）")
+    parser.add_argument("--llm-token-interval", type=float, default=0.05, help="LLM端点token间隔（秒/2字）")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用的图片数量（0表示全部）")
+    args = parser.parse_args()
+
+    vl_port, llm_port = get_free_port(), get_free_port()
+    os.environ.pop("OPENROUTER_API_KEY", None)
+    os.environ.update({
+        "VL_API_BASE": f"http://127.0.0.1:{vl_port}/v1",
+        "LLM_API_BASE": f"http://127.0.0.1:{llm_port}/v1",
+        "ENABLE_CACHE": "false",
+        "ENDPOINT_PROBE_INTERVAL": "0",
+    })
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, str(SERVER_DIR))
+    import medical_report_server as server
+    from speculative_recommendations import indicator_label, parse_indicator_items
+    logging.disable(logging.CRITICAL)
+
+    prefix = server.INDICATOR_RECOMMENDATION_PROMPT_TEMPLATE.split("{indicator}")[0]
+    vl_responder, llm_responder = make_responders(prefix, parse_indicator_items, indicator_label)
+    mocks = [
+        start_mock(vl_port, args.vl_latency, args.vl_token_interval, vl_responder),
+        start_mock(llm_port, args.llm_latency, args.llm_token_interval, llm_responder),
+    ]
+
+    paths = sorted(TEST_IMAGE_DIR.glob("*.jpg"))
+    if args.limit:
+        paths = paths[:args.limit]
+    print(f"图片数量: {len(paths)}，VL: 首token {args.vl_latency}s / {args.vl_token_interval}s每token，"
+          f"LLM: 首token {args.llm_latency}s / {args.llm_token_interval}s每token")
+    print(f"{'图片':<24}{'指标数':>6}{'顺序(s)':>10}{'推测(s)':>10}{'节省(s)':>10}{'节省比例':>10}")
+
+    sequential_times, speculative_times = [], []
+    try:
+        for path in paths:
+            base64_image, image_digest = server.prepare_image(path.read_bytes())
+            start = time.perf_counter()
+            server.run_analysis_pipeline(base64_image, image_digest)
+            sequential = time.perf_counter() - start
+            start = time.perf_counter()
+            result = server.run_analysis_pipeline(base64_image, image_digest, speculative=True)
+            speculative = time.perf_counter() - start
+            sequential_times.append(sequential)
+            speculative_times.append(speculative)
+            print(f"{path.name:<24}{result['speculative']['indicators']:>6}{sequential:>10.2f}{speculative:>10.2f}"
+                  f"{sequential - speculative:>10.2f}{(sequential - speculative) / sequential:>10.0%}")
+    finally:
+        for mock in mocks:
+            mock.shutdown()
+
+    saved = [a - b for a, b in zip(sequential_times, speculative_times)]
+    print(f"\n平均: 顺序 {statistics.mean(sequential_times):.2f}s，推测 {statistics.mean(speculative_times):.2f}s，"
+          f"节省 {statistics.mean(saved):.2f}s（{sum(saved) / sum(sequential_times):.0%}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+"""
+负载测试：按工作负载文件（JSONL，每行一个请求模板）或 test-img 中的图片重放请求，输出延迟分位数、吞吐量和错误率
+
+- closed（闭环）：固定数量的并发用户，每个用户收到响应后立即发送下一个请求（--concurrency），测量服务器能承受的吞吐量
+- open（开环）：按目标速率到达（--rate，请求/秒，--arrival poisson/uniform），不受服务器响应快慢影响；
+  延迟从计划发送时间算起（客户端来不及发送时的排队时间也计入，避免协调遗漏），在途请求达到 --max-in-flight 时
+  不再发送并计为"未发送"
+- --profile 为分阶段的负载曲线（开环为速率，闭环为并发数）：`时长:值` 为恒定，`时长:起-止` 为线性变化，
+  如 `30:1-8,60:8,30:8-0`（时长单位为秒，可加 s/m 后缀）
+- --spawn flask/async 在临时目录中启动本地模拟OpenAI接口（mock_openai_server.py，可配置延迟分布和错误率）和服务器
+  （默认关闭缓存，保证每个请求都调用上游）；不指定时对 --url 的服务器发送请求
+
+工作负载文件每行一个JSON对象（按 weight 加权随机选择，--seed 固定时请求序列可复现）：
+    {"name": "单页", "endpoint": "/analyze_medical_report", "images": ["scan_item10-_71.jpg"], "form": {"speculative": "true"}, "weight": 3}
+endpoint 支持 /analyze_medical_report（images 多于一张时为多页报告）、/analyze_medical_report/stream（读完整个事件流，
+另统计首字节时间）和 /jobs（提交后轮询到任务结束）；images 为相对 --image-dir（默认为 test-img）的路径或绝对路径。
+
+用法（--spawn flask 需要 gunicorn，--spawn async 需要 hypercorn）：
+    python benchmarks/load_test.py --spawn flask --mode closed --concurrency 16 --duration 60 --mock-latency 2
+    python benchmarks/load_test.py --spawn async --mode open --profile 30:1-20,60:20 --mock-latency 2 \\
+        --mock-latency-distribution lognormal --mock-error-rate 0.05 --output report.json
+    python benchmarks/load_test.py --url http://127.0.0.1:80 --workload benchmarks/workload_example.jsonl --mode open --rate 2 --duration 120
+"""
+import argparse
+import json
+import mimetypes
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from bench_async_vs_flask import get_free_port, percentile, server_command, start_process, wait_until_healthy
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_IMAGE_DIR = SERVER_DIR.parent / "6-fine-tuning-vl" / "test-img"
+ENDPOINTS = ("/analyze_medical_report", "/analyze_medical_report/stream", "/jobs")
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".pdf")
+STAGE_PATTERN = re.compile(r"^\s*([\d.]+)([sm]?)\s*:\s*([\d.]+)\s*(?:-\s*([\d.]+))?\s*$")
+
+
+class LoadProfile:
+    """分阶段的负载曲线：value_at(t) 为第t秒的目标值（开环为速率，闭环为并发数）"""
+
+    def __init__(self, stages):
+        self.stages = stages  # [(时长, 起始值, 结束值)]
+        self.duration = sum(duration for duration, _, _ in stages)
+
+    @classmethod
+    def parse(cls, text):
+        stages = []
+        for part in text.split(","):
+            match = STAGE_PATTERN.match(part)
+            if not match:
+                raise ValueError(f"无法解析负载阶段: {part!r}（格式为 时长:值 或 时长:起-止，如 30:1-8）")
+            duration = float(match.group(1)) * (60 if match.group(2) == "m" else 1)
+            start = float(match.group(3))
+            end = float(match.group(4)) if match.group(4) is not None else start
+            stages.append((duration, start, end))
+        return cls(stages)
+
+    @classmethod
+    def constant(cls, value, duration):
+        return cls([(duration, value, value)])
+
+    def value_at(self, t):
+        for duration, start, end in self.stages:
+            if t < duration:
+                return start + (end - start) * t / duration if duration else end
+            t -= duration
+        return self.stages[-1][2] if self.stages else 0.0
+
+    def peak(self):
+        return max((max(start, end) for _, start, end in self.stages), default=0.0)
+
+    def describe(self):
+        return ",".join(f"{duration:g}:{start:g}" + (f"-{end:g}" if end != start else "")
+                        for duration, start, end in self.stages)
+
+
+class Sample:
+    """一个请求的结果（时间为相对测试开始的秒数）"""
+    __slots__ = ("name", "scheduled", "start", "end", "outcome", "ttfb", "cache_hit")
+
+    def __init__(self, name, scheduled, start, end, outcome, ttfb=None, cache_hit=None):
+        self.name = name
+        self.scheduled = scheduled
+        self.start = start
+        self.end = end
+        self.outcome = outcome  # HTTP状态码字符串，或 timeout / connection_error / stream_error / job_failed
+        self.ttfb = ttfb
+        self.cache_hit = cache_hit
+
+    @property
+    def ok(self):
+        return self.outcome == "200"
+
+    @property
+    def latency(self):
+        return self.end - self.scheduled
+
+
+def load_workload(path, image_dir, endpoint):
+    """读取工作负载文件（不指定时 image_dir 中每张图片一个模板），图片内容预先读入内存"""
+    base_dir = Path(image_dir or DEFAULT_IMAGE_DIR)
+    if path:
+        entries = []
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if not entry.get("images"):
+                    raise ValueError(f"{path}:{line_number} 缺少 images")
+                entries.append(entry)
+    else:
+        entries = [{"images": [p.name]} for p in sorted(base_dir.iterdir()) if p.suffix.lower() in IMAGE_SUFFIXES]
+        if not entries:
+            raise ValueError(f"{base_dir} 中没有图片")
+
+    images = {}
+    templates = []
+    for entry in entries:
+        entry_endpoint = entry.get("endpoint", endpoint)
+        if entry_endpoint not in ENDPOINTS:
+            raise ValueError(f"不支持的端点: {entry_endpoint}（可选 {' / '.join(ENDPOINTS)}）")
+        for image in entry["images"]:
+            if image not in images:
+                images[image] = (base_dir / image).read_bytes()
+        templates.append({
+            "name": entry.get("name") or "+".join(entry["images"]) + ("" if entry_endpoint == endpoint else f" {entry_endpoint}"),
+            "endpoint": entry_endpoint,
+            "images": entry["images"],
+            "form": {key: str(value) for key, value in (entry.get("form") or {}).items()},
+            "weight": float(entry.get("weight", 1)),
+        })
+    return templates, images
+
+
+class LoadClient:
+    """发送单个请求并记录结果；每个线程一个 requests.Session（复用连接）"""
+
+    def __init__(self, base_url, images, timeout, poll_interval):
+        self.base_url = base_url.rstrip("/")
+        self.images = images
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def files(self, template):
+        return [
+            ("image", (Path(name).name, self.images[name], mimetypes.guess_type(name)[0] or "application/octet-stream"))
+            for name in template["images"]
+        ]
+
+    def send(self, template, clock, scheduled):
+        start = clock()
+        ttfb, cache_hit = None, None
+        try:
+            url = self.base_url + template["endpoint"]
+            if template["endpoint"].endswith("/stream"):
+                outcome, ttfb = self.send_stream(url, template, clock, start)
+            elif template["endpoint"] == "/jobs":
+                outcome, cache_hit = self.send_job(url, template)
+            else:
+                response = self.session.post(url, files=self.files(template), data=template["form"],
+                                             timeout=self.timeout)
+                outcome = str(response.status_code)
+                if response.status_code == 200:
+                    cache_hit = response.json().get("cache_hit")
+        except requests.Timeout:
+            outcome = "timeout"
+        except requests.RequestException:
+            outcome = "connection_error"
+        return Sample(template["name"], scheduled, start, clock(), outcome, ttfb, cache_hit)
+
+    def send_stream(self, url, template, clock, start):
+        """读完事件流；返回 (结果, 首字节时间)，流中出现 error 事件时为 stream_error"""
+        with self.session.post(url, files=self.files(template), data=template["form"], timeout=self.timeout,
+                               stream=True) as response:
+            if response.status_code != 200:
+                return str(response.status_code), None
+            ttfb, outcome = None, "stream_error"
+            for line in response.iter_lines(decode_unicode=True):
+                if ttfb is None:
+                    ttfb = clock() - start
+                if line == "event: error":
+                    outcome = "stream_error"
+                    break
+                if line == "event: done":
+                    outcome = "200"
+            return outcome, ttfb
+
+    def send_job(self, url, template):
+        """提交任务后轮询到结束；返回 (结果, cache_hit)"""
+        response = self.session.post(url, files=self.files(template), data=template["form"], timeout=self.timeout)
+        if response.status_code != 202:
+            return str(response.status_code), None
+        status_url = self.base_url + response.json()["status_url"]
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            job = self.session.get(status_url, timeout=self.timeout).json()
+            if job["status"] == "succeeded":
+                return "200", (job.get("result") or {}).get("cache_hit")
+            if job["status"] == "failed":
+                return "job_failed", None
+        return "timeout", None
+
+
+def run_closed_loop(client, templates, profile, max_requests, rng, clock, progress):
+    """闭环：第i个虚拟用户在目标并发数大于i时循环发送请求"""
+    samples = []
+    lock = threading.Lock()
+    sent = [0]
+    users = max(1, int(round(profile.peak())))
+
+    def next_template():
+        with lock:
+            if max_requests and sent[0] >= max_requests:
+                return None
+            sent[0] += 1
+            return rng.choices(templates, weights=[t["weight"] for t in templates])[0]
+
+    def user(index):
+        while True:
+            now = clock()
+            if now >= profile.duration:
+                return
+            if index >= round(profile.value_at(now)):
+                time.sleep(0.05)
+                continue
+            template = next_template()
+            if template is None:
+                return
+            sample = client.send(template, clock, clock())
+            with lock:
+                samples.append(sample)
+            progress.record(sample)
+
+    threads = [threading.Thread(target=user, args=(index,), daemon=True) for index in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, sent[0], 0
+
+
+def run_open_loop(client, templates, profile, max_requests, rng, clock, progress, arrival, max_in_flight):
+    """开环：按目标速率生成到达时间，在途请求达到上限时不再发送（计为未发送）"""
+    samples = []
+    lock = threading.Lock()
+    in_flight = [0]
+    sent = skipped = 0
+
+    def execute(template, scheduled):
+        sample = client.send(template, clock, scheduled)
+        with lock:
+            samples.append(sample)
+            in_flight[0] -= 1
+        progress.record(sample)
+
+    weights = [t["weight"] for t in templates]
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        scheduled = 0.0
+        while scheduled < profile.duration and not (max_requests and sent + skipped >= max_requests):
+            rate = profile.value_at(scheduled)
+            if rate <= 0:
+                scheduled += 0.05
+                continue
+            delay = scheduled - clock()
+            if delay > 0:
+                time.sleep(delay)
+            template = rng.choices(templates, weights=weights)[0]
+            with lock:
+                saturated = in_flight[0] >= max_in_flight
+                if not saturated:
+                    in_flight[0] += 1
+            if saturated:
+                skipped += 1
+            else:
+                sent += 1
+                pool.submit(execute, template, scheduled)
+            scheduled += rng.expovariate(rate) if arrival == "poisson" else 1 / rate
+    return samples, sent, skipped
+
+
+class Progress:
+    """每 interval 秒在stderr输出一行：已完成、错误数、该时间段的p50"""
+
+    def __init__(self, interval, clock):
+        self.interval = interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.window = []
+        self.completed = 0
+        self.errors = 0
+        self.stopped = threading.Event()
+
+    def record(self, sample):
+        with self.lock:
+            self.window.append(sample.latency)
+            self.completed += 1
+            self.errors += not sample.ok
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                window, self.window = sorted(self.window), []
+                completed, errors = self.completed, self.errors
+            print(f"[{self.clock():7.1f}s] 完成 {completed}，错误 {errors}，本时段 {len(window) / self.interval:.2f} 请求/秒，"
+                  f"p50 {percentile(window, 50):.2f}s", file=sys.stderr)
+
+    def start(self):
+        if self.interval > 0:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def summarize(samples, elapsed):
+    """一组请求的统计：数量、吞吐量（成功请求/秒）、错误率、延迟分位数（秒）"""
+    latencies = sorted(sample.latency for sample in samples if sample.ok)
+    ttfbs = sorted(sample.ttfb for sample in samples if sample.ok and sample.ttfb is not None)
+    cache_hits = [sample.cache_hit for sample in samples if sample.cache_hit is not None]
+    errors = sum(1 for sample in samples if not sample.ok)
+    summary = {
+        "requests": len(samples),
+        "succeeded": len(latencies),
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency": {
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 50) if latencies else None,
+            "p95": percentile(latencies, 95) if latencies else None,
+            "p99": percentile(latencies, 99) if latencies else None,
+            "max": latencies[-1] if latencies else None,
+        },
+        "outcomes": dict(Counter(sample.outcome for sample in samples)),
+    }
+    if ttfbs:
+        summary["ttfb"] = {"p50": percentile(ttfbs, 50), "p95": percentile(ttfbs, 95), "p99": percentile(ttfbs, 99)}
+    if cache_hits:
+        summary["cache_hit_rate"] = sum(cache_hits) / len(cache_hits)
+    return summary
+
+
+def build_report(samples, elapsed, sent, skipped, interval, config):
+    """总体、按请求模板和按时间段（以计划发送时间划分）的统计"""
+    by_name = defaultdict(list)
+    for sample in samples:
+        by_name[sample.name].append(sample)
+    windows = []
+    if interval > 0:
+        by_window = defaultdict(list)
+        for sample in samples:
+            by_window[int(sample.scheduled // interval)].append(sample)
+        for index in sorted(by_window):
+            window_end = min((index + 1) * interval, elapsed)
+            windows.append(dict(start=index * interval, **summarize(by_window[index], window_end - index * interval)))
+    return {
+        "config": config,
+        "elapsed": elapsed,
+        "sent": sent,
+        "skipped": skipped,
+        "overall": summarize(samples, elapsed),
+        "by_name": {name: summarize(group, elapsed) for name, group in sorted(by_name.items())},
+        "windows": windows,
+    }
+
+
+def format_seconds(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def print_report(report):
+    overall = report["overall"]
+    config = report["config"]
+    print(f"\n模式 {config['mode']}，负载曲线 {config['profile']}，耗时 {report['elapsed']:.1f}s，"
+          f"发送 {report['sent']}，未发送 {report['skipped']}")
+    print(f"吞吐量 {overall['throughput']:.2f} 请求/秒，错误率 {overall['error_rate']:.2%}，结果 {overall['outcomes']}"
+          + (f"，缓存命中率 {overall['cache_hit_rate']:.2%}" if "cache_hit_rate" in overall else ""))
+    if "ttfb" in overall:
+        print(f"首字节时间 p50 {overall['ttfb']['p50']:.2f}s，p95 {overall['ttfb']['p95']:.2f}s，"
+              f"p99 {overall['ttfb']['p99']:.2f}s")
+
+    header = f"{'请求/秒':>10}{'错误率':>9}{'p50(秒)':>10}{'p95(秒)':>10}{'p99(秒)':>10}{'最大(秒)':>10}"
+
+    def row(summary):
+        latency = summary["latency"]
+        return (f"{summary['throughput']:>10.2f}{summary['error_rate']:>9.1%}{format_seconds(latency['p50']):>10}"
+                f"{format_seconds(latency['p95']):>10}{format_seconds(latency['p99']):>10}"
+                f"{format_seconds(latency['max']):>10}")
+
+    print(f"\n{'':<40}{'请求数':>8}{header}")
+    print(f"{'总计':<40}{overall['requests']:>8}{row(overall)}")
+    for name, summary in report["by_name"].items():
+        print(f"{name[:40]:<40}{summary['requests']:>8}{row(summary)}")
+    if report["windows"]:
+        print(f"\n{'时间段':<12}{'请求数':>8}{header}")
+        for window in report["windows"]:
+            print(f"{window['start']:>6.0f}s{'':<5}{window['requests']:>8}{row(window)}")
+
+
+def spawn_servers(args, workdir):
+    """启动模拟OpenAI接口和服务器，返回 (服务器地址, 进程列表)"""
+    processes = []
+    mock_port = get_free_port()
+    processes.append(start_process([
+        sys.executable, str(SERVER_DIR / "mock_openai_server.py"), "--port", str(mock_port),
+        "--latency", str(args.mock_latency), "--latency-distribution", args.mock_latency_distribution,
+        "--latency-sigma", str(args.mock_latency_sigma), "--token-interval", str(args.mock_token_interval),
+        "--error-rate", str(args.mock_error_rate), "--error-status", *map(str, args.mock_error_status),
+        *(["--retry-after", str(args.mock_retry_after)] if args.mock_retry_after is not None else []),
+    ], os.environ.copy(), workdir))
+    wait_until_healthy(f"http://127.0.0.1:{mock_port}/v1/models")
+    port = get_free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(SERVER_DIR),
+        OPENROUTER_API_KEY="mock",
+        OPENROUTER_API_BASE=f"http://127.0.0.1:{mock_port}/v1",
+        ENABLE_CACHE="true" if args.cache else "false",
+    )
+    processes.append(start_process(server_command(args.spawn, port, args.flask_workers), env, workdir))
+    wait_until_healthy(f"http://127.0.0.1:{port}/health", timeout=60)
+    return f"http://127.0.0.1:{port}", processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按工作负载重放请求的负载测试")
+    parser.add_argument("--url", default="http://127.0.0.1:80", help="服务器地址（--spawn 时忽略）")
+    parser.add_argument("--workload", help="工作负载文件（JSONL）；不指定时 --image-dir 中每张图片一个请求模板")
+    parser.add_argument("--image-dir", help=f"图片目录（默认 {DEFAULT_IMAGE_DIR}）")
+    parser.add_argument("--endpoint", default="/analyze_medical_report", choices=ENDPOINTS,
+                        help="工作负载中未指定 endpoint 时使用的端点")
+    parser.add_argument("--mode", default="closed", choices=["closed", "open"])
+    parser.add_argument("--concurrency", type=float, default=8, help="闭环模式的并发用户数")
+    parser.add_argument("--rate", type=float, default=1.0, help="开环模式的到达速率（请求/秒）")
+    parser.add_argument("--arrival", default="poisson", choices=["poisson", "uniform"], help="开环模式的到达间隔分布")
+    parser.add_argument("--profile", help="分阶段负载曲线，如 30:1-8,60:8（覆盖 --concurrency/--rate 和 --duration）")
+    parser.add_argument("--duration", type=float, help="测试时长（秒，默认30；只指定 --requests 时不限时长）")
+    parser.add_argument("--requests", type=int, default=0, help="最多发送的请求数（0为不限）")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="开环模式的最大在途请求数")
+    parser.add_argument("--timeout", type=float, default=900, help="单个请求的超时（秒）")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="/jobs 的轮询间隔（秒）")
+    parser.add_argument("--interval", type=float, default=10, help="按时间段统计和输出进度的间隔（秒，0为不统计）")
+    parser.add_argument("--seed", type=int, default=0, help="请求选择和到达间隔的随机种子")
+    parser.add_argument("--output", help="把完整报告写入JSON文件")
+    spawn = parser.add_argument_group("本地启动（--spawn）")
+    spawn.add_argument("--spawn", choices=["flask", "async"], help="启动模拟上游和服务器后测试")
+    spawn.add_argument("--flask-workers", type=int, default=4, help="gunicorn同步工作进程数")
+    spawn.add_argument("--cache", action="store_true", help="启用服务器缓存（默认关闭）")
+    spawn.add_argument("--mock-latency", type=float, default=2.0, help="模拟上游的首token延迟均值（秒）")
+    spawn.add_argument("--mock-latency-distribution", default="fixed",
+                       choices=["fixed", "uniform", "exponential", "lognormal"])
+    spawn.add_argument("--mock-latency-sigma", type=float, default=0.5)
+    spawn.add_argument("--mock-token-interval", type=float, default=0.0)
+    spawn.add_argument("--mock-error-rate", type=float, default=0.0, help="模拟上游立即返回错误的比例")
+    spawn.add_argument("--mock-error-status", type=int, nargs="+", default=[503])
+    spawn.add_argument("--mock-retry-after", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile = LoadProfile.parse(args.profile)
+    else:
+        duration = args.duration or (float("inf") if args.requests else 30.0)
+        profile = LoadProfile.constant(args.concurrency if args.mode == "closed" else args.rate, duration)
+    templates, images = load_workload(args.workload, args.image_dir, args.endpoint)
+    rng = random.Random(args.seed)
+    config = {key: value for key, value in vars(args).items() if value is not None}
+    config["profile"] = profile.describe()
+
+    processes = []
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    try:
+        url = args.url
+        if args.spawn:
+            url, processes = spawn_servers(args, workdir)
+        client = LoadClient(url, images, args.timeout, args.poll_interval)
+        print(f"{len(templates)} 个请求模板，目标 {url}，模式 {args.mode}，负载曲线 {profile.describe()}", file=sys.stderr)
+
+        started = time.perf_counter()
+
+        def clock():
+            return time.perf_counter() - started
+
+        progress = Progress(args.interval, clock)
+        progress.start()
+        if args.mode == "closed":
+            samples, sent, skipped = run_closed_loop(client, templates, profile, args.requests, rng, clock, progress)
+        else:
+            samples, sent, skipped = run_open_loop(client, templates, profile, args.requests, rng, clock, progress,
+                                                   args.arrival, args.max_in_flight)
+        elapsed = clock()
+        progress.stop()
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    report = build_report(samples, elapsed, sent, skipped, args.interval, config)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
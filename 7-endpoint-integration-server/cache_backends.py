@@ -0,0 +1,225 @@
+"""
+缓存后端：进程内LRU、SQLite磁盘缓存、Redis兼容缓存
+
+所有后端实现相同的 get / set 接口，值为可JSON序列化的对象。
+磁盘和Redis后端可在多个gunicorn工作进程之间共享缓存结果，且在重启后保留。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend:
+    """缓存后端接口"""
+    name = "base"
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """
+    进程内LRU缓存（带TTL），仅在当前工作进程内有效
+    """
+    name = "memory"
+
+    def __init__(self, max_size=1000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache = OrderedDict()
+        self.timestamps = {}
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.cache:
+                return None
+            # 检查是否过期
+            if time() - self.timestamps[key] > self.ttl:
+                del self.cache[key]
+                del self.timestamps[key]
+                return None
+            # 移动到末尾（最近使用）
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+    def set(self, key, value):
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+            else:
+                if len(self.cache) >= self.max_size:
+                    # 删除最旧的项
+                    oldest_key = next(iter(self.cache))
+                    del self.cache[oldest_key]
+                    del self.timestamps[oldest_key]
+            self.cache[key] = value
+            self.timestamps[key] = time()
+
+    def delete(self, key):
+        with self.lock:
+            self.cache.pop(key, None)
+            self.timestamps.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.timestamps.clear()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    SQLite磁盘缓存（WAL模式，多进程共享）
+    支持TTL过期，以及按条目数和总字节数的LRU淘汰
+    """
+    name = "sqlite"
+
+    def __init__(self, path, max_size=10000, ttl=3600, max_bytes=0):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes  # 0 表示不限制总字节数
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+
+    def _connect(self):
+        # sqlite3连接不能跨线程共享，每个线程维护自己的连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        now = time()
+        if now - created_at > self.ttl:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode('utf-8'))
+        now = time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now)
+            )
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn, now):
+        """删除过期条目，再按最近访问时间淘汰超出条目数或字节数限制的条目"""
+        conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+        count, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if count > self.max_size:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_size,)
+            )
+        if self.max_bytes and total_bytes > self.max_bytes:
+            excess = total_bytes - self.max_bytes
+            freed = 0
+            victims = []
+            for victim_key, victim_size in conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+                victims.append((victim_key,))
+                freed += victim_size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Redis兼容缓存（TTL由Redis的过期机制处理，容量淘汰由服务端maxmemory策略负责）
+    可传入任意实现了 get / set / delete 的客户端（如本地测试用的fakeredis）
+    """
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", ttl=3600, prefix="medical_report:", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("使用Redis缓存后端需要安装redis包: pip install redis")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        if data is None:
+            return None
+        return json.loads(data)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def create_cache_backend(backend, ttl=3600, max_size=1000, sqlite_path="cache/medical_cache.sqlite3",
+                         max_bytes=0, redis_url="redis://localhost:6379/0") -> CacheBackend:
+    """
+    根据名称创建缓存后端：memory / sqlite / redis
+    """
+    backend = backend.lower()
+    if backend == "memory":
+        return LRUCache(max_size=max_size, ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteCacheBackend(sqlite_path, max_size=max_size, ttl=ttl, max_bytes=max_bytes)
+    if backend == "redis":
+        return RedisCacheBackend(redis_url, ttl=ttl)
+    raise ValueError(f"不支持的缓存后端: {backend}。支持的后端: memory, sqlite, redis")
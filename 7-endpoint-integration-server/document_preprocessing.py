@@ -0,0 +1,178 @@
+"""
+化验单图片预处理（服务器和 6-fine-tuning-vl 下的批处理脚本共用）
+
+化验单照片大部分是白纸和黑色文字，直接发送彩色大图会浪费上传字节和视觉token。预处理档位：
+- none：不处理（默认）
+- document：按EXIF方向旋转 → 裁掉空白边距 → 灰度 → 按文字行高选择分辨率（对齐28像素视觉patch）→ 灰度JPEG
+- binary：在document基础上做自适应二值化（局部均值阈值），输出1位PNG
+
+只依赖Pillow。
+"""
+import io
+import math
+from statistics import median
+from typing import Optional, Tuple, Union
+
+from PIL import Image, ImageChops, ImageFilter, ImageOps
+
+PREPROCESS_PROFILES = ("none", "document", "binary")
+
+EXIF_ORIENTATION_TAG = 0x0112
+VISION_PATCH_SIZE = 28  # Qwen2.5-VL：14像素patch，2x2合并后每28x28像素对应一个视觉token
+ANALYSIS_SIZE = 1000  # 分析版面（边距、行高）时使用的缩略图最长边
+INK_BLUR_RADIUS = 8  # 版面分析时估计局部背景亮度的均值滤波半径（缩略图像素）
+INK_CONTRAST = 25  # 比局部背景暗该值以上的像素视为文字/线条
+MAX_LINE_HEIGHT_RATIO = 0.05  # 估计的行高超过图片高度的该比例时视为估计失败（不按行高缩放）
+MIN_INK_RATIO = 0.002  # 行/列中文字像素占比超过该值才视为有内容（忽略扫描噪点）
+CROP_PADDING = 0.03  # 裁剪后保留的边距（占原图尺寸的比例）
+
+
+def normalize_profile(profile: Optional[str], default: str = "none") -> str:
+    """校验预处理档位名称"""
+    profile = (profile or default).strip().lower()
+    if profile not in PREPROCESS_PROFILES:
+        raise ValueError(f"不支持的预处理档位: {profile}。支持的档位: {', '.join(PREPROCESS_PROFILES)}")
+    return profile
+
+
+def _ink_profile(ink: Image.Image, axis: str) -> list:
+    """每行（axis='rows'）或每列的文字像素占比（用BOX缩放求均值，避免逐像素遍历）"""
+    width, height = ink.size
+    size = (1, height) if axis == "rows" else (width, 1)
+    return [value / 255 for value in ink.resize(size, Image.Resampling.BOX).getdata()]
+
+
+def _content_span(profile: list) -> Optional[Tuple[int, int]]:
+    rows = [index for index, ratio in enumerate(profile) if ratio > MIN_INK_RATIO]
+    if not rows:
+        return None
+    return rows[0], rows[-1] + 1
+
+
+def _text_line_height(row_profile: list) -> Optional[float]:
+    """估计文字行高：连续有内容的行组成一行文字，取高度中位数（忽略表格横线等1像素高的行）"""
+    heights, run = [], 0
+    for ratio in row_profile + [0.0]:
+        if ratio > MIN_INK_RATIO:
+            run += 1
+        elif run:
+            if run >= 2:
+                heights.append(run)
+            run = 0
+    return median(heights) if heights else None
+
+
+def analyze_layout(gray: Image.Image) -> dict:
+    """
+    在缩略图上分析版面：内容区域（原图坐标）和文字行高（原图像素）
+    """
+    scale = min(1.0, ANALYSIS_SIZE / max(gray.size))
+    small = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))), Image.Resampling.BOX) \
+        if scale < 1 else gray
+    # 文字像素：比局部均值明显更暗（手机拍摄的阴影和纸张底色不会被当作内容）
+    darkness = ImageChops.subtract(small.filter(ImageFilter.BoxBlur(INK_BLUR_RADIUS)), small)
+    ink = darkness.point(lambda value: 255 if value > INK_CONTRAST else 0)
+    row_profile = _ink_profile(ink, "rows")
+    rows = _content_span(row_profile)
+    columns = _content_span(_ink_profile(ink, "columns"))
+    box = None
+    if rows and columns:
+        pad_x, pad_y = gray.width * CROP_PADDING, gray.height * CROP_PADDING
+        box = (
+            max(0, int(columns[0] / scale - pad_x)),
+            max(0, int(rows[0] / scale - pad_y)),
+            min(gray.width, int(math.ceil(columns[1] / scale + pad_x))),
+            min(gray.height, int(math.ceil(rows[1] / scale + pad_y))),
+        )
+    line_height = _text_line_height(row_profile[rows[0]:rows[1]] if rows else row_profile)
+    if line_height and line_height > small.height * MAX_LINE_HEIGHT_RATIO:
+        line_height = None
+    return {"box": box, "text_height": line_height / scale if line_height else None}
+
+
+def choose_target_size(width, height, max_size, text_height=None, target_text_height=24,
+                       min_size=448, max_pixels=None) -> Tuple[int, int]:
+    """
+    根据文字行高选择分辨率：缩放到文字行高约为target_text_height像素（不放大），
+    最长边限制在 [min_size, max_size]，总像素不超过max_pixels，
+    宽高对齐到28像素（视觉patch边界），避免模型端再次缩放
+    """
+    scale = min(1.0, max_size / max(width, height))
+    if max_pixels:
+        scale = min(scale, math.sqrt(max_pixels / (width * height)))
+    if text_height:
+        scale = min(scale, target_text_height / text_height)
+    scale = max(scale, min(1.0, min_size / max(width, height)))
+    return (
+        max(VISION_PATCH_SIZE, int(width * scale) // VISION_PATCH_SIZE * VISION_PATCH_SIZE),
+        max(VISION_PATCH_SIZE, int(height * scale) // VISION_PATCH_SIZE * VISION_PATCH_SIZE),
+    )
+
+
+def adaptive_binarize(gray: Image.Image, radius=15, offset=12) -> Image.Image:
+    """自适应二值化：比局部均值暗offset以上的像素为黑色，可消除光照不均和纸张底色"""
+    background = gray.filter(ImageFilter.BoxBlur(radius))
+    darkness = ImageChops.subtract(background, gray)
+    return darkness.point(lambda value: 0 if value > offset else 255).convert("1", dither=Image.Dither.NONE)
+
+
+def preprocess_document(image: Image.Image, profile="document", max_size=1280, target_text_height=24,
+                        min_size=448) -> Tuple[Image.Image, dict]:
+    """
+    按档位预处理化验单图片
+    :return: (处理后的图片, 处理信息：裁剪区域、估计的文字行高、输出尺寸)
+    """
+    if image.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+    gray = image.convert("L")
+    # 像素总数不超过不做预处理时（整图缩放到max_size）的输出，保证视觉token不会增加
+    full_scale = min(1.0, max_size / max(gray.size))
+    max_pixels = gray.width * gray.height * full_scale * full_scale
+    layout = analyze_layout(gray)
+    if layout["box"]:
+        gray = gray.crop(layout["box"])
+    target_size = choose_target_size(gray.width, gray.height, max_size, layout["text_height"],
+                                     target_text_height, min_size, max_pixels)
+    if gray.size != target_size:
+        gray = gray.resize(target_size, Image.Resampling.LANCZOS)
+    processed = adaptive_binarize(gray) if profile == "binary" else gray
+    return processed, dict(layout, size=processed.size)
+
+
+def encode_document_image(image: Image.Image, quality=85) -> Tuple[bytes, str]:
+    """
+    编码预处理结果：二值图像用PNG（无损且体积最小），灰度图像用JPEG
+    :return: (文件字节, MIME类型)
+    """
+    buffer = io.BytesIO()
+    if image.mode == "1":
+        image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue(), "image/png"
+    image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def image_mime_type(base64_data: Union[str, bytes]) -> str:
+    """根据base64数据开头的文件签名判断图片类型（PNG签名的base64以 iVBORw0KGgo 开头）"""
+    prefix = base64_data[:11]
+    if isinstance(prefix, str):
+        prefix = prefix.encode("ascii")
+    return "image/png" if prefix == b"iVBORw0KGgo" else "image/jpeg"
+
+
+def estimate_vision_tokens(width, height, min_pixels=4 * 28 * 28, max_pixels=16384 * 28 * 28) -> int:
+    """
+    估算Qwen2.5-VL的视觉token数（与其图片处理器的smart_resize一致：宽高取整到28的倍数并限制总像素）
+    """
+    factor = VISION_PATCH_SIZE
+    resized_height = max(factor, round(height / factor) * factor)
+    resized_width = max(factor, round(width / factor) * factor)
+    if resized_height * resized_width > max_pixels:
+        beta = math.sqrt(height * width / max_pixels)
+        resized_height = math.floor(height / beta / factor) * factor
+        resized_width = math.floor(width / beta / factor) * factor
+    elif resized_height * resized_width < min_pixels:
+        beta = math.sqrt(min_pixels / (height * width))
+        resized_height = math.ceil(height * beta / factor) * factor
+        resized_width = math.ceil(width * beta / factor) * factor
+    return (resized_height // factor) * (resized_width // factor)
@@ -0,0 +1,242 @@
+"""
+模型端点注册表：为每个处理阶段（vl：分析报告图片，llm：生成健康建议）登记多个OpenAI兼容端点
+（如自建vLLM和OpenRouter），按健康状态和观测延迟选择端点，并为每个端点维护熔断器和延迟直方图。
+
+- 熔断器：连续失败（含超过延迟SLO）达到阈值后打开，打开期间直接跳过该端点，不再等待注定超时的请求；
+  经过恢复时间（或健康探测成功）后进入半开状态，放行一个试探请求，成功则关闭
+- 路由：fastest 按延迟滑动平均从快到慢排序（没有样本的端点按登记顺序排在有样本的端点之后，作为后备），priority 按登记顺序
+- 健康探测：后台线程定期请求各端点的 /models
+"""
+import threading
+from bisect import bisect_left
+from time import monotonic, sleep, time
+from typing import Optional
+
+import requests
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, recovery_time=30.0, latency_slo=None):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.latency_slo = latency_slo  # 超过该延迟的成功请求也计为一次失败（None表示不限制）
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    def available(self) -> bool:
+        """只查看状态、不占用半开试探名额（用于预先筛选候选端点）"""
+        with self.lock:
+            if self.state == OPEN:
+                return monotonic() - self.opened_at >= self.recovery_time
+            return self.state == CLOSED or not self.trial_in_flight
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.state == OPEN and monotonic() - self.opened_at >= self.recovery_time:
+                self.state = HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency=None):
+        if self.latency_slo is not None and latency is not None and latency > self.latency_slo:
+            self.record_failure()
+            return
+        with self.lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = monotonic()
+
+    def release(self):
+        """获准的请求未实际发出（如被本地准入控制拒绝）时归还半开试探名额"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def probe_succeeded(self):
+        """健康探测成功：已打开的熔断器提前进入半开状态"""
+        with self.lock:
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+                self.trial_in_flight = False
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+            }
+
+
+class LatencyHistogram:
+    """延迟直方图（固定分桶，秒）以及用于路由的延迟滑动平均"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, ewma_alpha=0.3):
+        self.buckets = buckets
+        self.ewma_alpha = ewma_alpha
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.ewma = None
+
+    def observe(self, latency):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, latency)] += 1
+            self.total += latency
+            self.count += 1
+            self.ewma = latency if self.ewma is None else self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.ewma
+
+    def snapshot(self):
+        with self.lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {
+                "count": self.count,
+                "sum": round(self.total, 3),
+                "ewma": round(self.ewma, 3) if self.ewma is not None else None,
+                "buckets": buckets,
+            }
+
+
+class ModelEndpoint:
+    def __init__(self, name, stage, api_base, model, api_key=None, failure_threshold=3,
+                 recovery_time=30.0, latency_slo=None):
+        self.name = name
+        self.stage = stage
+        self.api_base = api_base.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.breaker = CircuitBreaker(failure_threshold, recovery_time, latency_slo)
+        self.latency = LatencyHistogram()
+        self.counters = {"success": 0, "failure": 0}
+        self.last_probe = None
+
+    @property
+    def chat_url(self):
+        return f"{self.api_base}/chat/completions"
+
+    def headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def record_success(self, latency):
+        self.counters["success"] += 1
+        self.latency.observe(latency)
+        self.breaker.record_success(latency)
+
+    def record_failure(self):
+        self.counters["failure"] += 1
+        self.breaker.record_failure()
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "api_base": self.api_base,
+            "model": self.model,
+            "circuit": self.breaker.snapshot(),
+            "requests": dict(self.counters),
+            "latency": self.latency.snapshot(),
+            "last_probe": self.last_probe,
+        }
+
+
+class EndpointRegistry:
+    def __init__(self, routing="fastest"):
+        self.routing = routing
+        self.endpoints = {}
+        self.probe_thread: Optional[threading.Thread] = None
+
+    def register(self, endpoint: ModelEndpoint):
+        self.endpoints.setdefault(endpoint.stage, []).append(endpoint)
+
+    def ordered(self, stage):
+        """按路由策略排序的全部端点（不考虑熔断状态）"""
+        endpoints = list(self.endpoints.get(stage, []))
+        if self.routing == "fastest":
+            # 已测得延迟的端点在前；sorted是稳定排序，延迟相同或没有样本时保持登记顺序
+            endpoints.sort(key=lambda e: (e.latency.ewma is None, e.latency.ewma or 0.0))
+        return endpoints
+
+    def candidates(self, stage):
+        """
+        本次请求可尝试的端点（跳过熔断器打开的端点）；使用前仍需调用 breaker.allow_request()，
+        这样只有前一个端点失败、需要故障转移时才占用下一个端点的半开试探名额
+        """
+        return [endpoint for endpoint in self.ordered(stage) if endpoint.breaker.available()]
+
+    def models(self, stage):
+        """该阶段登记的全部模型（用于缓存指纹，端点配置变化时旧缓存失效）"""
+        return ",".join(endpoint.model for endpoint in self.endpoints.get(stage, []))
+
+    def probe(self, timeout=5):
+        """对所有端点执行一次健康探测（GET /models）"""
+        for endpoints in self.endpoints.values():
+            for endpoint in endpoints:
+                start_time = time()
+                try:
+                    response = requests.get(f"{endpoint.api_base}/models", headers=endpoint.headers(), timeout=timeout)
+                    healthy = response.status_code == 200
+                    detail = f"状态码 {response.status_code}"
+                except requests.exceptions.RequestException as e:
+                    healthy, detail = False, str(e)
+                endpoint.last_probe = {
+                    "healthy": healthy,
+                    "latency": round(time() - start_time, 3),
+                    "checked_at": start_time,
+                    "detail": detail[:200],
+                }
+                if healthy:
+                    endpoint.breaker.probe_succeeded()
+                else:
+                    endpoint.breaker.record_failure()
+
+    def start_health_probes(self, interval, timeout=5):
+        """启动后台健康探测线程（每个进程一个）"""
+        if interval <= 0 or self.probe_thread is not None:
+            return
+
+        def run():
+            while True:
+                sleep(interval)
+                self.probe(timeout)
+
+        self.probe_thread = threading.Thread(target=run, name="endpoint-health-probe", daemon=True)
+        self.probe_thread.start()
+
+    def snapshot(self):
+        return {
+            "routing": self.routing,
+            "stages": {
+                stage: [endpoint.snapshot() for endpoint in self.ordered(stage)]
+                for stage in self.endpoints
+            },
+        }
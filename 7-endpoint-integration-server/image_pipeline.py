@@ -0,0 +1,181 @@
+"""
+图片处理流水线：解码 → 像素摘要 → 缩放（或化验单预处理）→ 编码 → base64
+
+只依赖Pillow和 document_preprocessing，不导入服务器模块，因此既可以在请求线程中调用，
+也可以在图片处理工作进程（image_workers.py）中调用；配置通过参数传入。
+"""
+import base64
+import hashlib
+import io
+import logging
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from document_preprocessing import encode_document_image, preprocess_document
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)  # 按这些EXIF方向旋转后宽高互换
+DIGEST_STRIP_ROWS = 256  # 计算像素摘要时每段的行数
+
+
+def compute_target_size(width, height, max_size) -> Optional[Tuple[int, int]]:
+    """计算保持宽高比的目标尺寸；不需要缩小时返回None"""
+    if width <= max_size and height <= max_size:
+        return None
+    if width > height:
+        new_width = min(width, max_size)
+        new_height = int(height * (new_width / width))
+    else:
+        new_height = min(height, max_size)
+        new_width = int(width * (new_height / height))
+    return new_width, new_height
+
+
+def apply_jpeg_draft(image, max_size, enabled=True):
+    """
+    大尺寸JPEG在解码前设置draft模式：解码器在DCT域直接按1/2、1/4或1/8降采样（不小于目标尺寸），
+    避免完整解码几千像素的手机照片；必须在图片加载前调用（Image.open只读取了文件头）
+    """
+    if not enabled or image.format != 'JPEG':
+        return
+    target_size = compute_target_size(image.width, image.height, max_size)
+    if target_size is not None:
+        image.draft(None, target_size)
+
+
+def exif_orientation(image) -> int:
+    """EXIF方向（没有EXIF或没有方向标记时为1，即无需旋转）"""
+    return image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+
+
+def is_compliant_jpeg(image, max_size) -> bool:
+    """是否可以不重新编码直接发送：尺寸不超过限制、无需按EXIF方向旋转的RGB/灰度JPEG"""
+    return (image.format == 'JPEG' and image.mode in ('RGB', 'L') and max(image.size) <= max_size
+            and exif_orientation(image) == 1)
+
+
+def resize_decoded_image(image, max_size, original_size=None) -> Optional[io.BytesIO]:
+    """
+    将已打开的图片缩放并编码为JPEG；图片已经是符合要求的JPEG时返回None（由调用方直接使用原始文件）
+    :param original_size: 应用draft模式之前的原始尺寸（用于计算目标尺寸和压缩质量）
+    """
+    width, height = original_size or image.size
+    target_size = compute_target_size(width, height, max_size)
+    if target_size is None and is_compliant_jpeg(image, max_size):
+        return None
+    # 重新编码的JPEG不保留EXIF，先按EXIF方向旋转，否则模型收到的是横躺或倒置的报告
+    orientation = exif_orientation(image)
+    if orientation != 1:
+        image = ImageOps.exif_transpose(image)
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+            target_size = compute_target_size(width, height, max_size)
+    new_width, new_height = target_size or (width, height)
+
+    # 使用高质量重采样（LANCZOS提供最佳质量）；draft模式已完成大部分降采样
+    resized_image = image
+    if image.size != (new_width, new_height):
+        resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    # 转换为RGB模式（如果不是的话），确保兼容性
+    if resized_image.mode != 'RGB':
+        resized_image = resized_image.convert('RGB')
+
+    # 优化图片压缩：根据图片大小动态调整质量，使用更高效的压缩
+    img_byte_arr = io.BytesIO()
+    # 对于较小的图片使用更高质量，大图片使用较低质量以节省带宽
+    # 使用渐进式JPEG和优化选项
+    quality = 92 if max(width, height) < 800 else 88
+    resized_image.save(
+        img_byte_arr,
+        format='JPEG',
+        quality=quality,
+        optimize=True,
+        progressive=True,  # 渐进式JPEG，加载更快
+        subsampling='4:2:0'  # 色度子采样，减小文件大小
+    )
+    img_byte_arr.seek(0)
+
+    if target_size is not None:
+        logger.info(f"图片已调整: {width}x{height} -> {new_width}x{new_height}")
+    else:
+        logger.info(f"图片已转换为JPEG: {image.format} {image.mode} {width}x{height}")
+    return img_byte_arr
+
+
+def compute_image_digest(image: Image.Image) -> str:
+    """
+    计算图片解码后归一化像素数据的SHA-256摘要
+    归一化：按EXIF方向旋转、统一转换为RGB，因此与文件格式、压缩参数和元数据无关
+    大尺寸JPEG启用draft模式时基于降采样解码的像素计算（同一文件的摘要始终相同）
+    """
+    # 无需旋转时不复制整张解码后的图片（exif_transpose总是返回副本）
+    if exif_orientation(image) != 1:
+        image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    hasher = hashlib.sha256(f"{image.width}x{image.height}".encode())
+    # 按行分段取像素数据，结果与整张图片tobytes()相同，但不会再复制出一份完整的像素缓冲区
+    for top in range(0, image.height, DIGEST_STRIP_ROWS):
+        hasher.update(image.crop((0, top, image.width, min(top + DIGEST_STRIP_ROWS, image.height))).tobytes())
+    return hasher.hexdigest()
+
+
+def process_image(image_source, max_size, profile="none", draft_mode=True, text_height=24,
+                  timings=None) -> Tuple[bytes, str]:
+    """
+    解码图片、计算像素摘要、调整大小（或按档位做化验单预处理）并编码为base64
+    :param image_source: 图片文件对象、bytes或已解码的图片（如PDF页面）
+    :param profile: 已校验的预处理档位（none/document/binary）
+    :param timings: 可选的dict，写入各步骤耗时（秒）：resize（解码、摘要和缩放或预处理）、encode（base64编码）
+    :return: (base64字节, 像素摘要)；启用预处理时摘要包含档位，不同档位的结果分别缓存
+    """
+    start_time = perf_counter()
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        image_source = io.BytesIO(image_source)
+    if isinstance(image_source, Image.Image):
+        opened_image = nullcontext(image_source)
+    else:
+        image_source.seek(0)
+        opened_image = Image.open(image_source)
+    # 只解码一次：像素摘要和缩放共用同一份解码结果
+    with opened_image as decoded_image:
+        # Image.open只读取文件头，此时已知尺寸和格式，可以在解码前决定是否使用draft模式
+        original_size = decoded_image.size
+        apply_jpeg_draft(decoded_image, max_size, draft_mode)
+        image_digest = compute_image_digest(decoded_image)
+        logger.info(f"图像像素摘要: {image_digest[:16]}")
+        if profile == "none":
+            logger.info("调整图像大小")
+            resized_data = resize_decoded_image(decoded_image, max_size, original_size)
+        else:
+            processed_image, info = preprocess_document(decoded_image, profile, max_size, text_height)
+            encoded, mime_type = encode_document_image(processed_image)
+            resized_data = io.BytesIO(encoded)
+            image_digest = hashlib.sha256(f"{image_digest}|preprocess={profile}".encode()).hexdigest()
+            logger.info(f"化验单预处理({profile}): {original_size[0]}x{original_size[1]} -> "
+                        f"{info['size'][0]}x{info['size'][1]}，裁剪区域: {info['box']}，"
+                        f"文字行高: {info['text_height'] or '未知'}，{mime_type} {len(encoded)} 字节")
+
+    # 编码为base64（直接读取缓冲区，保持为字节，后续原样拼入请求体）
+    encode_start = perf_counter()
+    logger.info("将图像编码为base64")
+    if resized_data is not None:
+        with resized_data.getbuffer() as image_bytes:
+            base64_image = base64.b64encode(image_bytes)
+    elif isinstance(image_source, io.BytesIO):
+        with image_source.getbuffer() as image_bytes:
+            base64_image = base64.b64encode(image_bytes)
+    else:
+        image_source.seek(0)
+        base64_image = base64.b64encode(image_source.read())
+    logger.info(f"图像已成功编码为base64，大小: {len(base64_image)} 字符")
+    if timings is not None:
+        timings["resize"] = encode_start - start_time
+        timings["encode"] = perf_counter() - encode_start
+    return base64_image, image_digest
@@ -0,0 +1,165 @@
+"""
+图片处理工作进程池
+
+PIL解码、LANCZOS缩放和JPEG优化编码是CPU密集操作，在请求线程中执行时多个并发上传会争用GIL，
+只能使用一个CPU核心。启用工作进程池（IMAGE_WORKERS > 0）后，image_pipeline.process_image 在独立进程中执行：
+
+- 输入通过共享内存传递：上传文件直接读入共享内存块，已解码的图片（如PDF页面）传递原始像素缓冲区，
+  不经过pickle和管道复制几MB的数据；工作进程处理完成后由主进程释放共享内存
+- 输出（base64字节，通常一两百KB）、像素摘要和各步骤耗时作为返回值传回
+- 工作进程在创建进程池时一次性fork（服务器模块导入期间，此时还没有启动其他线程），
+  不会在工作进程中重新导入服务器脚本；工作进程异常退出后下次使用时重新创建进程池
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Tuple
+
+from PIL import Image
+
+from image_pipeline import process_image
+
+logger = logging.getLogger(__name__)
+
+ENCODED = "encoded"  # 共享内存中是图片文件（JPEG/PNG等）的字节
+PIXELS = "pixels"  # 共享内存中是解码后的原始像素
+
+
+def _process_shared_image(shm_name, length, kind, mode, size, max_size, profile, draft_mode, text_height):
+    """在工作进程中执行：从共享内存读取输入并处理，返回 (base64字节, 像素摘要, 各步骤耗时)"""
+    shm = SharedMemory(name=shm_name)
+    timings = {}
+    try:
+        if kind == PIXELS:
+            image = Image.frombytes(mode, size, shm.buf[:length])
+            try:
+                return (*process_image(image, max_size, profile, draft_mode, text_height, timings), timings)
+            finally:
+                image.close()
+        # 复制一份文件字节再解码（解码器会在文件对象上多次seek/read，不直接引用共享内存，保证可以关闭）
+        return (*process_image(bytes(shm.buf[:length]), max_size, profile, draft_mode, text_height, timings), timings)
+    finally:
+        shm.close()
+
+
+def _copy_source_to_shared_memory(image_source) -> Tuple[SharedMemory, int, str, str, tuple]:
+    """把图片文件对象、bytes或已解码的图片复制到新建的共享内存块"""
+    mode, size = None, None
+    if isinstance(image_source, Image.Image):
+        if image_source.mode not in ("L", "RGB", "RGBA"):
+            # 调色板等模式的原始像素不包含完整信息，先转换为RGB（与摘要和编码时的转换一致）
+            image_source = image_source.convert("RGB")
+        kind, mode, size = PIXELS, image_source.mode, image_source.size
+        data = image_source.tobytes()
+    elif isinstance(image_source, (bytes, bytearray, memoryview)):
+        kind, data = ENCODED, image_source
+    else:
+        kind, data = ENCODED, None
+
+    if data is not None:
+        length = len(data)
+        shm = SharedMemory(create=True, size=max(1, length))
+        shm.buf[:length] = data
+        return shm, length, kind, mode, size
+
+    # 文件对象（如上传文件）：直接读入共享内存，不先读成bytes
+    image_source.seek(0, os.SEEK_END)
+    length = image_source.tell()
+    image_source.seek(0)
+    shm = SharedMemory(create=True, size=max(1, length))
+    try:
+        view = shm.buf[:length]
+        try:
+            read = 0
+            while read < length:
+                count = image_source.readinto(view[read:]) if hasattr(image_source, "readinto") \
+                    else _read_into(image_source, view[read:])
+                if not count:
+                    raise ValueError("读取图片文件时数据不完整")
+                read += count
+        finally:
+            view.release()
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, length, kind, mode, size
+
+
+def _read_into(stream, view) -> int:
+    chunk = stream.read(min(len(view), 1024 * 1024))
+    view[:len(chunk)] = chunk
+    return len(chunk)
+
+
+def _ready():
+    return os.getpid()
+
+
+class ImageWorkerPool:
+    """
+    图片处理工作进程池（每个服务器进程一个；不支持gunicorn --preload，
+    否则工作进程属于master进程，fork出的gunicorn worker无法使用）
+    """
+
+    def __init__(self, workers, max_size, draft_mode=True, text_height=24):
+        self.workers = workers
+        self.max_size = max_size
+        self.draft_mode = draft_mode
+        self.text_height = text_height
+        self.lock = threading.Lock()
+        self.executor = self._start()
+
+    def _start(self) -> ProcessPoolExecutor:
+        # 先启动共享内存的资源跟踪进程，工作进程继承同一个跟踪进程（否则各自启动的跟踪进程退出时会误删共享内存）
+        resource_tracker.ensure_running()
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+        # fork上下文在第一次提交任务时一次性启动全部工作进程
+        executor.submit(_ready).result()
+        logger.info(f"图片处理工作进程池已启动，进程数: {self.workers}")
+        return executor
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = self._start()
+            return self.executor
+
+    def _reset(self, broken_executor):
+        with self.lock:
+            if self.executor is broken_executor:
+                self.executor = None
+        broken_executor.shutdown(wait=False, cancel_futures=True)
+
+    def process(self, image_source, profile="none", timings=None) -> Tuple[bytes, str]:
+        """在工作进程中执行 process_image，参数和返回值相同"""
+        shm, length, kind, mode, size = _copy_source_to_shared_memory(image_source)
+        try:
+            executor = self._get_executor()
+            try:
+                base64_image, image_digest, worker_timings = executor.submit(
+                    _process_shared_image, shm.name, length, kind, mode, size,
+                    self.max_size, profile, self.draft_mode, self.text_height
+                ).result()
+                if timings is not None:
+                    timings.update(worker_timings)
+                return base64_image, image_digest
+            except BrokenProcessPool:
+                # 工作进程异常退出（如处理超大图片时内存不足），下次使用时重新创建进程池
+                logger.error("图片处理工作进程异常退出，重新创建进程池")
+                self._reset(executor)
+                raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
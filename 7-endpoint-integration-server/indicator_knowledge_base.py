@@ -0,0 +1,234 @@
+"""
+化验指标知识库（服务器的健康建议缓存和 6-fine-tuning-vl 下的批处理/统计脚本共用）
+
+指标数据保存在 indicator_knowledge_base.json，新增指标只需编辑该文件（或用环境变量 INDICATOR_KNOWLEDGE_BASE 指向其他文件）：
+- categories：报告类别（凝血功能、血型、乙肝五项、传染病筛查等）的名称和用于识别报告类型的关键词
+- indicators：每个指标的规范代码、中英文名称、所属类别、中英文别名、单位、参考范围（定量指标为 low/high，
+  定性指标为 reference_text）；expansions 是批处理脚本在中文结果中把英文缩写展开为"中文名（英文全称）"的映射
+
+别名查找：所有别名编译为一个按字典树（trie）嵌套的正则，公共前缀只比较一次，每个位置只沿一条路径向下匹配，
+扫描文本的代价与文本长度成正比，基本不随别名数量增长（数千个别名时也不需要在每个位置逐个尝试）。
+"""
+import json
+import os
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+KNOWLEDGE_BASE_FILE = os.getenv(
+    "INDICATOR_KNOWLEDGE_BASE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "indicator_knowledge_base.json")
+)  # 指标知识库文件
+CASE_INSENSITIVE_MIN_LENGTH = 5  # 达到该长度的英文别名（如 Fibrinogen）不区分大小写；英文缩写（如 PT、Hb）区分大小写
+
+ASCII_BOUNDARY = "ascii"  # 以英文字母/数字开头（结尾）的词条前（后）不能紧邻英文字母/数字，中文词条不限制
+WORD_BOUNDARY = "word"  # 词条前后都要求 \b（re 的单词边界，中文也视为单词字符）
+
+HIGH = "high"
+LOW = "low"
+NORMAL = "normal"
+
+
+class _TrieNode:
+    __slots__ = ("children", "chars", "terms")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.chars = set()  # 进入该节点的边可以匹配的字符（不区分大小写的词条同时接受大小写）
+        self.terms: List[Tuple[str, bool]] = []  # 在该节点结束的词条及是否不区分大小写
+
+
+def _trie_key(char: str) -> str:
+    return char.lower() if char.isascii() else char
+
+
+def _is_ascii_alnum(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+def _start_boundary(char: str, boundary: str) -> str:
+    if boundary == WORD_BOUNDARY:
+        return r"\b"
+    return r"(?<![A-Za-z0-9])" if _is_ascii_alnum(char) else ""
+
+
+def _end_boundary(char: str, boundary: str) -> str:
+    if boundary == WORD_BOUNDARY:
+        return r"\b"
+    return r"(?![A-Za-z0-9])" if _is_ascii_alnum(char) else ""
+
+
+def _edge_pattern(node: _TrieNode) -> str:
+    if len(node.chars) == 1:
+        return re.escape(next(iter(node.chars)))
+    return "[" + "".join(re.escape(char) for char in sorted(node.chars)) + "]"
+
+
+def _node_pattern(node: _TrieNode, key: str, exact: bool, boundary: str) -> str:
+    """
+    节点之后的正则：先尝试更长的词条（子节点），都不成立时再尝试在该节点结束的词条
+    :param exact: 从根到该节点的每条边都只匹配一个字符（匹配到的文字一定与词条完全相同）
+    """
+    alternatives = []
+    for child_key, child in node.children.items():
+        alternatives.append(
+            _edge_pattern(child) + _node_pattern(child, child_key, exact and len(child.chars) == 1, boundary)
+        )
+    if node.terms:
+        if exact or any(insensitive for _, insensitive in node.terms):
+            check = ""
+        else:
+            # 经过了同时接受大小写的边，区分大小写的词条需要核对原文
+            check = "(?:" + "|".join(f"(?<={re.escape(term)})" for term, _ in node.terms) + ")"
+        alternatives.append(check + _end_boundary(key, boundary))
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")"
+
+
+def compile_trie_pattern(terms: Iterable[str], boundary: str = ASCII_BOUNDARY,
+                         ignore_case: Optional[Callable[[str], bool]] = None) -> re.Pattern:
+    """
+    把词条编译为一个按字典树嵌套的正则，如 PT、PTT、APTT → \\bPT(?:T\\b|\\b)|\\bAPTT\\b（WORD_BOUNDARY时）
+    每个位置匹配最长的、边界条件成立的词条，与按长度从长到短排列的多选正则匹配结果相同
+    :param boundary: ASCII_BOUNDARY 或 WORD_BOUNDARY
+    :param ignore_case: 判断词条是否不区分大小写（只处理ASCII字母的大小写），默认都区分
+    """
+    if boundary not in (ASCII_BOUNDARY, WORD_BOUNDARY):
+        raise ValueError(f"不支持的边界类型: {boundary}")
+    root = _TrieNode()
+    for term in terms:
+        if not term:
+            continue
+        insensitive = bool(ignore_case and ignore_case(term))
+        node = root
+        for char in term:
+            node = node.children.setdefault(_trie_key(char), _TrieNode())
+            node.chars.update((char.lower(), char.upper()) if insensitive else (char,))
+        node.terms.append((term, insensitive))
+    if not root.children:
+        return re.compile(r"(?!)")
+    alternatives = [
+        _start_boundary(key, boundary) + _edge_pattern(child) + _node_pattern(child, key, len(child.chars) == 1, boundary)
+        for key, child in root.children.items()
+    ]
+    return re.compile("|".join(alternatives))
+
+
+def ignores_case(alias: str) -> bool:
+    """别名是否不区分大小写：长度达到 CASE_INSENSITIVE_MIN_LENGTH 的英文名称"""
+    return alias.isascii() and len(alias) >= CASE_INSENSITIVE_MIN_LENGTH
+
+
+class Category(NamedTuple):
+    key: str  # 如 coagulation
+    name: str  # 如 凝血功能检测
+    keywords: Tuple[str, ...]  # 报告中出现即可判断类别的关键词（不是某个指标的名称，如"凝血"、"乙肝"）
+
+
+class Indicator(NamedTuple):
+    code: str  # 规范代码，如 APTT
+    name_zh: str
+    name_en: str
+    category: str
+    aliases: Tuple[str, ...]
+    unit: Optional[str] = None
+    low: Optional[float] = None  # 参考范围下限（没有下限时为None）
+    high: Optional[float] = None  # 参考范围上限（没有上限时为None）
+    reference_text: Optional[str] = None  # 定性指标的参考结果，如"阴性"
+    expansions: Dict[str, str] = {}
+
+    def range_status(self, value: float) -> Optional[str]:
+        """按参考范围判断数值：low / high / normal；没有定量参考范围时返回None"""
+        if self.low is None and self.high is None:
+            return None
+        if self.low is not None and value < self.low:
+            return LOW
+        if self.high is not None and value > self.high:
+            return HIGH
+        return NORMAL
+
+
+class IndicatorKnowledgeBase:
+    """指标知识库：按代码查询指标，按别名在文本中查找指标和报告类别"""
+
+    def __init__(self, indicators: Iterable[Indicator], categories: Iterable[Category]):
+        self.categories: Dict[str, Category] = {category.key: category for category in categories}
+        self.indicators: Dict[str, Indicator] = {}
+        alias_codes: Dict[str, str] = {}
+        for indicator in indicators:
+            if indicator.code in self.indicators:
+                raise ValueError(f"指标代码重复: {indicator.code}")
+            if indicator.category not in self.categories:
+                raise ValueError(f"指标 {indicator.code} 的类别 {indicator.category} 不存在")
+            self.indicators[indicator.code] = indicator
+            for alias in indicator.aliases:
+                # 多个指标使用同一别名时归属于先出现的指标
+                alias_codes.setdefault(alias, indicator.code)
+
+        self.alias_pattern = compile_trie_pattern(alias_codes, ASCII_BOUNDARY, ignores_case)
+        # 精确别名优先，其次按小写查找不区分大小写的别名
+        self._alias_codes = {alias.lower(): code for alias, code in alias_codes.items()}
+        self._alias_codes.update(alias_codes)
+
+        # 报告类别：别名和类别关键词一起匹配
+        category_terms = {alias: self.indicators[code].category for alias, code in alias_codes.items()}
+        for category in self.categories.values():
+            for keyword in category.keywords:
+                category_terms.setdefault(keyword, category.key)
+        self._category_pattern = compile_trie_pattern(category_terms, ASCII_BOUNDARY, ignores_case)
+        self._category_terms = {term.lower(): key for term, key in category_terms.items() if ignores_case(term)}
+        self._category_terms.update(category_terms)
+
+    @classmethod
+    def load(cls, path: str = KNOWLEDGE_BASE_FILE) -> "IndicatorKnowledgeBase":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        categories = [
+            Category(key, value["name"], tuple(value.get("keywords", ())))
+            for key, value in data["categories"].items()
+        ]
+        indicators = []
+        for entry in data["indicators"]:
+            reference_range = entry.get("reference_range") or {}
+            indicators.append(Indicator(
+                code=entry["code"],
+                name_zh=entry["name_zh"],
+                name_en=entry.get("name_en", entry["code"]),
+                category=entry["category"],
+                aliases=tuple(entry.get("aliases") or (entry["code"],)),
+                unit=entry.get("unit"),
+                low=reference_range.get("low"),
+                high=reference_range.get("high"),
+                reference_text=entry.get("reference_text"),
+                expansions=dict(entry.get("expansions", {})),
+            ))
+        return cls(indicators, categories)
+
+    def get(self, code: str) -> Optional[Indicator]:
+        return self.indicators.get(code)
+
+    def code_of(self, alias: str) -> Optional[str]:
+        """别名（或 find_mentions 匹配到的文字）对应的指标代码"""
+        return self._alias_codes.get(alias) or self._alias_codes.get(alias.lower())
+
+    def find_mentions(self, text: str) -> List[Tuple[str, int, int]]:
+        """文本中提到的指标：[(代码, 开始位置, 结束位置)]，同一位置取最长的别名（如"糖化血红蛋白"优先于"血红蛋白"）"""
+        return [(self.code_of(match.group(0)), match.start(), match.end()) for match in self.alias_pattern.finditer(text)]
+
+    def categories_in(self, text: str) -> List[str]:
+        """文本中提到的报告类别（指标别名或类别关键词，按出现顺序，去重）"""
+        found = {}
+        for match in self._category_pattern.finditer(text):
+            term = match.group(0)
+            found.setdefault(self._category_terms.get(term) or self._category_terms[term.lower()], None)
+        return list(found)
+
+    def expansion_map(self) -> Dict[str, str]:
+        """英文缩写 -> "中文名（英文全称）"（按知识库中指标的顺序）"""
+        expansions = {}
+        for indicator in self.indicators.values():
+            for abbreviation, label in indicator.expansions.items():
+                expansions.setdefault(abbreviation, label)
+        return expansions
+
+
+knowledge_base = IndicatorKnowledgeBase.load()
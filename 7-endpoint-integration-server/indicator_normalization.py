@@ -0,0 +1,224 @@
+"""
+分析结果的规范化：从自由文本的分析结果中提取 (指标, 方向) 组合，作为健康建议的缓存键
+
+健康建议取决于哪些指标异常（如ALT升高、总胆固醇偏高），与分析结果的具体措辞、数值和患者无关。
+把分析结果规范化为按指标代码排序的 (指标, 方向) 集合后，不同患者的相同异常组合可以共用同一份健康建议。
+提到妊娠、疑似恶性肿瘤等临床背景的分析结果例外：这些背景会改变建议的内容，但不在 (指标, 方向) 中，不做规范化。
+
+指标词表来自指标知识库（indicator_knowledge_base.json：凝血、乙肝、输血前检查，以及常见的血常规、生化、血气和
+甲状腺指标）；每个指标有一个规范代码和若干中英文别名，别名的查找见 indicator_knowledge_base。
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from indicator_knowledge_base import knowledge_base
+from speculative_recommendations import parse_indicator_items
+
+HIGH = "high"
+LOW = "low"
+POSITIVE = "positive"
+NORMAL = "normal"
+DIRECTION_LABELS = {HIGH: "升高", LOW: "降低", POSITIVE: "阳性"}
+
+# 规范代码 -> (中文名称, 别名)；英文缩写按大小写敏感匹配，长度超过4的英文名称不区分大小写
+INDICATOR_VOCABULARY: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    code: (indicator.name_zh, indicator.aliases) for code, indicator in knowledge_base.indicators.items()
+}
+
+HIGH_PATTERN = r"升高|偏高|增高|高于|超出|超过|过高|增多|增加|延长|上升|↑"
+LOW_PATTERN = r"降低|偏低|减低|低于|减少|不足|过低|缩短|下降|↓"
+POSITIVE_PATTERN = r"阳性|[（(]\s*\d?\+\s*[)）]"
+# "正常范围 7.35-7.45" 是参考范围而不是结论
+NORMAL_PATTERN = r"正常(?!(?:范围|值)\s*[:：]?\s*[<>≤≥＜＞]?\s*\d)|阴性|未见异常|无异常|范围内|不高|不低"
+DIRECTION_PATTERN = re.compile(
+    f"(?P<{HIGH}>{HIGH_PATTERN})|(?P<{LOW}>{LOW_PATTERN})|(?P<{POSITIVE}>{POSITIVE_PATTERN})|(?P<{NORMAL}>{NORMAL_PATTERN})"
+)
+# 否定："ALT无明显升高"、"AST未见升高"、"升高不明显" 都不是异常
+NEGATION_BEFORE = re.compile(r"(?:未见|无明显|并无|没有|并未|未|无|不)[^，,、]{0,3}$")
+NEGATION_AFTER = re.compile(r"\s*(?:并?不明显|不显著)")
+NUMBER = r"(\d+(?:\.\d+)?)"
+# 参考范围："参考范围: 9-50"、"（9-50 U/L）"、"参考值 <5.2"
+REFERENCE_PATTERN = re.compile(
+    r"(?:(?:参考|正常)(?:范围|值|区间)?\s*[:：]?\s*(?:成人)?\s*|[（(]\s*)"
+    r"(?:(?P<bound>[<>≤≥＜＞])\s*" + NUMBER + r"|" + NUMBER + r"\s*[-~～—–至]\s*" + NUMBER + r")"
+)
+VALUE_PATTERN = re.compile(NUMBER)
+SEGMENT_SEPARATOR = re.compile(r"[\n。；;]")
+CLAUSE_SEPARATOR = re.compile(r"[，,]")
+ENUMERATION_FILLER = re.compile(r"[\s、，,和及与或以/()（）:：*]")
+# 异常描述之前可以出现、不是指标名称的文字（数值、单位、程度词、参考范围、LaTeX写法的符号等）
+SUBJECT_FILLER = re.compile(
+    r"\\\(.*?\\\)|\d+(?:\.\d+)?|[A-Za-zµμ]*/[A-Za-z]+|10\^\d+|"
+    r"(?<![A-Za-z])(?:mmHg|fL|IU|pg|ng|mg|mmol|µmol|μmol|ml|mL|sec|sat)(?![A-Za-z])|%|"
+    r"参考范围|参考区间|参考值|正常范围|上限|下限|抗原鉴定|鉴定|测定|异常|"
+    r"明显|显著|轻度|轻微|中度|重度|稍微|稍|略|弱|均|仍|较|有所|进一步|持续|提示|可见|出现|存在|表现为|"
+    r"该报告中|报告中|结果|数值|水平|指标|含量|浓度|检测|检查|患者|另外|此外|其中|同时|分别|也|都|呈|为|的|值|"
+    r"[\s、，,和及与或以/()（）:：*\-~～—–<>≤≥＜＞.．·\[\]【】\"“”'‘’↑↓]"
+)
+# 临床背景：妊娠/哺乳、疑似恶性肿瘤、化疗/移植/透析等（"癌胚抗原"、"肿瘤标志物"、"转移酶"是指标名称，不算）
+CLINICAL_CONTEXT_PATTERN = re.compile(
+    r"妊娠|怀孕|孕[妇期周早中晚]|早孕|哺乳|产后|"
+    r"恶性|癌(?!胚)|肿瘤(?!标志)|转移(?!酶)|淋巴瘤|白血病|骨髓瘤|占位|"
+    r"化疗|放疗|移植|透析|(?i:pregnan|lactat(?!e)|malignan|metasta|chemotherap|dialysis)"
+)
+LEADING_ALIAS = re.compile(r"^\s*(?:[（(][^（()）]*[)）]|[A-Za-z][A-Za-z0-9#%+\-]*)")
+UNRECOGNIZED_SUBJECT = re.compile(r"[\u4e00-\u9fff]{2,}|(?<![A-Za-z])[A-Za-z]{2,}")
+
+
+class Finding(NamedTuple):
+    code: str  # 规范指标代码，如 ALT
+    direction: str  # high / low / positive
+
+    @property
+    def key(self) -> str:
+        return f"{self.code}:{self.direction}"
+
+    @property
+    def label(self) -> str:
+        """如 "丙氨酸氨基转移酶（ALT）升高\""""
+        return f"{INDICATOR_VOCABULARY[self.code][0]}（{self.code}）{DIRECTION_LABELS[self.direction]}"
+
+
+def _find_mentions(segment: str) -> List[Tuple[str, int, int]]:
+    """查找一段文本中提到的指标：[(代码, 开始位置, 结束位置)]，相邻的同一指标（如"丙氨酸氨基转移酶（ALT）"）合并为一次"""
+    mentions = []
+    for code, start, end in knowledge_base.find_mentions(segment):
+        if mentions and mentions[-1][0] == code and not ENUMERATION_FILLER.sub("", segment[mentions[-1][2]:start]):
+            mentions[-1] = (code, mentions[-1][1], end)
+        else:
+            mentions.append((code, start, end))
+    return mentions
+
+
+def _direction_from_reference(text: str) -> Optional[str]:
+    """按数值和参考范围判断方向（如"19.00秒（参考范围: 23-35秒）"为降低）"""
+    reference = REFERENCE_PATTERN.search(text)
+    if reference is None:
+        return None
+    value = VALUE_PATTERN.search(text[:reference.start()])
+    if value is None:
+        return None
+    value = float(value.group(1))
+    if reference.group("bound"):
+        bound = float(reference.group(2))
+        if reference.group("bound") in "<≤＜":
+            return HIGH if value >= bound else NORMAL
+        return LOW if value <= bound else NORMAL
+    lower, upper = float(reference.group(3)), float(reference.group(4))
+    if value < lower:
+        return LOW
+    if value > upper:
+        return HIGH
+    return NORMAL
+
+
+def _is_negated(text: str, keyword: re.Match) -> bool:
+    """方向词是否被否定（如"无明显升高"、"未见升高"、"升高不明显"）"""
+    clause_start = max(text.rfind(separator, 0, keyword.start()) for separator in "，,") + 1
+    return bool(NEGATION_BEFORE.search(text[clause_start:keyword.start()]) or NEGATION_AFTER.match(text, keyword.end()))
+
+
+def _direction(text: str) -> Optional[str]:
+    """指标之后的文字描述的方向：方向词优先（被否定时为正常），其次按数值和参考范围判断；无法判断时返回None"""
+    keyword = DIRECTION_PATTERN.search(text)
+    if keyword is not None:
+        if keyword.lastgroup != NORMAL and _is_negated(text, keyword):
+            return NORMAL
+        return keyword.lastgroup
+    return _direction_from_reference(text)
+
+
+def _has_unrecognized_subject(text: str) -> bool:
+    """
+    文本中是否有描述为异常、但对象不在词表中的指标（如"同型半胱氨酸偏高"）
+    按逗号分句，异常方向词与其前面最近的已识别指标（或分句开头）之间除数值、单位、程度词外还有其他名称时视为无法识别
+    """
+    for segment in SEGMENT_SEPARATOR.split(text):
+        for clause in CLAUSE_SEPARATOR.split(segment):
+            mentions = _find_mentions(clause)
+            for keyword in DIRECTION_PATTERN.finditer(clause):
+                if keyword.lastgroup == NORMAL or _is_negated(clause, keyword):
+                    continue
+                subject_start = max((end for _, _, end in mentions if end <= keyword.start()), default=0)
+                subject = clause[subject_start:keyword.start()]
+                if subject_start:
+                    # 指标之后的另一种写法（如"氯 (Cl)"、"乙肝表面抗体Anti-HBsAB"）
+                    subject = LEADING_ALIAS.sub("", subject)
+                subject = DIRECTION_PATTERN.sub(" ", subject)
+                if UNRECOGNIZED_SUBJECT.search(SUBJECT_FILLER.sub(" ", subject)):
+                    return True
+    return False
+
+
+def has_clinical_context(text: str) -> bool:
+    """文本是否提到影响健康建议的临床背景（如妊娠、疑似恶性肿瘤）"""
+    return CLINICAL_CONTEXT_PATTERN.search(text) is not None
+
+
+def mentioned_codes(text: str) -> List[str]:
+    """文本中提到的指标代码（按出现顺序，去重）"""
+    return list(dict.fromkeys(code for code, _, _ in _find_mentions(text)))
+
+
+def extract_findings(text: str) -> List[Finding]:
+    """
+    提取文本中的异常指标及方向（按首次出现的顺序，同一指标以首次出现时的方向为准）
+    并列列举的指标（如"总蛋白（TP）、白蛋白（ALB）均高于参考范围"）沿用其后描述的方向；正常的指标不计入
+    """
+    findings: Dict[str, str] = {}
+    for segment in SEGMENT_SEPARATOR.split(text):
+        mentions = _find_mentions(segment)
+        directions = []
+        for index, (code, _, end) in enumerate(mentions):
+            span_end = mentions[index + 1][1] if index + 1 < len(mentions) else len(segment)
+            span = segment[end:span_end]
+            # 只有分隔符（、和 及）的并列列举暂不确定，沿用后一个指标的方向
+            directions.append(_direction(span) if ENUMERATION_FILLER.sub("", span) else None)
+        following = None
+        for index in range(len(mentions) - 1, -1, -1):
+            if directions[index] is None:
+                directions[index] = following
+            else:
+                following = directions[index]
+        for (code, _, _), direction in zip(mentions, directions):
+            if code not in findings:
+                findings[code] = direction
+    return [Finding(code, direction) for code, direction in findings.items() if direction in DIRECTION_LABELS]
+
+
+def canonical_findings(analysis_result: str) -> Optional[List[Finding]]:
+    """
+    分析结果的规范化异常指标集合（按代码排序）
+    没有识别出异常指标，或分析结果中有词表无法识别的异常项目（异常指标列表中的项目，或正文中描述为异常的其他指标）时
+    返回None（只能按完整分析结果缓存），避免不同的异常组合共用同一份健康建议；
+    提到临床背景（妊娠、疑似恶性肿瘤等）时同样返回None，避免与没有该背景的相同指标组合共用建议
+    """
+    if has_clinical_context(analysis_result):
+        return None
+    for item in parse_indicator_items(analysis_result):
+        if not mentioned_codes(item):
+            return None
+    if _has_unrecognized_subject(analysis_result):
+        return None
+    findings = extract_findings(analysis_result)
+    if not findings:
+        return None
+    return sorted(findings)
+
+
+def canonical_key(findings: List[Finding]) -> str:
+    """如 "ALT:high|TC:high\""""
+    return "|".join(finding.key for finding in sorted(findings))
+
+
+def canonical_categories(findings: List[Finding]) -> str:
+    """异常指标所属类别的集合（不含指标和方向），如 "coagulation|liver\""""
+    return "|".join(sorted({knowledge_base.get(finding.code).category for finding in findings}))
+
+
+def conflicting_findings(findings: List[Finding], other: Optional[List[Finding]]) -> bool:
+    """other 不能完整规范化，或两者有相同指标但方向不同（如一个ALT升高、一个ALT降低）时返回True"""
+    if not other:
+        return True
+    directions = {finding.code: finding.direction for finding in findings}
+    return any(directions.get(finding.code, finding.direction) != finding.direction for finding in other)
@@ -0,0 +1,157 @@
+"""
+分析任务状态存储（SQLite，多个工作进程共享，重启后保留）
+
+任务状态：queued（排队中）→ running（处理中）→ succeeded（成功）/ failed（失败）
+创建任务的进程在后台线程中定期刷新自己的排队中和执行中任务的 updated_at（心跳），
+超过 stale_after 未刷新的进行中任务（如进程已退出）视为中断
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from time import sleep, time
+from typing import Optional
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobStore:
+    def __init__(self, path, stale_after=900, retention=86400, heartbeat_interval=60):
+        self.path = path
+        self.stale_after = stale_after  # 超过该时间未更新的进行中任务视为中断（如服务重启）
+        self.retention = retention  # 已结束任务的保留时间（秒）
+        self.heartbeat_interval = heartbeat_interval  # 刷新本进程进行中任务的间隔（秒），须小于 stale_after
+        self.local_jobs = set()  # 本进程创建、尚未结束的任务
+        self.local_jobs_lock = threading.Lock()
+        self.heartbeat_pid = None
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, image_digest TEXT NOT NULL, status TEXT NOT NULL, "
+            "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_digest_status ON jobs(image_digest, status)")
+        # 合并到同一任务的每次提交都可以登记自己的回调地址
+        conn.execute("CREATE TABLE IF NOT EXISTS job_callbacks (job_id TEXT NOT NULL, callback_url TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_job_callbacks_job ON job_callbacks(job_id)")
+
+    def _connect(self):
+        # sqlite3连接不能跨线程共享，每个线程维护自己的连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def create(self, image_digest) -> str:
+        """创建排队中的任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        now = time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO jobs (id, image_digest, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+            (job_id, image_digest, now, now)
+        )
+        self._ensure_heartbeat()
+        with self.local_jobs_lock:
+            self.local_jobs.add(job_id)
+        # 顺带清理过期的已结束任务
+        conn.execute(
+            "DELETE FROM job_callbacks WHERE job_id IN "
+            "(SELECT id FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?)",
+            (now - self.retention,)
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+            (now - self.retention,)
+        )
+        return job_id
+
+    def add_callback(self, job_id, callback_url):
+        self._connect().execute(
+            "INSERT INTO job_callbacks (job_id, callback_url) VALUES (?, ?)", (job_id, callback_url)
+        )
+
+    def find_active(self, image_digest) -> Optional[str]:
+        """查找同一图片的进行中任务（用于合并重复提交）"""
+        row = self._connect().execute(
+            "SELECT id FROM jobs WHERE image_digest = ? AND status IN ('queued', 'running') AND updated_at >= ? "
+            "ORDER BY created_at LIMIT 1",
+            (image_digest, time() - self.stale_after)
+        ).fetchone()
+        return row["id"] if row else None
+
+    def mark_running(self, job_id):
+        self._update(job_id, "running")
+
+    def _ensure_heartbeat(self):
+        """在当前进程中启动心跳线程（每个进程一个；gunicorn fork 出的工作进程各自启动）"""
+        with self.local_jobs_lock:
+            if self.heartbeat_pid == os.getpid():
+                return
+            self.heartbeat_pid = os.getpid()
+            # fork 前父进程登记的任务不在本进程中执行
+            self.local_jobs.clear()
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def _heartbeat(self):
+        while True:
+            sleep(self.heartbeat_interval)
+            with self.local_jobs_lock:
+                job_ids = list(self.local_jobs)
+            if not job_ids:
+                continue
+            self._connect().execute(
+                f"UPDATE jobs SET updated_at = ? WHERE status IN ('queued', 'running') "
+                f"AND id IN ({', '.join('?' * len(job_ids))})",
+                (time(), *job_ids)
+            )
+
+    def mark_succeeded(self, job_id, result):
+        self._update(job_id, "succeeded", result=json.dumps(result, ensure_ascii=False))
+        self._forget(job_id)
+
+    def mark_failed(self, job_id, error):
+        self._update(job_id, "failed", error=error)
+        self._forget(job_id)
+
+    def _forget(self, job_id):
+        with self.local_jobs_lock:
+            self.local_jobs.discard(job_id)
+
+    def _update(self, job_id, status, result=None, error=None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, result = COALESCE(?, result), error = COALESCE(?, error), updated_at = ? "
+            "WHERE id = ?",
+            (status, result, error, time(), job_id)
+        )
+
+    def get(self, job_id) -> Optional[dict]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if row["status"] in ACTIVE_STATUSES and time() - row["updated_at"] > self.stale_after:
+            job["status"] = "failed"
+            job["error"] = "任务超时或服务重启导致中断，请重新提交"
+        if row["result"]:
+            job["result"] = json.loads(row["result"])
+        if row["error"]:
+            job["error"] = row["error"]
+        return job
+
+    def get_callback_urls(self, job_id) -> list:
+        rows = self._connect().execute(
+            "SELECT DISTINCT callback_url FROM job_callbacks WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        return [row["callback_url"] for row in rows]
@@ -1,121 +1,409 @@
 import base64
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 import requests
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import json
 from PIL import Image
 import io
-import sys
 import logging
 from functools import wraps, lru_cache
-from time import time
+from time import time, sleep, perf_counter, time_ns
 from typing import Optional, Tuple
 import hashlib
+import ipaddress
+import socket
+import atexit
+import contextvars
 from threading import Lock
 from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import partial
+from urllib.parse import urlparse
+from admission import AIMDLimiter, OverloadedError, RetryPolicy
+from cache_backends import create_cache_backend
+from report_pages import collect_report_pages, is_pdf_file, merge_page_findings
+from request_body import PreEncodedJSONBody, build_json_body_with_parts
+from document_preprocessing import image_mime_type, normalize_profile
+from endpoint_registry import EndpointRegistry, ModelEndpoint
+from image_pipeline import apply_jpeg_draft, process_image, resize_decoded_image
+from image_workers import ImageWorkerPool
+from job_store import JobStore
+from singleflight import SingleFlight
+from indicator_normalization import (
+    canonical_categories, canonical_findings, canonical_key, conflicting_findings, extract_findings,
+    has_clinical_context
+)
+from similarity_cache import SimilarityIndex
+from metrics import MetricsRegistry, record_upstream_call, track_upstream_calls
+from tracing import CLIENT, SERVER, Tracer, create_exporter, current_span, parse_traceparent
+from structured_logging import (
+    ALWAYS_LOG,
+    activate_request_log,
+    configure_logging,
+    deactivate_request_log,
+    new_request_log,
+)
+from speculative_recommendations import SpeculationCancelled, SpeculativeRecommendations, merge_indicator_recommendations
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stderr),
-        logging.FileHandler('medical_server.log', encoding='utf-8')
-    ]
+# 配置日志（经队列由后台线程写入stderr和日志文件，请求线程不等待写入）
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')  # 日志级别
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 日志格式：json（每行一个JSON对象）/ text（原有的文本格式）
+LOG_FILE = os.getenv('LOG_FILE', 'medical_server.{pid}.log')  # 日志文件路径（空表示只写stderr；{pid}替换为进程号，多进程部署时各进程分别轮转）
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', '52428800'))  # 日志文件达到该大小时轮转（50MB，0表示不轮转）
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))  # 保留的轮转日志文件数
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # 等待写入的日志条数上限，超出时丢弃
+LOG_SAMPLE_RATIO = float(os.getenv('LOG_SAMPLE_RATIO', '1.0'))  # 保留过程日志（请求内INFO级别）的请求比例，访问日志和WARNING以上始终保留
+configure_logging(
+    level=LOG_LEVEL,
+    log_format=LOG_FORMAT,
+    log_file=LOG_FILE or None,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    queue_size=LOG_QUEUE_SIZE
 )
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger(f"{__name__}.access")
 
 app = Flask(__name__)
 
 # 从环境变量读取配置，如果没有则使用默认值
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
-if not OPENROUTER_API_KEY:
-    logger.error("错误: OPENROUTER_API_KEY 环境变量未设置，请在生产环境中设置此变量")
-    raise ValueError("OPENROUTER_API_KEY 环境变量必须设置")
-
 API_A_MODEL = os.getenv('API_A_MODEL', "qwen/qwen2.5-vl-32b-instruct:free")
 API_B_MODEL = os.getenv('API_B_MODEL', "qwen/qwen3-30b-a3b:free")
 OPENROUTER_API_BASE = os.getenv('OPENROUTER_API_BASE', "https://openrouter.ai/api/v1")
 
+# 自建vLLM端点（可选，配置后优先使用，故障时转移到OpenRouter）
+VL_API_BASE = os.getenv('VL_API_BASE', '')  # 视觉语言模型自建API地址，如 http://host:8000/v1
+VL_API_MODEL = os.getenv('VL_API_MODEL', "./qwen25vl-7b-offical-finetuned/")
+LLM_API_BASE = os.getenv('LLM_API_BASE', '')  # 大语言模型自建API地址
+LLM_API_MODEL = os.getenv('LLM_API_MODEL', "./qwen25-14b-unsloth-finetuned-bnb-4bit/")
+SELFHOST_API_KEY = os.getenv('SELFHOST_API_KEY')  # 自建端点的API密钥（vLLM --api-key，可选）
+
+if not OPENROUTER_API_KEY and not (VL_API_BASE and LLM_API_BASE):
+    logger.error("错误: OPENROUTER_API_KEY 环境变量未设置，请在生产环境中设置此变量（或同时配置 VL_API_BASE 和 LLM_API_BASE）")
+    raise ValueError("OPENROUTER_API_KEY 环境变量必须设置")
+
 # 配置常量
 MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', '1280'))  # 最大图片尺寸
+JPEG_DRAFT_MODE = os.getenv('JPEG_DRAFT_MODE', 'true').lower() == 'true'  # 大尺寸JPEG解码时直接在DCT域降采样
+PREPROCESS_PROFILE = normalize_profile(os.getenv('PREPROCESS_PROFILE', 'none'))  # 默认化验单预处理档位：none/document/binary（可按请求覆盖）
+PREPROCESS_TEXT_HEIGHT = int(os.getenv('PREPROCESS_TEXT_HEIGHT', '24'))  # 预处理后文字行高的目标像素数
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '0'))  # 图片处理工作进程数（0表示在请求线程中处理）
 API_TIMEOUT = int(os.getenv('API_TIMEOUT', '300'))  # API请求超时时间（秒）
-MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))  # 最大重试次数
+MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))  # 每次上游调用的最大尝试次数（含首次请求）
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '1'))  # 重试退避基准时间（秒，指数增长并加随机抖动）
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '30'))  # 单次重试最长等待时间（秒）
+VL_CONCURRENCY_LIMIT = int(os.getenv('VL_CONCURRENCY_LIMIT', '8'))  # API A初始并发上限（按延迟和限流自适应调整）
+VL_CONCURRENCY_MAX = int(os.getenv('VL_CONCURRENCY_MAX', '32'))  # API A并发上限的最大值
+VL_LATENCY_TARGET = float(os.getenv('VL_LATENCY_TARGET', '60'))  # API A目标延迟（秒），超过时降低并发上限
+LLM_CONCURRENCY_LIMIT = int(os.getenv('LLM_CONCURRENCY_LIMIT', '8'))  # API B初始并发上限
+LLM_CONCURRENCY_MAX = int(os.getenv('LLM_CONCURRENCY_MAX', '32'))  # API B并发上限的最大值
+LLM_LATENCY_TARGET = float(os.getenv('LLM_LATENCY_TARGET', '60'))  # API B目标延迟（秒）
+UPSTREAM_QUEUE_MAX = int(os.getenv('UPSTREAM_QUEUE_MAX', '32'))  # 每个上游最多排队的请求数，超出时直接返回503
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', '30'))  # 排队等待并发名额的最长时间（秒）
+ENDPOINT_ROUTING = os.getenv('ENDPOINT_ROUTING', 'fastest')  # 端点路由策略：fastest（按观测延迟）/ priority（按登记顺序）
+ENDPOINT_CONNECT_TIMEOUT = float(os.getenv('ENDPOINT_CONNECT_TIMEOUT', '5'))  # 连接上游的超时时间（秒）
+ENDPOINT_LATENCY_SLO = float(os.getenv('ENDPOINT_LATENCY_SLO', '120'))  # 端点延迟SLO（秒），超过计为一次失败（0表示不限制）
+ENDPOINT_FAILOVER_TIMEOUT = float(os.getenv('ENDPOINT_FAILOVER_TIMEOUT', str(ENDPOINT_LATENCY_SLO)))  # 还有后备端点时等待响应的超时（秒，默认等于延迟SLO；0表示使用API_TIMEOUT）
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))  # 连续失败多少次后打开熔断器
+CIRCUIT_RECOVERY_TIME = float(os.getenv('CIRCUIT_RECOVERY_TIME', '30'))  # 熔断器打开后多久放行试探请求（秒）
+ENDPOINT_PROBE_INTERVAL = float(os.getenv('ENDPOINT_PROBE_INTERVAL', '30'))  # 端点健康探测间隔（秒，0表示关闭）
 MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', '10485760'))  # 最大文件大小（10MB）
+MAX_REPORT_PAGES = int(os.getenv('MAX_REPORT_PAGES', '10'))  # 一次请求最多分析的页数（多张图片和PDF各页合计）
+PDF_RENDER_DPI = int(os.getenv('PDF_RENDER_DPI', '150'))  # PDF页面渲染分辨率
+PAGE_WORKERS = int(os.getenv('PAGE_WORKERS', '8'))  # 多页报告并行预处理和分析的线程数
+MULTI_IMAGE_MESSAGE = os.getenv('MULTI_IMAGE_MESSAGE', 'false').lower() == 'true'  # 多页报告作为一条多图消息发送（需要模型端支持，如vLLM --limit-mm-per-prompt）
+SPECULATIVE_RECOMMENDATIONS = os.getenv('SPECULATIVE_RECOMMENDATIONS', 'false').lower() == 'true'  # 边流式分析边按异常指标并行生成健康建议（可按请求用 speculative 表单字段覆盖）
+SPECULATIVE_WORKERS = int(os.getenv('SPECULATIVE_WORKERS', '16'))  # 并行生成各项指标健康建议的线程数
+SPECULATIVE_MAX_INDICATORS = int(os.getenv('SPECULATIVE_MAX_INDICATORS', '12'))  # 每个请求最多并行生成建议的指标数（另受API B当前并发上限减一限制），超过时回退为整份报告生成一次
 ENABLE_CACHE = os.getenv('ENABLE_CACHE', 'true').lower() == 'true'  # 是否启用缓存
 CACHE_TTL = int(os.getenv('CACHE_TTL', '3600'))  # 缓存过期时间（秒）
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')  # 缓存后端：memory / sqlite / redis
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1000'))  # 缓存最大条目数
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', '0'))  # sqlite缓存最大总字节数（0表示不限制）
+CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH', 'cache/medical_cache.sqlite3')  # sqlite缓存文件路径
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')  # Redis连接地址
+SIMILARITY_CACHE = os.getenv('SIMILARITY_CACHE', 'false').lower() == 'true'  # 精确缓存未命中时按分析结果文本相似度复用健康建议（需启用缓存）
+SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', '0.9'))  # 相似度缓存的余弦相似度阈值
+SIMILARITY_MAX_ENTRIES = int(os.getenv('SIMILARITY_MAX_ENTRIES', str(CACHE_MAX_ENTRIES)))  # 相似度索引最多保存的分析结果数（LRU淘汰，默认与缓存相同；过期时间与缓存相同）
+SIMILARITY_MAX_LOOKUP_MS = float(os.getenv('SIMILARITY_MAX_LOOKUP_MS', '5'))  # 单次相似度查找的时间预算（毫秒，0表示不限制）
+SIMILARITY_INDEX_PATH = os.getenv('SIMILARITY_INDEX_PATH', 'cache/similarity_index.json')  # 相似度索引持久化文件路径（空表示不持久化）
+SIMILARITY_SAVE_INTERVAL = float(os.getenv('SIMILARITY_SAVE_INTERVAL', '60'))  # 相似度索引保存间隔（秒）
 MAX_WORKERS = int(os.getenv('MAX_WORKERS', '4'))  # 线程池最大工作线程数
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', 'cache/jobs.sqlite3')  # 异步任务状态数据库路径
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '100'))  # 每个进程最多排队和执行中的任务数
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', '3600'))  # 进行中任务超过该时间未更新（无心跳）视为中断（秒）
+JOB_HEARTBEAT_INTERVAL = int(os.getenv('JOB_HEARTBEAT_INTERVAL', '60'))  # 排队中和执行中任务刷新心跳的间隔（秒），须小于 JOB_STALE_AFTER
+JOB_RETENTION = int(os.getenv('JOB_RETENTION', '86400'))  # 已结束任务的保留时间（秒）
+JOB_CALLBACK_TIMEOUT = int(os.getenv('JOB_CALLBACK_TIMEOUT', '10'))  # 回调请求超时时间（秒）
+JOB_CALLBACK_RETRIES = int(os.getenv('JOB_CALLBACK_RETRIES', '3'))  # 回调请求最大尝试次数
+JOB_CALLBACK_WORKERS = int(os.getenv('JOB_CALLBACK_WORKERS', '4'))  # 发送回调的线程数（与分析任务的线程池分开）
+JOB_CALLBACK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.getenv('JOB_CALLBACK_ALLOWED_HOSTS', '').split(',') if host.strip()
+}  # 回调地址允许的主机名（逗号分隔）；配置后只允许这些主机，未配置时拒绝解析到内网、回环、链路本地等地址的主机
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'none')  # 链路追踪导出方式：none / file / otlp
+TRACING_FILE_PATH = os.getenv('TRACING_FILE_PATH', 'traces/spans.jsonl')  # 追踪文件路径（OTLP/JSON，每行一批）
+TRACING_OTLP_ENDPOINT = os.getenv('TRACING_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')  # OTLP/HTTP collector地址
+TRACING_SAMPLE_RATIO = float(os.getenv('TRACING_SAMPLE_RATIO', '1.0'))  # 新trace的采样比例（请求头带traceparent时沿用调用方的采样决定）
+TRACING_SERVICE_NAME = os.getenv('TRACING_SERVICE_NAME', 'medical-report-server')  # 追踪数据中的服务名
+PROMPT_VERSION = os.getenv('PROMPT_VERSION', 'v1')  # 提示词版本（修改提示词后更新，使旧缓存失效）
 
-# 创建带连接池的Session
-session = requests.Session()
-retry_strategy = Retry(
-    total=MAX_RETRIES,
-    backoff_factor=1,
-    status_forcelist=[429, 500, 502, 503, 504],
-    allowed_methods=["POST"]
-)
-adapter = HTTPAdapter(
-    max_retries=retry_strategy,
-    pool_connections=10,
-    pool_maxsize=20
+
+# 提示词
+ANALYSIS_PROMPT = "请仔细分析这张医学检测报告图片，识别并列出其中的异常指标。如果没有发现异常指标，请明确说明'未发现异常指标'。请以简洁、专业的中文医学术语回答。"
+MULTI_PAGE_ANALYSIS_PROMPT = "以下{page_count}张图片依次是同一份医学检测报告的各页。请综合所有页面仔细分析，识别并列出其中的异常指标（注明所在页码）。如果没有发现异常指标，请明确说明'未发现异常指标'。请以简洁、专业的中文医学术语回答。"
+IMAGE_URL_PLACEHOLDER = "__IMAGE_DATA_URL_{index}__"  # 请求体中图片data URL的占位符
+RECOMMENDATION_PROMPT_TEMPLATE = "根据以下医学检测报告分析结果，提供相应的健康建议和注意事项：\n\n{analysis_result}\n\n请以简洁明了的中文给出实用的健康建议，包括饮食、运动和生活方式等方面的指导。"
+INDICATOR_RECOMMENDATION_PROMPT_TEMPLATE = "以下是一份医学检测报告中的一项异常指标：\n\n{indicator}\n\n请针对这项指标，以简洁明了的中文给出实用的健康建议，包括饮食、运动和生活方式等方面的指导（不超过150字）。"
+
+# 链路追踪（未启用导出时为空操作）
+tracer = Tracer(
+    TRACING_SERVICE_NAME,
+    create_exporter(TRACING_EXPORTER, file_path=TRACING_FILE_PATH, otlp_endpoint=TRACING_OTLP_ENDPOINT),
+    sample_ratio=TRACING_SAMPLE_RATIO
 )
-session.mount("http://", adapter)
-session.mount("https://", adapter)
 
-# 改进的LRU缓存实现（生产环境建议使用Redis）
-from collections import OrderedDict
+# 图片处理工作进程池：必须在启动任何后台线程（如端点健康探测）之前创建，工作进程在此时fork
+image_worker_pool = ImageWorkerPool(
+    IMAGE_WORKERS, MAX_IMAGE_SIZE, JPEG_DRAFT_MODE, PREPROCESS_TEXT_HEIGHT
+) if IMAGE_WORKERS > 0 else None
+
+# 上游准入控制：API A（视觉语言模型）和API B（大语言模型）各自独立的并发预算和连接池（舱壁隔离），
+# 一个上游变慢或被限流时不会占满另一个的名额
+upstream_limiters = {
+    "vl": AIMDLimiter(
+        "vl",
+        initial_limit=VL_CONCURRENCY_LIMIT,
+        max_limit=VL_CONCURRENCY_MAX,
+        max_queue=UPSTREAM_QUEUE_MAX,
+        queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+        latency_target=VL_LATENCY_TARGET
+    ),
+    "llm": AIMDLimiter(
+        "llm",
+        initial_limit=LLM_CONCURRENCY_LIMIT,
+        max_limit=LLM_CONCURRENCY_MAX,
+        max_queue=UPSTREAM_QUEUE_MAX,
+        queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+        latency_target=LLM_LATENCY_TARGET
+    ),
+}
+# 模型端点注册表：每个阶段（vl：API A，llm：API B）可登记多个端点，按健康状态和延迟路由并自动故障转移
+endpoint_registry = EndpointRegistry(routing=ENDPOINT_ROUTING)
+for stage, selfhost_base, selfhost_model, openrouter_model in (
+    ("vl", VL_API_BASE, VL_API_MODEL, API_A_MODEL),
+    ("llm", LLM_API_BASE, LLM_API_MODEL, API_B_MODEL),
+):
+    if selfhost_base:
+        endpoint_registry.register(ModelEndpoint(
+            f"selfhost-{stage}", stage, selfhost_base, selfhost_model, api_key=SELFHOST_API_KEY,
+            failure_threshold=CIRCUIT_FAILURE_THRESHOLD, recovery_time=CIRCUIT_RECOVERY_TIME,
+            latency_slo=ENDPOINT_LATENCY_SLO or None
+        ))
+    if OPENROUTER_API_KEY:
+        endpoint_registry.register(ModelEndpoint(
+            f"openrouter-{stage}", stage, OPENROUTER_API_BASE, openrouter_model, api_key=OPENROUTER_API_KEY,
+            failure_threshold=CIRCUIT_FAILURE_THRESHOLD, recovery_time=CIRCUIT_RECOVERY_TIME,
+            latency_slo=ENDPOINT_LATENCY_SLO or None
+        ))
+endpoint_registry.start_health_probes(ENDPOINT_PROBE_INTERVAL, timeout=ENDPOINT_CONNECT_TIMEOUT)
 
-class LRUCache:
-    def __init__(self, max_size=1000, ttl=3600):
-        self.max_size = max_size
-        self.ttl = ttl
-        self.cache = OrderedDict()
-        self.timestamps = {}
+# 统一重试策略（连接池不配置urllib3重试，避免两层重试叠加放大上游请求数）
+retry_policy = RetryPolicy(max_attempts=MAX_RETRIES, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY)
+
+
+def create_upstream_session(pool_maxsize):
+    """创建带连接池的Session（不在适配器层重试）"""
+    upstream_session = requests.Session()
+    adapter = HTTPAdapter(
+        max_retries=0,
+        pool_connections=10,
+        pool_maxsize=pool_maxsize
+    )
+    upstream_session.mount("http://", adapter)
+    upstream_session.mount("https://", adapter)
+    return upstream_session
+
+
+sessions = {
+    "vl": create_upstream_session(VL_CONCURRENCY_MAX),
+    "llm": create_upstream_session(LLM_CONCURRENCY_MAX),
+}
+
+# 缓存后端（memory为进程内缓存；sqlite/redis可在多个工作进程间共享，并在重启后保留）
+cache = create_cache_backend(
+    CACHE_BACKEND,
+    ttl=CACHE_TTL,
+    max_size=CACHE_MAX_ENTRIES,
+    sqlite_path=CACHE_SQLITE_PATH,
+    max_bytes=CACHE_MAX_BYTES,
+    redis_url=REDIS_URL
+) if ENABLE_CACHE else None
+
+# 健康建议的相似度索引（每个进程一个，持久化文件只用于重启后预热）
+similarity_index = SimilarityIndex(
+    threshold=SIMILARITY_THRESHOLD,
+    max_entries=SIMILARITY_MAX_ENTRIES,
+    path=SIMILARITY_INDEX_PATH or None,
+    max_lookup_ms=SIMILARITY_MAX_LOOKUP_MS,
+    ttl=CACHE_TTL
+) if ENABLE_CACHE and SIMILARITY_CACHE else None
+if similarity_index is not None:
+    similarity_index.load()
+    similarity_index.start_autosave(SIMILARITY_SAVE_INTERVAL)
+    atexit.register(similarity_index.save)
+
+
+class CacheStats:
+    """
+    缓存命中统计（按提示类型分别计数：命中 / 未命中 / 键冲突）
+    """
+    def __init__(self):
         self.lock = Lock()
-    
-    def get(self, key):
+        self.counters = {}
+
+    def record(self, prompt_type, outcome):
         with self.lock:
-            if key not in self.cache:
-                return None
-            # 检查是否过期
-            if time() - self.timestamps[key] > self.ttl:
-                del self.cache[key]
-                del self.timestamps[key]
-                return None
-            # 移动到末尾（最近使用）
-            self.cache.move_to_end(key)
-            return self.cache[key]
-    
-    def set(self, key, value):
+            counter = self.counters.setdefault(prompt_type, {"hits": 0, "misses": 0, "collisions": 0})
+            counter[outcome] += 1
+
+    def snapshot(self):
         with self.lock:
-            if key in self.cache:
-                self.cache.move_to_end(key)
-            else:
-                if len(self.cache) >= self.max_size:
-                    # 删除最旧的项
-                    oldest_key = next(iter(self.cache))
-                    del self.cache[oldest_key]
-                    del self.timestamps[oldest_key]
-            self.cache[key] = value
-            self.timestamps[key] = time()
+            result = {}
+            for prompt_type, counter in self.counters.items():
+                lookups = counter["hits"] + counter["misses"]
+                result[prompt_type] = dict(counter, hit_rate=round(counter["hits"] / lookups, 4) if lookups else 0.0)
+            return result
+
+cache_stats = CacheStats()
+# 单项指标健康建议缓存按规范化指标（如 ALT:high）的命中统计：只统计实际查找过的单项建议缓存（推测模式和由单项建议合并）
+indicator_cache_stats = CacheStats()
+
+# 运行指标（/metrics，Prometheus文本格式；每个进程独立）
+metrics = MetricsRegistry()
+stage_duration = metrics.histogram(
+    "medical_stage_duration_seconds", "各处理阶段耗时：validate/resize/encode/api_a/api_b/total（status: success/error/overload/cancelled）",
+    ("stage", "status")
+)
+requests_total = metrics.counter("medical_requests_total", "HTTP请求数", ("endpoint", "status"))
+requests_in_flight = metrics.gauge("medical_requests_in_flight", "正在处理的HTTP请求数")
+cache_lookups_total = metrics.counter(
+    "medical_cache_lookups_total", "缓存查找次数（result: hit/miss/collision）", ("prompt_type", "result")
+)
+upstream_retries_total = metrics.counter("medical_upstream_retries_total", "上游请求重试次数", ("upstream",))
+upstream_rate_limited_total = metrics.counter("medical_upstream_rate_limited_total", "上游返回429的次数", ("upstream",))
+upstream_timeouts_total = metrics.counter("medical_upstream_timeouts_total", "上游请求超时次数", ("upstream",))
+upstream_tokens_total = metrics.counter(
+    "medical_upstream_tokens_total", "上游token用量（响应的usage字段，type: prompt/completion）", ("upstream", "type")
+)
+upstream_in_flight = metrics.gauge("medical_upstream_in_flight", "进行中的上游HTTP请求数", ("upstream",))
+STAGE_METRIC_NAMES = {"vl": "api_a", "llm": "api_b"}
+
+
+def record_token_usage(upstream, usage):
+    """记录上游响应的usage字段（没有时忽略）"""
+    if not usage:
+        return
+    for token_type in ("prompt", "completion"):
+        tokens = usage.get(f"{token_type}_tokens")
+        if tokens:
+            upstream_tokens_total.inc(upstream, token_type, amount=tokens)
+
+
+def record_upstream_failure(upstream, status_code=None, timeout=False):
+    """记录上游429和超时"""
+    if timeout:
+        upstream_timeouts_total.inc(upstream)
+    elif status_code == 429:
+        upstream_rate_limited_total.inc(upstream)
 
-cache = LRUCache(max_size=1000, ttl=CACHE_TTL) if ENABLE_CACHE else None
+# 进行中请求合并（缓存只在上游调用完成后写入，并发的重复请求在此共享同一次调用）
+analysis_flight = SingleFlight()
+recommendation_flight = SingleFlight()
 
-# 创建线程池用于并发处理
+# 创建线程池用于并发处理（异步分析任务在此执行）
 executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+# 多页报告各页的预处理和分析（与异步任务分开，避免互相占满）
+page_executor = ThreadPoolExecutor(max_workers=PAGE_WORKERS, thread_name_prefix="report-page")
+# 推测模式下各项异常指标的健康建议生成
+speculation_executor = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculation")
+# 异步任务结束后的回调通知（回调地址响应慢或不可达时不占用分析任务的线程）
+callback_executor = ThreadPoolExecutor(max_workers=JOB_CALLBACK_WORKERS, thread_name_prefix="job-callback")
+
+# 异步分析任务状态存储
+job_store = JobStore(
+    JOB_DB_PATH, stale_after=JOB_STALE_AFTER, retention=JOB_RETENTION, heartbeat_interval=JOB_HEARTBEAT_INTERVAL
+)
+job_submit_lock = Lock()
+pending_job_count = 0  # 当前进程中排队和执行中的任务数
+
+
+class JobQueueFullError(Exception):
+    """任务队列已满"""
+
+@app.before_request
+def before_request():
+    requests_in_flight.inc()
+    g.request_start = perf_counter()
+    # 请求的关联ID（请求头 X-Request-ID，没有时生成），同一请求的所有日志都带有它
+    g.request_log = new_request_log(request.headers.get('X-Request-ID'), LOG_SAMPLE_RATIO)
+    g.log_token = activate_request_log(g.request_log)
+    # 请求span：沿用调用方的trace（请求头traceparent），按路由规则命名（不含任务ID等路径参数）
+    span = tracer.start_span(
+        f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+        kind=SERVER,
+        attributes={"http.method": request.method, "http.target": request.path},
+        parent=parse_traceparent(request.headers.get("traceparent"))
+    )
+    g.request_span = span
+    g.trace_token = tracer.activate(span)
+
+
+@app.teardown_request
+def teardown_request(exception=None):
+    requests_in_flight.dec()
+    deactivate_request_log(g.pop("log_token", None))
+    tracer.deactivate(g.pop("trace_token", None))
+    span = g.pop("request_span", None)
+    # 流式响应的请求span在响应体输出结束时由生成器结束
+    if span is not None and not g.get("stream_owns_request_span"):
+        if exception is not None:
+            span.record_exception(exception)
+        span.end()
+
 
 @app.after_request
 def after_request(response):
+    requests_total.inc(request.endpoint or "unknown", str(response.status_code))
+    span = g.get("request_span")
+    if span is not None and span.sampled:
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_error(f"HTTP {response.status_code}")
+        # 便于按响应头在追踪文件或collector中找到这个请求的trace
+        response.headers['X-Trace-Id'] = span.trace_id
+    log_access(response)
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
 
+def log_access(response):
+    """每个请求一行访问日志（不参与采样；流式响应的耗时为开始输出前的时间）"""
+    request_log = g.get("request_log")
+    if request_log is None:
+        return
+    response.headers['X-Request-ID'] = request_log.request_id
+    duration_ms = round((perf_counter() - g.request_start) * 1000, 1)
+    access_logger.info(
+        f"{request.method} {request.path} {response.status_code} {duration_ms}ms",
+        extra=dict(ALWAYS_LOG, method=request.method, path=request.path, status=response.status_code,
+                   duration_ms=duration_ms)
+    )
+
+
 def resize_image(image_data, max_size=None):
     """
     调整图片大小，保持宽高比
@@ -125,45 +413,15 @@ def resize_image(image_data, max_size=None):
     
     try:
         image = Image.open(image_data)
-        width, height = image.size
+        original_size = image.size
+        apply_jpeg_draft(image, max_size, JPEG_DRAFT_MODE)
+        resized_data = resize_decoded_image(image, max_size, original_size)
         
-        # 如果图片已经小于最大尺寸，直接返回
-        if width <= max_size and height <= max_size:
+        # 如果图片已经是符合要求的JPEG，直接返回
+        if resized_data is None:
             image_data.seek(0)
             return image_data
-        
-        # 计算新尺寸，保持宽高比
-        if width > height:
-            new_width = min(width, max_size)
-            new_height = int(height * (new_width / width))
-        else:
-            new_height = min(height, max_size)
-            new_width = int(width * (new_height / height))
-        
-        # 使用高质量重采样（LANCZOS提供最佳质量）
-        resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # 转换为RGB模式（如果不是的话），确保兼容性
-        if resized_image.mode != 'RGB':
-            resized_image = resized_image.convert('RGB')
-        
-        # 优化图片压缩：根据图片大小动态调整质量，使用更高效的压缩
-        img_byte_arr = io.BytesIO()
-        # 对于较小的图片使用更高质量，大图片使用较低质量以节省带宽
-        # 使用渐进式JPEG和优化选项
-        quality = 92 if max(width, height) < 800 else 88
-        resized_image.save(
-            img_byte_arr, 
-            format='JPEG', 
-            quality=quality, 
-            optimize=True,
-            progressive=True,  # 渐进式JPEG，加载更快
-            subsampling='4:2:0'  # 色度子采样，减小文件大小
-        )
-        img_byte_arr.seek(0)
-        
-        logger.info(f"图片已调整: {width}x{height} -> {new_width}x{new_height}")
-        return img_byte_arr
+        return resized_data
     except Exception as e:
         logger.error(f"调整图片大小失败: {str(e)}")
         raise
@@ -181,119 +439,559 @@ def encode_image_to_base64(image_file):
         raise
 
 
-def get_cache_key(base64_image: str, prompt_type: str) -> str:
-    """生成缓存键"""
-    content = f"{base64_image[:100]}{prompt_type}"  # 使用图片前100字符和提示类型
-    return hashlib.md5(content.encode()).hexdigest()
+def get_cache_fingerprint(content_digest: str, prompt_type: str, model: str) -> str:
+    """生成缓存指纹（内容摘要 + 提示类型 + 模型名称 + 提示词版本）"""
+    content = f"{content_digest}|{prompt_type}|{model}|{PROMPT_VERSION}"
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_cache_key(fingerprint: str) -> str:
+    """生成缓存键（指纹前16位，完整指纹保存在缓存条目中用于检测键冲突）"""
+    return fingerprint[:16]
 
-def get_from_cache(cache_key: str) -> Optional[str]:
+@tracer.traced("cache.get")
+def get_from_cache(fingerprint: str, prompt_type: str) -> Optional[str]:
     """从缓存获取结果"""
     if not ENABLE_CACHE or cache is None:
         return None
-    result = cache.get(cache_key)
-    if result:
-        logger.info(f"从缓存获取结果: {cache_key[:8]}...")
-    return result
+    span = current_span()
+    span.set_attribute("cache.prompt_type", prompt_type)
+    cache_key = get_cache_key(fingerprint)
+    try:
+        entry = cache.get(cache_key)
+    except Exception as e:
+        # 缓存后端不可用时降级为未命中，不影响主流程
+        logger.warning(f"读取缓存失败: {str(e)}")
+        entry = None
+    if entry is None:
+        cache_stats.record(prompt_type, "misses")
+        cache_lookups_total.inc(prompt_type, "miss")
+        span.set_attribute("cache.result", "miss")
+        return None
+    if entry.get("fingerprint") != fingerprint:
+        # 键相同但内容不同，视为未命中，避免返回其他报告的结果
+        logger.warning(f"缓存键冲突: {cache_key}")
+        cache_stats.record(prompt_type, "collisions")
+        cache_stats.record(prompt_type, "misses")
+        cache_lookups_total.inc(prompt_type, "collision")
+        span.set_attribute("cache.result", "collision")
+        return None
+    cache_stats.record(prompt_type, "hits")
+    cache_lookups_total.inc(prompt_type, "hit")
+    span.set_attribute("cache.result", "hit")
+    logger.info(f"从缓存获取结果: {cache_key[:8]}...")
+    return entry["value"]
 
-def set_to_cache(cache_key: str, value: str):
+def set_to_cache(fingerprint: str, value: str):
     """设置缓存"""
     if not ENABLE_CACHE or cache is None:
         return
-    cache.set(cache_key, value)
+    try:
+        cache.set(get_cache_key(fingerprint), {"fingerprint": fingerprint, "value": value})
+    except Exception as e:
+        logger.warning(f"写入缓存失败: {str(e)}")
 
-def make_api_request_with_retry(url, headers, payload, max_retries=MAX_RETRIES):
+def make_api_request_with_retry(url, headers, payload, upstream="vl", max_retries=None, read_timeout=None):
     """
-    带重试机制的API请求（使用连接池）
+    带重试机制的API请求（使用对应上游的连接池和并发预算，退避等待期间不占用并发名额）
+    并发名额和排队都已满时抛出 OverloadedError，不再重试
+    每次尝试记录一个client span（含排队等待时间），并把它的traceparent写入上游请求头
+    :param read_timeout: 等待响应的超时（秒），默认为 API_TIMEOUT
     """
+    if max_retries is None:
+        max_retries = retry_policy.max_attempts
+    limiter = upstream_limiters[upstream]
     last_exception = None
     for attempt in range(max_retries):
-        try:
-            response = session.post(
-                url,
-                headers=headers,
-                json=payload,
-                timeout=API_TIMEOUT
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            elif response.status_code == 429:  # Rate limit
-                wait_time = 2 ** attempt
-                logger.warning(f"API请求被限流，等待 {wait_time} 秒后重试 (尝试 {attempt + 1}/{max_retries})")
-                import time
-                time.sleep(wait_time)
-                continue
-            else:
-                error_msg = f"API请求失败，状态码 {response.status_code}: {response.text[:500]}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
-                
-        except requests.exceptions.Timeout:
-            last_exception = Exception(f"API请求超时 (尝试 {attempt + 1}/{max_retries})")
-            logger.warning(str(last_exception))
-            if attempt < max_retries - 1:
-                continue
-        except requests.exceptions.RequestException as e:
-            last_exception = Exception(f"API请求异常: {str(e)} (尝试 {attempt + 1}/{max_retries})")
-            logger.warning(str(last_exception))
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                import time
-                time.sleep(wait_time)
-                continue
+        retry_after = None
+        with tracer.span("upstream.attempt", kind=CLIENT, attributes={
+            "upstream": upstream, "attempt": attempt + 1, "http.url": url
+        }) as span:
+            queue_start = perf_counter()
+            with limiter.acquire() as permit, upstream_in_flight.track(upstream):
+                span.set_attribute("queue_wait_ms", round((perf_counter() - queue_start) * 1000, 1))
+                start_time = time()
+                try:
+                    response = sessions[upstream].post(
+                        url,
+                        headers=tracer.inject(headers, span),
+                        timeout=(ENDPOINT_CONNECT_TIMEOUT, read_timeout or API_TIMEOUT),
+                        **request_body_kwargs(payload)
+                    )
+                except requests.exceptions.Timeout:
+                    permit.record("timeout")
+                    record_upstream_failure(upstream, timeout=True)
+                    last_exception = Exception(f"API请求超时 (尝试 {attempt + 1}/{max_retries})")
+                    span.set_error("timeout")
+                    logger.warning(str(last_exception))
+                except requests.exceptions.RequestException as e:
+                    permit.record("error")
+                    last_exception = Exception(f"API请求异常: {str(e)} (尝试 {attempt + 1}/{max_retries})")
+                    span.record_exception(e)
+                    logger.warning(str(last_exception))
+                else:
+                    latency = time() - start_time
+                    span.set_attribute("http.status_code", response.status_code)
+                    if response.status_code == 200:
+                        permit.record("success", latency)
+                        result = response.json()
+                        record_token_usage(upstream, result.get("usage"))
+                        return result
+                    if response.status_code in (429, 503):
+                        permit.record("overload", latency)
+                    else:
+                        permit.record("error", latency)
+                    record_upstream_failure(upstream, response.status_code)
+                    error_msg = f"API请求失败，状态码 {response.status_code}: {response.text[:500]}"
+                    if not retry_policy.should_retry_status(response.status_code):
+                        logger.error(error_msg)
+                        raise Exception(error_msg)
+                    last_exception = Exception(error_msg)
+                    span.set_error(f"HTTP {response.status_code}")
+                    retry_after = response.headers.get("Retry-After")
+                    logger.warning(f"{error_msg} (尝试 {attempt + 1}/{max_retries})")
+
+        if attempt < max_retries - 1:
+            upstream_retries_total.inc(upstream)
+            wait_time = retry_policy.compute_delay(attempt, retry_after)
+            logger.warning(f"等待 {wait_time:.2f} 秒后重试")
+            with tracer.span("retry.backoff", attributes={"upstream": upstream, "delay_ms": round(wait_time * 1000)}):
+                sleep(wait_time)
     
     raise last_exception or Exception("API请求失败，已达到最大重试次数")
 
 
-def analyze_medical_report_image(base64_image):
+def build_analysis_payload(base64_image, model=API_A_MODEL, stream=False) -> PreEncodedJSONBody:
     """
-    分析医疗报告图片（带缓存）
+    构建API A（视觉语言模型）请求体；base64_image为列表时构建一条包含多页图片的消息
+    base64图片数据以字节形式直接拼入预编码的请求体，不再构造data URL字符串和重复序列化
     """
-    # 检查缓存
-    cache_key = get_cache_key(base64_image, "analysis")
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    
+    base64_images = list(base64_image) if isinstance(base64_image, (list, tuple)) else [base64_image]
+    base64_images = [data.encode('ascii') if isinstance(data, str) else data for data in base64_images]
+    prompt = ANALYSIS_PROMPT
+    if len(base64_images) > 1:
+        prompt = MULTI_PAGE_ANALYSIS_PROMPT.format(page_count=len(base64_images))
+    placeholders = [IMAGE_URL_PLACEHOLDER.format(index=index) for index in range(len(base64_images))]
     payload = {
-        "model": API_A_MODEL,
+        "model": model,
         "messages": [
             {
                 "role": "user",
                 "content": [
                     {
                         "type": "text",
-                        "text": "请仔细分析这张医学检测报告图片，识别并列出其中的异常指标。如果没有发现异常指标，请明确说明'未发现异常指标'。请以简洁、专业的中文医学术语回答。"
-                    },
+                        "text": prompt
+                    }
+                ] + [
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
+                            "url": placeholder
                         }
                     }
+                    for placeholder in placeholders
                 ]
             }
         ],
     }
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    return build_json_body_with_parts(payload, [
+        (placeholder, (f"data:{image_mime_type(data)};base64,".encode('ascii'), data))
+        for placeholder, data in zip(placeholders, base64_images)
+    ])
+
+
+def build_recommendation_payload(analysis_result, model=API_B_MODEL, stream=False):
+    """构建API B（大语言模型）请求体"""
+    payload = {
+        "model": model,
+        "messages": [
+            {
+                "role": "user",
+                "content": RECOMMENDATION_PROMPT_TEMPLATE.format(analysis_result=analysis_result)
+            }
+        ],
+    }
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+
+def build_indicator_recommendation_payload(indicator, model=API_B_MODEL, stream=False):
+    """构建单项异常指标的API B请求体（推测模式）"""
+    payload = {
+        "model": model,
+        "messages": [
+            {
+                "role": "user",
+                "content": INDICATOR_RECOMMENDATION_PROMPT_TEMPLATE.format(indicator=indicator)
+            }
+        ],
+    }
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+
+def request_body_kwargs(payload):
+    """requests/httpx的请求体参数：预编码请求体按原样发送，dict由客户端序列化"""
+    if isinstance(payload, PreEncodedJSONBody):
+        return {"data": payload}
+    return {"json": payload}
+
+
+def abort_response(response):
+    """从其他线程中止流式响应：关闭底层套接字的读写，阻塞在读取上的线程立即返回（由读取线程关闭响应）"""
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is None:
+        # 上游要求关闭连接（Connection: close）时，http.client 已把套接字交给响应对象的文件对象
+        fp = getattr(getattr(response.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def stream_chat_completion(url, headers, payload, upstream="vl", max_retries=None, trace_parent=None,
+                           cancel_event=None, read_timeout=None):
+    """
+    以流式方式调用上游接口（payload需包含 stream: true），逐段产出增量文本
+    仅在收到响应数据之前对限流和网络错误重试，开始输出后不再重试；输出期间一直占用并发名额
+    :param trace_parent: 各次尝试span的父span（生成器中不激活span，默认为创建生成器后首次迭代时的当前span）
+    :param cancel_event: 可选，CancelEvent；被取消时中止上游连接（包括等待首个token期间），抛出SpeculationCancelled
+    :param read_timeout: 等待响应数据的超时（秒），默认为 API_TIMEOUT
+    """
+    if max_retries is None:
+        max_retries = retry_policy.max_attempts
+    limiter = upstream_limiters[upstream]
+    last_exception = None
+    for attempt in range(max_retries):
+        retry_after = None
+        with tracer.span("upstream.attempt", kind=CLIENT, attributes={
+            "upstream": upstream, "attempt": attempt + 1, "http.url": url, "stream": True
+        }, parent=trace_parent, activate=False) as span:
+            queue_start = perf_counter()
+            with limiter.acquire() as permit, upstream_in_flight.track(upstream):
+                span.set_attribute("queue_wait_ms", round((perf_counter() - queue_start) * 1000, 1))
+                if cancel_event is not None and cancel_event.is_set():
+                    raise SpeculationCancelled("推测任务已取消")
+                start_time = time()
+                try:
+                    response = sessions[upstream].post(
+                        url, headers=tracer.inject(headers, span),
+                        timeout=(ENDPOINT_CONNECT_TIMEOUT, read_timeout or API_TIMEOUT), stream=True, **request_body_kwargs(payload)
+                    )
+                except requests.exceptions.RequestException as e:
+                    timed_out = isinstance(e, requests.exceptions.Timeout)
+                    permit.record("timeout" if timed_out else "error")
+                    record_upstream_failure(upstream, timeout=timed_out)
+                    last_exception = Exception(f"API流式请求异常: {str(e)} (尝试 {attempt + 1}/{max_retries})")
+                    span.record_exception(e)
+                    logger.warning(str(last_exception))
+                else:
+                    span.set_attribute("http.status_code", response.status_code)
+                    if response.status_code != 200:
+                        error_msg = f"API流式请求失败，状态码 {response.status_code}: {response.text[:500]}"
+                        retry_after = response.headers.get("Retry-After")
+                        response.close()
+                        permit.record("overload" if response.status_code in (429, 503) else "error", time() - start_time)
+                        record_upstream_failure(upstream, response.status_code)
+                        if not retry_policy.should_retry_status(response.status_code):
+                            logger.error(error_msg)
+                            raise Exception(error_msg)
+                        last_exception = Exception(error_msg)
+                        span.set_error(f"HTTP {response.status_code}")
+                        logger.warning(f"{error_msg} (尝试 {attempt + 1}/{max_retries})")
+                    else:
+                        # 以首个数据到达的时间作为延迟样本（流式输出总时长取决于回复长度）
+                        first_data_latency = None
+                        abort = partial(abort_response, response)
+                        if cancel_event is not None:
+                            # 取消时直接中止连接（已取消时立即中止），不必等到下一段输出到达
+                            cancel_event.add_callback(abort)
+                        try:
+                            with response:
+                                # 按字节逐行解析SSE，避免requests按ISO-8859-1解码导致中文乱码
+                                for line in response.iter_lines():
+                                    if not line.startswith(b"data:"):
+                                        continue
+                                    if first_data_latency is None:
+                                        first_data_latency = time() - start_time
+                                        permit.record("success", first_data_latency)
+                                        span.add_event("first_data")
+                                    data = line[5:].strip()
+                                    if data == b"[DONE]":
+                                        return
+                                    chunk = json.loads(data)
+                                    # 最后一个数据块带有usage（请求体中的 stream_options.include_usage）
+                                    record_token_usage(upstream, chunk.get("usage"))
+                                    choices = chunk.get("choices") or []
+                                    if choices:
+                                        delta = (choices[0].get("delta") or {}).get("content")
+                                        if delta:
+                                            yield delta
+                        except Exception:
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise SpeculationCancelled("推测任务已取消，已中止上游连接")
+                            raise
+                        finally:
+                            if cancel_event is not None:
+                                cancel_event.remove_callback(abort)
+                        if cancel_event is not None and cancel_event.is_set():
+                            # 连接被中止后读到的是不完整的输出
+                            raise SpeculationCancelled("推测任务已取消，已中止上游连接")
+                        permit.record("success", first_data_latency or time() - start_time)
+                        return
+
+        if attempt < max_retries - 1:
+            upstream_retries_total.inc(upstream)
+            wait_time = retry_policy.compute_delay(attempt, retry_after)
+            logger.warning(f"等待 {wait_time:.2f} 秒后重试流式请求")
+            with tracer.span("retry.backoff", attributes={"upstream": upstream, "delay_ms": round(wait_time * 1000)},
+                             parent=trace_parent, activate=False):
+                sleep(wait_time)
+
+    raise last_exception or Exception("API流式请求失败，已达到最大重试次数")
+
+
+def call_stage_completion(stage, build_payload) -> str:
+    """
+    按端点注册表的路由顺序调用某个阶段的模型，端点失败时故障转移到下一个端点
+    还有后备端点时每个端点只尝试一次、最多等待 ENDPOINT_FAILOVER_TIMEOUT，最后一个端点按完整重试策略重试
+    :param build_payload: 根据模型名称构建请求体的函数
+    :return: 模型回复文本
+    """
+    with tracer.span(f"stage.{STAGE_METRIC_NAMES[stage]}", attributes={"stage": stage}) as stage_span:
+        record_upstream_call()
+        stage_start = perf_counter()
+        status = "error"
+        try:
+            candidates = endpoint_registry.candidates(stage)
+            last_exception = None
+            for index, endpoint in enumerate(candidates):
+                if not endpoint.breaker.allow_request():
+                    continue
+                is_last = index == len(candidates) - 1
+                start_time = time()
+                try:
+                    result = make_api_request_with_retry(
+                        endpoint.chat_url,
+                        endpoint.headers(),
+                        build_payload(endpoint.model),
+                        upstream=stage,
+                        max_retries=None if is_last else 1,
+                        read_timeout=None if is_last else ENDPOINT_FAILOVER_TIMEOUT
+                    )
+                    content = result["choices"][0]["message"]["content"]
+                except OverloadedError:
+                    # 本地并发预算已满，与端点健康无关
+                    endpoint.breaker.release()
+                    status = "overload"
+                    raise
+                except Exception as e:
+                    endpoint.record_failure()
+                    last_exception = e
+                    stage_span.add_event("endpoint_failed", {"endpoint": endpoint.name, "error": str(e)[:200]})
+                    logger.warning(f"端点 {endpoint.name} 请求失败{'' if is_last else '，转移到下一个端点'}: {str(e)}")
+                    continue
+                endpoint.record_success(time() - start_time)
+                stage_span.set_attribute("endpoint", endpoint.name)
+                status = "success"
+                return content
+
+            raise last_exception or Exception(f"阶段 {stage} 没有可用的模型端点（熔断器均已打开）")
+        finally:
+            # 失败、被拒绝和取消的调用同样计入阶段耗时，以status区分
+            stage_duration.observe(perf_counter() - stage_start, STAGE_METRIC_NAMES[stage], status)
+
+
+def stream_stage_completion(stage, build_payload, cancel_event=None):
+    """
+    流式调用某个阶段的模型，逐段产出增量文本；只在收到第一段输出之前进行端点故障转移
+    :param cancel_event: 可选，CancelEvent（推测任务）；被取消时中止上游连接并抛出SpeculationCancelled，不转移到下一个端点
+    """
+    # 生成器中不激活span（挂起期间调用方创建的span不应挂在其下），各次尝试显式以它为父span
+    with tracer.span(f"stage.{STAGE_METRIC_NAMES[stage]}", attributes={"stage": stage, "stream": True},
+                     activate=False) as stage_span:
+        record_upstream_call()
+        stage_start = perf_counter()
+        status = "error"
+        try:
+            candidates = endpoint_registry.candidates(stage)
+            last_exception = None
+            for index, endpoint in enumerate(candidates):
+                if not endpoint.breaker.allow_request():
+                    continue
+                is_last = index == len(candidates) - 1
+                start_time = time()
+                started = False
+                try:
+                    for delta in stream_chat_completion(
+                        endpoint.chat_url,
+                        endpoint.headers(),
+                        build_payload(endpoint.model, stream=True),
+                        upstream=stage,
+                        max_retries=None if is_last else 1,
+                        trace_parent=stage_span,
+                        cancel_event=cancel_event,
+                        read_timeout=None if is_last else ENDPOINT_FAILOVER_TIMEOUT
+                    ):
+                        if not started:
+                            started = True
+                            endpoint.record_success(time() - start_time)
+                            stage_span.set_attribute("endpoint", endpoint.name)
+                        yield delta
+                except OverloadedError:
+                    endpoint.breaker.release()
+                    status = "overload"
+                    raise
+                except (GeneratorExit, SpeculationCancelled):
+                    # 调用方提前关闭或推测任务被取消：还没有输出时归还熔断器的试探名额
+                    if not started:
+                        endpoint.breaker.release()
+                    status = "cancelled"
+                    raise
+                except Exception as e:
+                    endpoint.record_failure()
+                    if started:
+                        raise
+                    last_exception = e
+                    stage_span.add_event("endpoint_failed", {"endpoint": endpoint.name, "error": str(e)[:200]})
+                    logger.warning(f"端点 {endpoint.name} 流式请求失败{'' if is_last else '，转移到下一个端点'}: {str(e)}")
+                    continue
+                if not started:
+                    endpoint.record_success(time() - start_time)
+                status = "success"
+                return
+
+            raise last_exception or Exception(f"阶段 {stage} 没有可用的模型端点（熔断器均已打开）")
+        finally:
+            # 失败、被拒绝和取消的调用同样计入阶段耗时，以status区分
+            stage_duration.observe(perf_counter() - stage_start, STAGE_METRIC_NAMES[stage], status)
+
+
+def get_recommendation_fingerprint(analysis_result):
+    """
+    生成健康建议的缓存指纹：分析结果能规范化为 (指标, 方向) 组合时基于该组合（不同患者的相同异常组合共用），
+    否则基于完整分析结果的摘要
+    """
+    findings = canonical_findings(analysis_result)
+    if findings:
+        content = f"findings|{canonical_key(findings)}"
+    else:
+        content = analysis_result
+    content_digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    return get_cache_fingerprint(content_digest, "recommendations", endpoint_registry.models("llm"))
+
+
+def get_indicator_fingerprint(finding):
+    """单项指标健康建议的缓存指纹（基于规范化的 指标:方向）"""
+    finding_digest = hashlib.sha256(f"finding|{finding.key}".encode('utf-8')).hexdigest()
+    return get_cache_fingerprint(finding_digest, "indicator_recommendation", endpoint_registry.models("llm"))
+
+
+def lookup_cached_recommendations(analysis_result) -> Optional[str]:
+    """
+    查找健康建议缓存：先按指标组合（或完整分析结果）查找；未命中时如果组合中每个指标都有单项建议缓存
+    （推测模式生成），直接合并单项建议，不调用API B；仍未命中时查找相似度索引
+    """
+    cached_result = get_from_cache(get_recommendation_fingerprint(analysis_result), "recommendations")
+    findings = canonical_findings(analysis_result)
+    if findings and not cached_result:
+        cached_result = compose_indicator_recommendations(findings)
+    if not cached_result:
+        cached_result = lookup_similar_recommendations(analysis_result, findings)
+    return cached_result
+
+
+def get_similarity_namespace(findings) -> str:
+    """
+    相似度索引的命名空间：模型、提示词版本和异常指标所属的类别集合（不含具体指标和方向）。
+    指标组合完全相同的分析结果已由精确缓存命中，相似度索引用于复用同类别下相近（多或少一两项）的组合的建议
+    """
+    return f"{endpoint_registry.models('llm')}|{PROMPT_VERSION}|{canonical_categories(findings)}"
+
+
+def lookup_similar_recommendations(analysis_result, findings) -> Optional[str]:
+    """
+    在相似度索引中查找相近的已回答分析结果，返回其健康建议
+    分析结果不能完整规范化（findings为None）时不使用相似度缓存；相同指标方向相反的条目不复用（如"升高"与"降低"）
+    """
+    if similarity_index is None or not findings:
+        return None
+    namespace = get_similarity_namespace(findings)
+    with tracer.span("cache.similarity_lookup") as span:
+        match = similarity_index.lookup(
+            analysis_result, namespace, accept=lambda text: not conflicting_findings(findings, canonical_findings(text))
+        )
+        span.set_attribute("cache.result", "miss" if match is None else "hit")
+        if match is not None:
+            span.set_attribute("similarity.score", round(match[1], 4))
+    if match is None:
+        return None
+    value, score = match
+    logger.info(f"相似度缓存命中（相似度 {score:.3f}）")
+    return value
+
+
+def remember_recommendations(analysis_result, fingerprint, content):
+    """写入健康建议缓存，并加入相似度索引"""
+    set_to_cache(fingerprint, content)
+    findings = canonical_findings(analysis_result) if similarity_index is not None else None
+    if findings:
+        similarity_index.insert(analysis_result, content, get_similarity_namespace(findings))
+
+
+def compose_indicator_recommendations(findings) -> Optional[str]:
+    """由各指标的单项建议缓存合并健康建议；任一指标未缓存时返回None（之后的指标不再查找，也不计入统计）"""
+    recommendations = []
+    for finding in findings:
+        cached_result = get_from_cache(get_indicator_fingerprint(finding), "indicator_recommendation")
+        indicator_cache_stats.record(finding.key, "hits" if cached_result else "misses")
+        if not cached_result:
+            return None
+        recommendations.append(cached_result)
+    logger.info(f"由 {len(findings)} 项指标的单项建议缓存合并健康建议")
+    return merge_indicator_recommendations([finding.label for finding in findings], recommendations)
+
+
+def analyze_medical_report_image(base64_image, image_digest):
+    """
+    分析医疗报告图片（带缓存，缓存键基于图片像素摘要；同一图片的并发请求合并为一次上游调用）
+    """
+    # 检查缓存
+    fingerprint = get_cache_fingerprint(image_digest, "analysis", endpoint_registry.models("vl"))
+    cached_result = get_from_cache(fingerprint, "analysis")
+    if cached_result:
+        return cached_result
     
+    content, shared = analysis_flight.do(fingerprint, request_medical_report_analysis, base64_image, fingerprint)
+    if shared:
+        record_upstream_call(shared=True)
+        current_span().add_event("singleflight_shared", {"stage": "vl"})
+        logger.info(f"复用进行中的API A请求结果: {fingerprint[:8]}...")
+    return content
+
+
+def request_medical_report_analysis(base64_image, fingerprint):
+    """
+    调用API A分析医疗报告图片，并写入缓存
+    """
     start_time = time()
     try:
-        result = make_api_request_with_retry(
-            f"{OPENROUTER_API_BASE}/chat/completions",
-            headers,
-            payload
-        )
+        content = call_stage_completion("vl", partial(build_analysis_payload, base64_image))
         elapsed_time = time() - start_time
-        content = result["choices"][0]["message"]["content"]
         logger.info(f"API A请求成功，耗时 {elapsed_time:.2f} 秒")
         
         # 保存到缓存
-        set_to_cache(cache_key, content)
+        set_to_cache(fingerprint, content)
         return content
     except Exception as e:
         elapsed_time = time() - start_time
@@ -303,42 +1001,40 @@ def analyze_medical_report_image(base64_image):
 
 def get_health_recommendations(analysis_result):
     """
-    获取健康建议（带缓存）
+    获取健康建议（带缓存；相同指标组合或分析结果的并发请求合并为一次上游调用）
     """
-    # 检查缓存（基于分析结果）
-    cache_key = get_cache_key(analysis_result, "recommendations")
-    cached_result = get_from_cache(cache_key)
+    # 检查缓存（基于规范化的指标组合，或完整分析结果的摘要）
+    cached_result = lookup_cached_recommendations(analysis_result)
     if cached_result:
         return cached_result
-    
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    
-    payload = {
-        "model": API_B_MODEL,
-        "messages": [
-            {
-                "role": "user",
-                "content": f"根据以下医学检测报告分析结果，提供相应的健康建议和注意事项：\n\n{analysis_result}\n\n请以简洁明了的中文给出实用的健康建议，包括饮食、运动和生活方式等方面的指导。"
-            }
-        ],
-    }
-    
+    return fetch_health_recommendations(analysis_result)
+
+
+def fetch_health_recommendations(analysis_result):
+    """
+    缓存未命中时调用API B获取健康建议（相同指标组合或分析结果的并发请求合并为一次上游调用）
+    """
+    fingerprint = get_recommendation_fingerprint(analysis_result)
+    content, shared = recommendation_flight.do(fingerprint, request_health_recommendations, analysis_result, fingerprint)
+    if shared:
+        record_upstream_call(shared=True)
+        current_span().add_event("singleflight_shared", {"stage": "llm"})
+        logger.info(f"复用进行中的API B请求结果: {fingerprint[:8]}...")
+    return content
+
+
+def request_health_recommendations(analysis_result, fingerprint):
+    """
+    调用API B获取健康建议，并写入缓存
+    """
     start_time = time()
     try:
-        result = make_api_request_with_retry(
-            f"{OPENROUTER_API_BASE}/chat/completions",
-            headers,
-            payload
-        )
+        content = call_stage_completion("llm", partial(build_recommendation_payload, analysis_result))
         elapsed_time = time() - start_time
-        content = result["choices"][0]["message"]["content"]
         logger.info(f"API B请求成功，耗时 {elapsed_time:.2f} 秒")
         
         # 保存到缓存
-        set_to_cache(cache_key, content)
+        remember_recommendations(analysis_result, fingerprint, content)
         return content
     except Exception as e:
         elapsed_time = time() - start_time
@@ -346,95 +1042,519 @@ def get_health_recommendations(analysis_result):
         raise
 
 
-def validate_image_file(image_file):
+@tracer.traced("prepare_image")
+def prepare_image(image_source, preprocess=None) -> Tuple[bytes, str]:
     """
-    验证图片文件
+    解码图片、计算像素摘要、调整大小（或按档位做化验单预处理）并编码为base64
+    启用图片处理工作进程池（IMAGE_WORKERS > 0）时在工作进程中执行，不占用请求线程的GIL
+    :param image_source: 图片文件对象（如上传文件的流，直接从中解码，不先读成bytes）、bytes或已解码的图片（如PDF页面）
+    :param preprocess: 预处理档位（none/document/binary），None表示使用 PREPROCESS_PROFILE
+    :return: (base64字节, 像素摘要)；启用预处理时摘要包含档位，不同档位的结果分别缓存
     """
-    if not image_file or image_file.filename == '':
-        raise ValueError("未提供有效的图像文件")
-    
-    # 检查文件扩展名
-    allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-    file_ext = os.path.splitext(image_file.filename.lower())[1]
-    if file_ext not in allowed_extensions:
-        raise ValueError(f"不支持的文件格式: {file_ext}。支持的格式: {', '.join(allowed_extensions)}")
+    profile = normalize_profile(preprocess, PREPROCESS_PROFILE)
+    timings = {}
+    if image_worker_pool is not None:
+        base64_image, image_digest = image_worker_pool.process(image_source, profile, timings)
+        logger.info(f"图像已在工作进程中处理，像素摘要: {image_digest[:16]}，base64大小: {len(base64_image)} 字符")
+    else:
+        base64_image, image_digest = process_image(
+            image_source, MAX_IMAGE_SIZE, profile, JPEG_DRAFT_MODE, PREPROCESS_TEXT_HEIGHT, timings
+        )
+    for step, seconds in timings.items():
+        stage_duration.observe(seconds, step, "success")
+    record_image_spans(timings, profile)
+    return base64_image, image_digest
+
+
+def record_image_spans(timings, profile):
+    """
+    按各步骤耗时补记缩放（resize_image）和编码（encode_image_to_base64）的子span：
+    两步在 process_image 中（可能在工作进程中）依次执行，编码结束于返回前
+    """
+    span = current_span()
+    if not span.sampled:
+        return
+    span.set_attribute("image.profile", profile)
+    span.set_attribute("image.worker_process", image_worker_pool is not None)
+    encode_end = time_ns()
+    encode_start = encode_end - int(timings.get("encode", 0) * 1e9)
+    resize_start = encode_start - int(timings.get("resize", 0) * 1e9)
+    if "resize" in timings:
+        tracer.record_span("image.resize", resize_start, encode_start)
+    if "encode" in timings:
+        tracer.record_span("image.encode", encode_start, encode_end)
+
+
+def run_analysis_pipeline(base64_image, image_digest, speculative=False) -> dict:
+    """
+    完整分析流程：API A分析报告图片 → API B生成健康建议
+    :param speculative: 使用推测模式（见 run_speculative_pipeline）
+    :return: 与分析端点响应格式一致的结果（不含processing_time）
+    """
+    if speculative:
+        return run_speculative_pipeline(base64_image, image_digest)
+    upstream_calls = track_upstream_calls()
+
+    # 调用API A进行医疗报告分析
+    logger.info("将图像发送到API A进行医疗报告分析")
+    analysis_start = time()
+    analysis_result = analyze_medical_report_image(base64_image, image_digest)
+    analysis_time = time() - analysis_start
+    logger.info(f"从API A收到分析结果，长度: {len(analysis_result)} 字符，耗时: {analysis_time:.2f}秒")
     
-    # 检查文件大小
-    image_file.seek(0, os.SEEK_END)
-    file_size = image_file.tell()
-    image_file.seek(0)
+    # 调用API B获取健康建议（在分析完成后）
+    logger.info("将分析结果发送到API B获取健康建议")
+    recommendation_start = time()
+    health_recommendations = get_health_recommendations(analysis_result)
+    recommendation_time = time() - recommendation_start
+    logger.info(f"从API B收到健康建议，长度: {len(health_recommendations)} 字符，耗时: {recommendation_time:.2f}秒")
     
-    if file_size > MAX_FILE_SIZE:
-        raise ValueError(f"文件大小超过限制: {file_size / 1024 / 1024:.2f}MB (最大: {MAX_FILE_SIZE / 1024 / 1024:.2f}MB)")
+    return {
+        "analysis_result": analysis_result,
+        "health_recommendations": health_recommendations,
+        "analysis_time": round(analysis_time, 2),
+        "recommendation_time": round(recommendation_time, 2),
+        "cache_hit": upstream_calls.cache_hit
+    }
+
+
+def get_indicator_recommendation(indicator, cancel_event) -> str:
+    """
+    生成单项异常指标的健康建议（推测模式，带缓存）
+    指标行能规范化为单个 (指标, 方向) 且没有提到临床背景（如妊娠）时按规范化结果缓存（不同患者共用），否则按指标行原文缓存
+    以流式方式调用API B：任务被取消时立即中止上游连接（包括等待首个token期间；vLLM等会随之中止生成），
+    不再占用上游的并发名额
+    """
+    findings = extract_findings(indicator)
+    finding = findings[0] if len(findings) == 1 and not has_clinical_context(indicator) else None
+    if finding is not None:
+        fingerprint = get_indicator_fingerprint(finding)
+    else:
+        fingerprint = get_cache_fingerprint(
+            hashlib.sha256(indicator.encode('utf-8')).hexdigest(), "indicator_recommendation",
+            endpoint_registry.models("llm")
+        )
+    cached_result = get_from_cache(fingerprint, "indicator_recommendation")
+    if finding is not None:
+        indicator_cache_stats.record(finding.key, "hits" if cached_result else "misses")
+    if cached_result:
+        return cached_result
+
+    content = "".join(stream_stage_completion(
+        "llm", partial(build_indicator_recommendation_payload, indicator), cancel_event=cancel_event
+    ))
+    set_to_cache(fingerprint, content)
+    return content
+
+
+def create_speculation() -> SpeculativeRecommendations:
+    """
+    创建一个请求的推测任务：并行生成的指标数不超过 SPECULATIVE_MAX_INDICATORS，
+    也不超过API B当前并发上限减一（为其他请求留出名额，避免一个请求的推测任务占满API B的预算），超过时回退
+    """
+    max_indicators = min(SPECULATIVE_MAX_INDICATORS, max(1, int(upstream_limiters["llm"].limit) - 1))
+    return SpeculativeRecommendations(speculation_executor, get_indicator_recommendation, max_indicators)
+
+
+def resolve_speculation(speculation, analysis_result) -> Optional[str]:
+    """等待并合并推测生成的健康建议，合并结果与API B生成的建议一样按分析结果写入健康建议缓存"""
+    content = speculation.resolve(analysis_result)
+    if content is not None:
+        remember_recommendations(analysis_result, get_recommendation_fingerprint(analysis_result), content)
+    return content
+
+
+def run_speculative_pipeline(base64_image, image_digest) -> dict:
+    """
+    推测模式的分析流程：以流式方式调用API A，每输出完一行异常指标就并行生成该指标的健康建议，
+    与API A剩余的输出重叠执行；分析完成后以最终结果为准取消或补齐，合并为一份健康建议
+    没有可解析的异常指标列表时回退为对整份分析结果调用一次API B；
+    健康建议缓存命中时直接使用（分析结果已缓存时在推测之前查找，否则在分析完成后查找并取消推测任务）
+    :return: 与 run_analysis_pipeline 相同，另含 speculative 统计（指标数、提前提交数、取消数、是否回退）
+    """
+    upstream_calls = track_upstream_calls()
+    speculation = create_speculation()
+    try:
+        logger.info("将图像发送到API A进行医疗报告分析（推测模式）")
+        analysis_start = time()
+        fingerprint = get_cache_fingerprint(image_digest, "analysis", endpoint_registry.models("vl"))
+        analysis_result = get_from_cache(fingerprint, "analysis")
+        health_recommendations = None
+        if analysis_result:
+            # 分析结果已缓存：先查找健康建议缓存，命中时不再推测生成单项建议
+            health_recommendations = lookup_cached_recommendations(analysis_result)
+            if health_recommendations is None:
+                speculation.feed(analysis_result)
+        else:
+            analysis_parts = []
+            for delta in stream_analysis_completion(base64_image, fingerprint):
+                analysis_parts.append(delta)
+                speculation.feed(delta)
+            analysis_result = "".join(analysis_parts)
+            # 流式输出期间无法按完整分析结果查找缓存，分析完成后再查找；命中时取消尚未完成的推测任务
+            health_recommendations = lookup_cached_recommendations(analysis_result)
+        analysis_time = time() - analysis_start
+        logger.info(f"从API A收到分析结果，长度: {len(analysis_result)} 字符，耗时: {analysis_time:.2f}秒，"
+                    f"已提前提交 {len(speculation.tasks)} 项指标的建议生成")
+
+        recommendation_start = time()
+        if health_recommendations is None:
+            health_recommendations = resolve_speculation(speculation, analysis_result)
+        if health_recommendations is None:
+            health_recommendations = fetch_health_recommendations(analysis_result)
+        recommendation_time = time() - recommendation_start
+        logger.info(f"健康建议已生成，长度: {len(health_recommendations)} 字符，分析完成后等待: {recommendation_time:.2f}秒")
+    finally:
+        speculation.cancel()
+
+    return {
+        "analysis_result": analysis_result,
+        "health_recommendations": health_recommendations,
+        "analysis_time": round(analysis_time, 2),
+        "recommendation_time": round(recommendation_time, 2),
+        "cache_hit": upstream_calls.cache_hit,
+        "speculative": speculation.stats()
+    }
+
+
+def use_speculation(value) -> bool:
+    """请求的 speculative 表单字段（true/false），未提供时使用 SPECULATIVE_RECOMMENDATIONS"""
+    if value is None or value == '':
+        return SPECULATIVE_RECOMMENDATIONS
+    return value.lower() == 'true'
+
+
+@tracer.traced("report_page")
+def analyze_report_page(page_number, page, preprocess=None) -> dict:
+    """预处理并分析多页报告中的一页（在page_executor中执行，各页互不等待）"""
+    current_span().set_attribute("page", page_number)
+    start_time = time()
+    base64_image, image_digest = prepare_image(page.source, preprocess)
+    preprocess_time = time() - start_time
+    analysis_result = analyze_medical_report_image(base64_image, image_digest)
+    return {
+        "page": page_number,
+        "source": page.label,
+        "analysis_result": analysis_result,
+        "preprocess_time": round(preprocess_time, 2),
+        "analysis_time": round(time() - start_time - preprocess_time, 2),
+    }
+
+
+def prepare_report_page(page, preprocess=None):
+    """只预处理一页（多图消息模式下各页并行预处理后合并为一次API A调用）"""
+    start_time = time()
+    base64_image, image_digest = prepare_image(page.source, preprocess)
+    return base64_image, image_digest, time() - start_time
+
+
+def combine_page_digests(image_digests) -> str:
+    """多图消息的缓存摘要：由各页像素摘要按顺序组合（页面相同但顺序不同视为不同的报告）"""
+    return hashlib.sha256("|".join(["pages"] + list(image_digests)).encode()).hexdigest()
+
+
+def wait_for_pages(futures) -> list:
+    """按页码顺序等待各页结果；任意一页失败时取消尚未开始的页面并抛出异常"""
+    try:
+        return [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def run_multi_page_pipeline(pages, preprocess=None) -> dict:
+    """
+    多页报告分析流程：各页并行预处理并并发调用API A（MULTI_IMAGE_MESSAGE=true 时所有页合并为一条多图消息），
+    合并各页的分析结果后只调用一次API B
+    :return: 与分析端点响应格式一致的结果（不含processing_time），另含各页的耗时
+    """
+    logger.info(f"将 {len(pages)} 页图像发送到API A进行医疗报告分析")
+    upstream_calls = track_upstream_calls()
+    analysis_start = time()
+    # 各页任务在复制的上下文中执行，上游调用计入本次请求
+    if MULTI_IMAGE_MESSAGE:
+        prepared = wait_for_pages([
+            page_executor.submit(contextvars.copy_context().run, prepare_report_page, page, preprocess)
+            for page in pages
+        ])
+        combined_digest = combine_page_digests(digest for _, digest, _ in prepared)
+        analysis_result = analyze_medical_report_image([base64_image for base64_image, _, _ in prepared], combined_digest)
+        page_results = [
+            {"page": number, "source": page.label, "preprocess_time": round(preprocess_time, 2)}
+            for number, (page, (_, _, preprocess_time)) in enumerate(zip(pages, prepared), 1)
+        ]
+    else:
+        page_results = wait_for_pages([
+            page_executor.submit(contextvars.copy_context().run, analyze_report_page, number, page, preprocess)
+            for number, page in enumerate(pages, 1)
+        ])
+        analysis_result = merge_page_findings(page_results)
+    analysis_time = time() - analysis_start
+    logger.info(f"从API A收到 {len(pages)} 页的分析结果，长度: {len(analysis_result)} 字符，耗时: {analysis_time:.2f}秒")
+
+    logger.info("将合并后的分析结果发送到API B获取健康建议")
+    recommendation_start = time()
+    health_recommendations = get_health_recommendations(analysis_result)
+    recommendation_time = time() - recommendation_start
+    logger.info(f"从API B收到健康建议，长度: {len(health_recommendations)} 字符，耗时: {recommendation_time:.2f}秒")
+
+    return {
+        "analysis_result": analysis_result,
+        "health_recommendations": health_recommendations,
+        "analysis_time": round(analysis_time, 2),
+        "recommendation_time": round(recommendation_time, 2),
+        "cache_hit": upstream_calls.cache_hit,
+        "page_count": len(pages),
+        "pages": page_results
+    }
+
+
+def submit_analysis_job(base64_image, image_digest, callback_url=None) -> Tuple[str, bool]:
+    """
+    提交异步分析任务；同一图片已有进行中的任务时合并到该任务
+    :return: (任务ID, 是否合并到已有任务)
+    """
+    global pending_job_count
+    with job_submit_lock:
+        job_id = job_store.find_active(image_digest)
+        coalesced = job_id is not None
+        if not coalesced:
+            if pending_job_count >= JOB_MAX_PENDING:
+                raise JobQueueFullError(f"任务队列已满（{JOB_MAX_PENDING}），请稍后重试")
+            job_id = job_store.create(image_digest)
+            pending_job_count += 1
+        if callback_url:
+            job_store.add_callback(job_id, callback_url)
     
-    return True
+    if coalesced:
+        logger.info(f"图像 {image_digest[:16]} 已有进行中的任务，合并到任务 {job_id}")
+    else:
+        # 在提交请求的上下文中执行：任务的span接在创建任务的请求span之下
+        executor.submit(contextvars.copy_context().run, run_analysis_job, job_id, base64_image, image_digest)
+        logger.info(f"已创建分析任务 {job_id}")
+    return job_id, coalesced
+
+
+@tracer.traced("analysis_job")
+def run_analysis_job(job_id, base64_image, image_digest):
+    """
+    在线程池中执行分析任务，并持久化任务状态
+    """
+    global pending_job_count
+    job_start_time = time()
+    result, error = None, None
+    status = "error"
+    try:
+        job_store.mark_running(job_id)
+        result = run_analysis_pipeline(base64_image, image_digest)
+        result["processing_time"] = round(time() - job_start_time, 2)
+        status = "success"
+        logger.info(f"分析任务 {job_id} 完成，耗时 {result['processing_time']:.2f} 秒")
+    except OverloadedError as e:
+        logger.warning(f"分析任务 {job_id} 被准入控制拒绝: {str(e)}")
+        error = "服务繁忙，请稍后重试"
+        status = "overload"
+    except Exception as e:
+        logger.error(f"分析任务 {job_id} 失败: {str(e)}", exc_info=True)
+        error = "服务器内部错误，请稍后重试"
+    finally:
+        # 异步任务的总耗时（不含排队等待线程池的时间）与同步请求一样计入 total
+        stage_duration.observe(time() - job_start_time, "total", status)
+        # 在提交锁内结束任务，保证合并提交登记的回调不会在通知之后才写入
+        with job_submit_lock:
+            if result is not None:
+                job_store.mark_succeeded(job_id, result)
+            else:
+                job_store.mark_failed(job_id, error or "任务执行中断")
+            pending_job_count -= 1
+    notify_job_callbacks(job_id)
+
+
+def notify_job_callbacks(job_id):
+    """
+    任务结束后向登记的回调地址POST任务状态：每个地址在回调线程池中单独发送，
+    响应慢或不可达的回调地址不占用分析任务的线程
+    """
+    job = job_store.get(job_id)
+    for callback_url in job_store.get_callback_urls(job_id):
+        callback_executor.submit(contextvars.copy_context().run, send_job_callback, job_id, job, callback_url)
+
+
+def send_job_callback(job_id, job, callback_url):
+    """向一个回调地址POST任务状态（失败时重试，不影响任务结果）"""
+    # 发送前重新验证：提交任务后主机名可能被解析到其他地址
+    try:
+        validate_callback_url(callback_url)
+    except ValueError as e:
+        logger.warning(f"任务 {job_id} 跳过回调: {str(e)}")
+        return
+    for attempt in range(JOB_CALLBACK_RETRIES):
+        try:
+            # 不跟随重定向，避免被重定向到内网地址
+            response = requests.post(callback_url, json=job, timeout=JOB_CALLBACK_TIMEOUT, allow_redirects=False)
+            if response.status_code < 400:
+                return
+            logger.warning(f"任务 {job_id} 回调返回状态码 {response.status_code}: {callback_url}")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"任务 {job_id} 回调失败 (尝试 {attempt + 1}/{JOB_CALLBACK_RETRIES}): {str(e)}")
+        if attempt < JOB_CALLBACK_RETRIES - 1:
+            sleep(2 ** attempt)
+
+
+def validate_callback_url(callback_url):
+    """
+    验证回调地址，防止通过回调访问内部服务（SSRF）：
+    配置了 JOB_CALLBACK_ALLOWED_HOSTS 时主机名必须在列表中；
+    否则解析主机名，任一地址为内网、回环、链路本地、组播、保留或未指定地址时拒绝
+    """
+    parsed = urlparse(callback_url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError(f"无效的回调地址: {callback_url}")
+    host = parsed.hostname.lower()
+    if JOB_CALLBACK_ALLOWED_HOSTS:
+        if host not in JOB_CALLBACK_ALLOWED_HOSTS:
+            raise ValueError(f"回调地址的主机不在允许列表中: {host}")
+        return
+    try:
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (ValueError, socket.gaierror):
+        raise ValueError(f"无法解析回调地址的主机: {host}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"回调地址不能指向内网或本地地址: {host}")
+
+
+def stream_analysis_completion(base64_image, fingerprint):
+    """
+    流式调用API A（不查找缓存），逐段产出文本，完成后以fingerprint写入缓存
+    """
+    parts = []
+    for delta in stream_stage_completion("vl", partial(build_analysis_payload, base64_image)):
+        parts.append(delta)
+        yield delta
+    set_to_cache(fingerprint, "".join(parts))
+
+
+def stream_recommendation_completion(analysis_result):
+    """
+    流式调用API B获取健康建议（不查找缓存，调用方已用 lookup_cached_recommendations 查找），逐段产出文本，完成后写入缓存
+    """
+    fingerprint = get_recommendation_fingerprint(analysis_result)
+    parts = []
+    for delta in stream_stage_completion("llm", partial(build_recommendation_payload, analysis_result)):
+        parts.append(delta)
+        yield delta
+    remember_recommendations(analysis_result, fingerprint, "".join(parts))
+
+
+def overloaded_response(error):
+    """上游繁忙时的快速拒绝响应（503 + Retry-After）"""
+    response = jsonify({"error": "服务繁忙，请稍后重试"})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+def format_sse(event, data):
+    """格式化一条server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@tracer.traced("validate_image_file")
+def validate_image_file(image_file, allow_pdf=False):
+    """
+    验证图片文件（allow_pdf=True 时也接受PDF）
+    """
+    start_time = perf_counter()
+    status = "error"
+    try:
+        if not image_file or image_file.filename == '':
+            raise ValueError("未提供有效的图像文件")
+
+        # 检查文件扩展名
+        allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+        if allow_pdf:
+            allowed_extensions.add('.pdf')
+        file_ext = os.path.splitext(image_file.filename.lower())[1]
+        if file_ext not in allowed_extensions:
+            raise ValueError(f"不支持的文件格式: {file_ext}。支持的格式: {', '.join(allowed_extensions)}")
+
+        # 检查文件大小
+        image_file.seek(0, os.SEEK_END)
+        file_size = image_file.tell()
+        image_file.seek(0)
+
+        current_span().set_attribute("file.size", file_size)
+        if file_size > MAX_FILE_SIZE:
+            raise ValueError(f"文件大小超过限制: {file_size / 1024 / 1024:.2f}MB (最大: {MAX_FILE_SIZE / 1024 / 1024:.2f}MB)")
+
+        status = "success"
+        return True
+    finally:
+        stage_duration.observe(perf_counter() - start_time, "validate", status)
 
 
 @app.route('/analyze_medical_report', methods=['POST'])
 def analyze_medical_report():
     """
     分析医疗报告的主端点
+    可以上传多个 image 字段（多页报告的各页）或PDF，各页并行分析后合并，只生成一次健康建议
+    单张图片时可用 speculative 字段（true/false）启用推测模式：边分析边按异常指标并行生成健康建议
     """
     request_start_time = time()
     logger.info("收到医疗报告分析请求")
+    status = "error"  # 计入总耗时的结果：success / client_error / overload / error
     
     try:
         # 验证请求
         if 'image' not in request.files:
             logger.warning("请求中未提供图像文件")
+            status = "client_error"
             return jsonify({"error": "未提供图像文件"}), 400
         
-        image_file = request.files['image']
+        image_files = request.files.getlist('image')
         
         # 验证图片文件
         try:
-            validate_image_file(image_file)
+            if len(image_files) > MAX_REPORT_PAGES:
+                raise ValueError(f"报告页数超过限制: 最多 {MAX_REPORT_PAGES} 页")
+            for image_file in image_files:
+                validate_image_file(image_file, allow_pdf=True)
         except ValueError as e:
             logger.warning(f"图片验证失败: {str(e)}")
+            status = "client_error"
             return jsonify({"error": str(e)}), 400
         
-        logger.info(f"正在处理图像文件: {image_file.filename}")
-        
-        # 读取并调整图片大小
-        image_data = io.BytesIO(image_file.read())
-        logger.info("调整图像大小")
-        resized_image = resize_image(image_data, max_size=MAX_IMAGE_SIZE)
-        
-        # 编码为base64
-        logger.info("将图像编码为base64")
-        base64_image = encode_image_to_base64(resized_image)
-        logger.info(f"图像已成功编码为base64，大小: {len(base64_image)} 字符")
-       
-        # 调用API A进行医疗报告分析
-        logger.info("将图像发送到API A进行医疗报告分析")
-        analysis_start = time()
-        analysis_result = analyze_medical_report_image(base64_image)
-        analysis_time = time() - analysis_start
-        logger.info(f"从API A收到分析结果，长度: {len(analysis_result)} 字符，耗时: {analysis_time:.2f}秒")
-        
-        # 调用API B获取健康建议（在分析完成后）
-        logger.info("将分析结果发送到API B获取健康建议")
-        recommendation_start = time()
-        health_recommendations = get_health_recommendations(analysis_result)
-        recommendation_time = time() - recommendation_start
-        logger.info(f"从API B收到健康建议，长度: {len(health_recommendations)} 字符，耗时: {recommendation_time:.2f}秒")
+        if len(image_files) == 1 and not is_pdf_file(image_files[0].filename):
+            image_file = image_files[0]
+            logger.info(f"正在处理图像文件: {image_file.filename}")
+            
+            # 读取、调整图片大小并编码为base64
+            base64_image, image_digest = prepare_image(image_file.stream, request.form.get('preprocess'))
+            
+            result = run_analysis_pipeline(base64_image, image_digest, use_speculation(request.form.get('speculative')))
+        else:
+            logger.info(f"正在处理多页报告: {', '.join(image_file.filename for image_file in image_files)}")
+            pages = collect_report_pages(image_files, MAX_REPORT_PAGES, PDF_RENDER_DPI)
+            result = run_multi_page_pipeline(pages, request.form.get('preprocess'))
        
         # 返回结果
         total_time = time() - request_start_time
-        logger.info(f"请求处理完成，总耗时: {total_time:.2f} 秒 (分析: {analysis_time:.2f}s, 建议: {recommendation_time:.2f}s)")
+        status = "success"
+        logger.info(f"请求处理完成，总耗时: {total_time:.2f} 秒 (分析: {result['analysis_time']:.2f}s, 建议: {result['recommendation_time']:.2f}s)")
         
-        return jsonify({
-            "analysis_result": analysis_result,
-            "health_recommendations": health_recommendations,
-            "processing_time": round(total_time, 2),
-            "analysis_time": round(analysis_time, 2),
-            "recommendation_time": round(recommendation_time, 2),
-            "cache_hit": False  # 可以扩展以显示缓存命中情况
-        }), 200
+        return jsonify(dict(result, processing_time=round(total_time, 2))), 200
         
     except ValueError as e:
         logger.error(f"请求验证失败: {str(e)}")
+        status = "client_error"
         return jsonify({"error": str(e)}), 400
+    except OverloadedError as e:
+        logger.warning(f"请求被准入控制拒绝: {str(e)}")
+        status = "overload"
+        return overloaded_response(e)
     except Exception as e:
         total_time = time() - request_start_time
         logger.error(f"处理医疗报告时出错 (耗时 {total_time:.2f} 秒): {str(e)}", exc_info=True)
@@ -443,6 +1563,133 @@ def analyze_medical_report():
         if "OPENROUTER_API_KEY" in str(e):
             error_message = "API配置错误，请联系管理员"
         return jsonify({"error": error_message}), 500
+    finally:
+        # 失败和被拒绝的请求同样计入总耗时（过载时的尾延迟不被低估）
+        stage_duration.observe(time() - request_start_time, "total", status)
+
+
+@app.route('/analyze_medical_report/stream', methods=['POST'])
+def analyze_medical_report_stream():
+    """
+    分析医疗报告的流式端点（server-sent events）
+    事件顺序：analysis（增量）→ analysis_done → recommendation（增量）→ done；出错时发送 error
+    推测模式（speculative=true）下各项指标的建议在分析输出期间并行生成，合并后作为一个 recommendation 事件发送
+    """
+    request_start_time = time()
+    logger.info("收到医疗报告流式分析请求")
+
+    if 'image' not in request.files:
+        logger.warning("请求中未提供图像文件")
+        stage_duration.observe(time() - request_start_time, "total", "client_error")
+        return jsonify({"error": "未提供图像文件"}), 400
+
+    image_file = request.files['image']
+    speculative = use_speculation(request.form.get('speculative'))
+    try:
+        validate_image_file(image_file)
+        base64_image, image_digest = prepare_image(image_file.stream, request.form.get('preprocess'))
+    except ValueError as e:
+        logger.warning(f"图片验证失败: {str(e)}")
+        stage_duration.observe(time() - request_start_time, "total", "client_error")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"处理图像时出错: {str(e)}", exc_info=True)
+        stage_duration.observe(time() - request_start_time, "total", "error")
+        return jsonify({"error": "服务器内部错误，请稍后重试"}), 500
+
+    request_span = g.request_span
+    request_log = g.request_log
+    g.stream_owns_request_span = True
+
+    def generate():
+        # 响应体在请求上下文结束后输出，重新激活请求span和日志上下文（生成器内的阶段调用和推测任务都记录在其下）
+        trace_token = tracer.activate(request_span)
+        log_token = activate_request_log(request_log)
+        speculation = create_speculation() if speculative else None
+        upstream_calls = track_upstream_calls()
+        status = "error"
+        try:
+            analysis_start = time()
+            analysis_fingerprint = get_cache_fingerprint(image_digest, "analysis", endpoint_registry.models("vl"))
+            cached_analysis = get_from_cache(analysis_fingerprint, "analysis")
+            # 分析结果已缓存时先查找健康建议缓存，命中时不再推测生成单项建议
+            health_recommendations = lookup_cached_recommendations(cached_analysis) if cached_analysis else None
+            analysis_parts = []
+            deltas = [cached_analysis] if cached_analysis else stream_analysis_completion(base64_image, analysis_fingerprint)
+            for delta in deltas:
+                analysis_parts.append(delta)
+                if speculation is not None and health_recommendations is None:
+                    speculation.feed(delta)
+                yield format_sse("analysis", {"delta": delta})
+            analysis_result = "".join(analysis_parts)
+            if not cached_analysis:
+                health_recommendations = lookup_cached_recommendations(analysis_result)
+            analysis_time = time() - analysis_start
+            logger.info(f"API A流式输出完成，长度: {len(analysis_result)} 字符，耗时: {analysis_time:.2f}秒")
+            yield format_sse("analysis_done", {
+                "analysis_result": analysis_result,
+                "analysis_time": round(analysis_time, 2)
+            })
+
+            # 分析结果完整后立即开始流式获取健康建议
+            recommendation_start = time()
+            if health_recommendations is None and speculation is not None:
+                health_recommendations = resolve_speculation(speculation, analysis_result)
+            if health_recommendations is not None:
+                yield format_sse("recommendation", {"delta": health_recommendations})
+            else:
+                recommendation_parts = []
+                for delta in stream_recommendation_completion(analysis_result):
+                    recommendation_parts.append(delta)
+                    yield format_sse("recommendation", {"delta": delta})
+                health_recommendations = "".join(recommendation_parts)
+            recommendation_time = time() - recommendation_start
+
+            total_time = time() - request_start_time
+            status = "success"
+            logger.info(f"流式请求处理完成，总耗时: {total_time:.2f} 秒 (分析: {analysis_time:.2f}s, 建议: {recommendation_time:.2f}s)")
+            done = {
+                "analysis_result": analysis_result,
+                "health_recommendations": health_recommendations,
+                "processing_time": round(total_time, 2),
+                "analysis_time": round(analysis_time, 2),
+                "recommendation_time": round(recommendation_time, 2),
+                "cache_hit": upstream_calls.cache_hit
+            }
+            if speculation is not None:
+                done["speculative"] = speculation.stats()
+            yield format_sse("done", done)
+        except OverloadedError as e:
+            logger.warning(f"流式请求被准入控制拒绝: {str(e)}")
+            status = "overload"
+            request_span.record_exception(e)
+            yield format_sse("error", {"error": "服务繁忙，请稍后重试"})
+        except Exception as e:
+            total_time = time() - request_start_time
+            logger.error(f"流式处理医疗报告时出错 (耗时 {total_time:.2f} 秒): {str(e)}", exc_info=True)
+            request_span.record_exception(e)
+            yield format_sse("error", {"error": "服务器内部错误，请稍后重试"})
+        finally:
+            # 客户端断开（GeneratorExit）时按error计入
+            stage_duration.observe(time() - request_start_time, "total", status)
+            if speculation is not None:
+                speculation.cancel()
+            tracer.deactivate(trace_token)
+            deactivate_request_log(log_token)
+            request_span.end()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 禁止nginx等反向代理缓冲，保证增量及时送达
+    })
+
+
+@app.route('/analyze_medical_report/stream', methods=['OPTIONS'])
+def analyze_medical_report_stream_options():
+    """
+    处理OPTIONS请求以支持跨域
+    """
+    return jsonify({"status": "ok"}), 200
 
 
 @app.route('/analyze_medical_report', methods=['OPTIONS'])
@@ -453,6 +1700,105 @@ def analyze_medical_report_options():
     return jsonify({"status": "ok"}), 200
 
 
+@app.route('/jobs', methods=['POST'])
+def create_analysis_job():
+    """
+    提交异步分析任务，立即返回任务ID
+    表单字段：image（必填）、callback_url（可选，任务结束后POST任务状态）、preprocess（可选，预处理档位）
+    """
+    logger.info("收到异步分析任务请求")
+    if 'image' not in request.files:
+        logger.warning("请求中未提供图像文件")
+        return jsonify({"error": "未提供图像文件"}), 400
+
+    image_file = request.files['image']
+    callback_url = request.form.get('callback_url')
+    try:
+        validate_image_file(image_file)
+        if callback_url:
+            validate_callback_url(callback_url)
+        base64_image, image_digest = prepare_image(image_file.stream, request.form.get('preprocess'))
+        job_id, coalesced = submit_analysis_job(base64_image, image_digest, callback_url)
+    except ValueError as e:
+        logger.warning(f"任务请求验证失败: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except JobQueueFullError as e:
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error(f"创建分析任务时出错: {str(e)}", exc_info=True)
+        return jsonify({"error": "服务器内部错误，请稍后重试"}), 500
+
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "coalesced": coalesced
+    }), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """
+    查询异步分析任务状态；成功时result字段与同步分析端点的响应一致
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify(job), 200
+
+
+@app.route('/jobs', methods=['OPTIONS'])
+def create_analysis_job_options():
+    """
+    处理OPTIONS请求以支持跨域
+    """
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats_endpoint():
+    """
+    缓存命中统计端点
+    """
+    return jsonify({
+        "enabled": ENABLE_CACHE and cache is not None,
+        "backend": cache.name if cache is not None else None,
+        "stats": cache_stats.snapshot(),
+        "indicators": indicator_cache_stats.snapshot(),
+        "similarity": similarity_index.snapshot() if similarity_index is not None else None,
+        "in_flight_dedup": {
+            "analysis": analysis_flight.snapshot(),
+            "recommendations": recommendation_flight.snapshot()
+        }
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus指标端点（文本格式）：各阶段耗时直方图、缓存和上游错误计数、token用量、进行中请求数
+    """
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/admission/stats', methods=['GET'])
+def admission_stats_endpoint():
+    """
+    上游准入控制统计端点（每个上游当前的并发上限、进行中和排队的请求数、拒绝次数等）
+    """
+    return jsonify({
+        upstream: limiter.snapshot() for upstream, limiter in upstream_limiters.items()
+    }), 200
+
+
+@app.route('/endpoints', methods=['GET'])
+def endpoints_endpoint():
+    """
+    模型端点状态：路由顺序、熔断器状态、请求计数、延迟直方图和最近一次健康探测结果
+    """
+    return jsonify(endpoint_registry.snapshot()), 200
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
@@ -467,6 +1813,8 @@ if __name__ == '__main__':
     
     logger.info(f"正在启动医疗报告分析服务器，端口 {port}")
     logger.info(f"配置信息: API_A_MODEL={API_A_MODEL}, API_B_MODEL={API_B_MODEL}")
-    logger.info(f"最大图片尺寸: {MAX_IMAGE_SIZE}px, API超时: {API_TIMEOUT}s, 最大重试: {MAX_RETRIES}次")
+    logger.info(f"最大图片尺寸: {MAX_IMAGE_SIZE}px, API超时: {API_TIMEOUT}s, 最大尝试: {MAX_RETRIES}次")
+    logger.info(f"上游并发上限: API A={VL_CONCURRENCY_LIMIT}(最大{VL_CONCURRENCY_MAX}), API B={LLM_CONCURRENCY_LIMIT}(最大{LLM_CONCURRENCY_MAX}), 排队上限: {UPSTREAM_QUEUE_MAX}")
+    logger.info(f"链路追踪: {TRACING_EXPORTER}，采样比例: {TRACING_SAMPLE_RATIO}")
     
     app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
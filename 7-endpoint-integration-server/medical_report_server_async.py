@@ -0,0 +1,599 @@
+"""
+医疗报告分析服务器（异步模式，ASGI）
+
+与 medical_report_server.py 的分析、统计和健康检查端点保持相同的响应格式，配置、图片处理和缓存逻辑直接复用。
+流式端点（/analyze_medical_report/stream）、异步任务（/jobs）和推测模式（speculative字段）只在同步模式中提供。
+上游模型调用使用共享连接池的异步HTTP客户端，单个进程即可同时保持数百个进行中的模型请求；
+每个上游（API A / API B）有独立的AIMD准入控制（与同步模式相同的排队上限、排队超时和延迟目标，
+超出时快速返回503 + Retry-After）；CPU密集的图片处理放到线程中执行，不阻塞事件循环。
+
+运行：
+    hypercorn medical_report_server_async:app --bind 0.0.0.0:80
+"""
+import asyncio
+import os
+from functools import partial
+from time import perf_counter, time
+from typing import Optional
+
+import httpx
+from quart import Quart, Response, g, request, jsonify
+
+from medical_report_server import (
+    logger,
+    access_logger,
+    LOG_SAMPLE_RATIO,
+    API_TIMEOUT,
+    ENDPOINT_CONNECT_TIMEOUT,
+    ENDPOINT_FAILOVER_TIMEOUT,
+    UPSTREAM_QUEUE_MAX,
+    UPSTREAM_QUEUE_TIMEOUT,
+    VL_CONCURRENCY_LIMIT,
+    VL_CONCURRENCY_MAX,
+    VL_LATENCY_TARGET,
+    LLM_CONCURRENCY_LIMIT,
+    LLM_CONCURRENCY_MAX,
+    LLM_LATENCY_TARGET,
+    ENABLE_CACHE,
+    MAX_REPORT_PAGES,
+    MULTI_IMAGE_MESSAGE,
+    PDF_RENDER_DPI,
+    retry_policy,
+    endpoint_registry,
+    cache,
+    cache_stats,
+    indicator_cache_stats,
+    metrics,
+    requests_in_flight,
+    requests_total,
+    stage_duration,
+    upstream_in_flight,
+    upstream_retries_total,
+    record_token_usage,
+    record_upstream_failure,
+    STAGE_METRIC_NAMES,
+    build_analysis_payload,
+    build_recommendation_payload,
+    combine_page_digests,
+    get_cache_fingerprint,
+    get_recommendation_fingerprint,
+    get_from_cache,
+    lookup_cached_recommendations,
+    remember_recommendations,
+    set_to_cache,
+    similarity_index,
+    prepare_image,
+    validate_image_file,
+    tracer,
+)
+from admission import AsyncAIMDLimiter, OverloadedError
+from report_pages import collect_report_pages, is_pdf_file, merge_page_findings
+from request_body import PreEncodedJSONBody
+from singleflight import AsyncSingleFlight
+from metrics import record_upstream_call, track_upstream_calls
+from tracing import CLIENT, SERVER, current_span, parse_traceparent
+from structured_logging import ALWAYS_LOG, activate_request_log, deactivate_request_log, new_request_log
+
+ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', '256'))  # 共享连接池最大连接数
+
+app = Quart(__name__)
+
+http_client: Optional[httpx.AsyncClient] = None
+upstream_limiters: Optional[dict] = None
+
+# 进行中请求合并（与同步模式相同，按缓存指纹合并并发的重复请求）
+analysis_flight = AsyncSingleFlight()
+recommendation_flight = AsyncSingleFlight()
+
+
+@app.before_serving
+async def startup():
+    """创建共享连接池和准入控制（必须在事件循环内创建；各上游的并发上限和排队设置与同步模式相同）"""
+    global http_client, upstream_limiters
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(API_TIMEOUT, connect=ENDPOINT_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=ASYNC_MAX_CONNECTIONS
+        )
+    )
+    upstream_limiters = {
+        "vl": AsyncAIMDLimiter(
+            "vl",
+            initial_limit=VL_CONCURRENCY_LIMIT,
+            max_limit=VL_CONCURRENCY_MAX,
+            max_queue=UPSTREAM_QUEUE_MAX,
+            queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+            latency_target=VL_LATENCY_TARGET
+        ),
+        "llm": AsyncAIMDLimiter(
+            "llm",
+            initial_limit=LLM_CONCURRENCY_LIMIT,
+            max_limit=LLM_CONCURRENCY_MAX,
+            max_queue=UPSTREAM_QUEUE_MAX,
+            queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+            latency_target=LLM_LATENCY_TARGET
+        ),
+    }
+    logger.info(f"异步模式已启动，上游并发上限: API A={VL_CONCURRENCY_LIMIT}(最大{VL_CONCURRENCY_MAX}), "
+                f"API B={LLM_CONCURRENCY_LIMIT}(最大{LLM_CONCURRENCY_MAX})，排队上限: {UPSTREAM_QUEUE_MAX}，"
+                f"连接池大小: {ASYNC_MAX_CONNECTIONS}")
+
+
+@app.after_serving
+async def shutdown():
+    if http_client is not None:
+        await http_client.aclose()
+
+
+@app.before_request
+async def before_request():
+    requests_in_flight.inc()
+    g.request_start = perf_counter()
+    g.request_log = new_request_log(request.headers.get('X-Request-ID'), LOG_SAMPLE_RATIO)
+    g.log_token = activate_request_log(g.request_log)
+    span = tracer.start_span(
+        f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+        kind=SERVER,
+        attributes={"http.method": request.method, "http.target": request.path},
+        parent=parse_traceparent(request.headers.get("traceparent"))
+    )
+    g.request_span = span
+    g.trace_token = tracer.activate(span)
+
+
+@app.teardown_request
+async def teardown_request(exception=None):
+    requests_in_flight.dec()
+    deactivate_request_log(g.pop("log_token", None))
+    tracer.deactivate(g.pop("trace_token", None))
+    span = g.pop("request_span", None)
+    if span is not None:
+        if exception is not None:
+            span.record_exception(exception)
+        span.end()
+
+
+@app.after_request
+async def after_request(response):
+    requests_total.inc(request.endpoint or "unknown", str(response.status_code))
+    span = g.get("request_span")
+    if span is not None and span.sampled:
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_error(f"HTTP {response.status_code}")
+        response.headers['X-Trace-Id'] = span.trace_id
+    request_log = g.get("request_log")
+    if request_log is not None:
+        response.headers['X-Request-ID'] = request_log.request_id
+        duration_ms = round((perf_counter() - g.request_start) * 1000, 1)
+        access_logger.info(
+            f"{request.method} {request.path} {response.status_code} {duration_ms}ms",
+            extra=dict(ALWAYS_LOG, method=request.method, path=request.path, status=response.status_code,
+                       duration_ms=duration_ms)
+        )
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    return response
+
+
+def overloaded_response(error):
+    """上游繁忙时的快速拒绝响应（503 + Retry-After，与同步模式相同）"""
+    response = jsonify({"error": "服务繁忙，请稍后重试"})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+async def make_api_request_with_retry_async(url, headers, payload, upstream="vl", max_retries=None, read_timeout=None):
+    """
+    带重试机制的异步API请求（重试策略与同步模式相同；并发受对应上游的AIMD准入控制限制，退避等待期间不占用并发名额）
+    并发名额和排队都已满时抛出 OverloadedError，不再重试
+    :param read_timeout: 等待响应的超时（秒），默认为 API_TIMEOUT
+    """
+    timeout = httpx.Timeout(read_timeout or API_TIMEOUT, connect=ENDPOINT_CONNECT_TIMEOUT)
+    if max_retries is None:
+        max_retries = retry_policy.max_attempts
+    limiter = upstream_limiters[upstream]
+    last_exception = None
+    for attempt in range(max_retries):
+        retry_after = None
+        with tracer.span("upstream.attempt", kind=CLIENT, attributes={
+            "upstream": upstream, "attempt": attempt + 1, "http.url": url
+        }) as span:
+            queue_start = perf_counter()
+            async with limiter.acquire() as permit:
+                span.set_attribute("queue_wait_ms", round((perf_counter() - queue_start) * 1000, 1))
+                start_time = time()
+                try:
+                    with upstream_in_flight.track(upstream):
+                        if isinstance(payload, PreEncodedJSONBody):
+                            # 逐块发送预编码的请求体（与同步模式相同，不拼接为完整的bytes）
+                            response = await http_client.post(
+                                url, headers=dict(tracer.inject(headers, span), **{"Content-Length": str(len(payload))}),
+                                content=payload.aiter_chunks(), timeout=timeout
+                            )
+                        else:
+                            response = await http_client.post(
+                                url, headers=tracer.inject(headers, span), json=payload, timeout=timeout
+                            )
+                except httpx.TimeoutException:
+                    permit.record("timeout")
+                    record_upstream_failure(upstream, timeout=True)
+                    last_exception = Exception(f"API请求超时 (尝试 {attempt + 1}/{max_retries})")
+                    span.set_error("timeout")
+                    logger.warning(str(last_exception))
+                except httpx.HTTPError as e:
+                    permit.record("error")
+                    last_exception = Exception(f"API请求异常: {str(e)} (尝试 {attempt + 1}/{max_retries})")
+                    span.record_exception(e)
+                    logger.warning(str(last_exception))
+                else:
+                    latency = time() - start_time
+                    span.set_attribute("http.status_code", response.status_code)
+                    if response.status_code == 200:
+                        permit.record("success", latency)
+                        result = response.json()
+                        record_token_usage(upstream, result.get("usage"))
+                        return result
+                    permit.record("overload" if response.status_code in (429, 503) else "error", latency)
+                    record_upstream_failure(upstream, response.status_code)
+                    error_msg = f"API请求失败，状态码 {response.status_code}: {response.text[:500]}"
+                    if not retry_policy.should_retry_status(response.status_code):
+                        logger.error(error_msg)
+                        raise Exception(error_msg)
+                    last_exception = Exception(error_msg)
+                    span.set_error(f"HTTP {response.status_code}")
+                    retry_after = response.headers.get("Retry-After")
+                    logger.warning(f"{error_msg} (尝试 {attempt + 1}/{max_retries})")
+
+        if attempt < max_retries - 1:
+            upstream_retries_total.inc(upstream)
+            wait_time = retry_policy.compute_delay(attempt, retry_after)
+            with tracer.span("retry.backoff", attributes={"upstream": upstream, "delay_ms": round(wait_time * 1000)}):
+                await asyncio.sleep(wait_time)
+
+    raise last_exception or Exception("API请求失败，已达到最大重试次数")
+
+
+async def call_stage_completion_async(stage, build_payload) -> str:
+    """
+    按端点注册表的路由顺序调用某个阶段的模型（异步），端点失败时故障转移到下一个端点
+    """
+    with tracer.span(f"stage.{STAGE_METRIC_NAMES[stage]}", attributes={"stage": stage}) as stage_span:
+        record_upstream_call()
+        stage_start = perf_counter()
+        status = "error"
+        try:
+            candidates = endpoint_registry.candidates(stage)
+            last_exception = None
+            for index, endpoint in enumerate(candidates):
+                if not endpoint.breaker.allow_request():
+                    continue
+                is_last = index == len(candidates) - 1
+                start_time = time()
+                try:
+                    result = await make_api_request_with_retry_async(
+                        endpoint.chat_url,
+                        endpoint.headers(),
+                        build_payload(endpoint.model),
+                        upstream=stage,
+                        max_retries=None if is_last else 1,
+                        read_timeout=None if is_last else ENDPOINT_FAILOVER_TIMEOUT
+                    )
+                    content = result["choices"][0]["message"]["content"]
+                except asyncio.CancelledError:
+                    endpoint.breaker.release()
+                    status = "cancelled"
+                    raise
+                except OverloadedError:
+                    # 本地并发预算已满，与端点健康无关
+                    endpoint.breaker.release()
+                    status = "overload"
+                    raise
+                except Exception as e:
+                    endpoint.record_failure()
+                    last_exception = e
+                    stage_span.add_event("endpoint_failed", {"endpoint": endpoint.name, "error": str(e)[:200]})
+                    logger.warning(f"端点 {endpoint.name} 请求失败{'' if is_last else '，转移到下一个端点'}: {str(e)}")
+                    continue
+                endpoint.record_success(time() - start_time)
+                stage_span.set_attribute("endpoint", endpoint.name)
+                status = "success"
+                return content
+
+            raise last_exception or Exception(f"阶段 {stage} 没有可用的模型端点（熔断器均已打开）")
+        finally:
+            # 失败、被拒绝和取消的调用同样计入阶段耗时，以status区分
+            stage_duration.observe(perf_counter() - stage_start, STAGE_METRIC_NAMES[stage], status)
+
+
+async def analyze_medical_report_image_async(base64_image, image_digest):
+    """
+    分析医疗报告图片（异步，带缓存；同一图片的并发请求合并为一次上游调用）
+    """
+    fingerprint = get_cache_fingerprint(image_digest, "analysis", endpoint_registry.models("vl"))
+    cached_result = await asyncio.to_thread(get_from_cache, fingerprint, "analysis")
+    if cached_result:
+        return cached_result
+
+    content, shared = await analysis_flight.do(
+        fingerprint, request_medical_report_analysis_async, base64_image, fingerprint
+    )
+    if shared:
+        record_upstream_call(shared=True)
+        current_span().add_event("singleflight_shared", {"stage": "vl"})
+        logger.info(f"复用进行中的API A请求结果: {fingerprint[:8]}...")
+    return content
+
+
+async def request_medical_report_analysis_async(base64_image, fingerprint):
+    """
+    调用API A分析医疗报告图片（异步），并写入缓存
+    """
+    start_time = time()
+    try:
+        content = await call_stage_completion_async("vl", partial(build_analysis_payload, base64_image))
+        elapsed_time = time() - start_time
+        logger.info(f"API A请求成功，耗时 {elapsed_time:.2f} 秒")
+
+        await asyncio.to_thread(set_to_cache, fingerprint, content)
+        return content
+    except Exception as e:
+        elapsed_time = time() - start_time
+        logger.error(f"API A请求失败，耗时 {elapsed_time:.2f} 秒: {str(e)}")
+        raise
+
+
+async def get_health_recommendations_async(analysis_result):
+    """
+    获取健康建议（异步，带缓存；相同指标组合或分析结果的并发请求合并为一次上游调用）
+    """
+    cached_result = await asyncio.to_thread(lookup_cached_recommendations, analysis_result)
+    if cached_result:
+        return cached_result
+
+    fingerprint = get_recommendation_fingerprint(analysis_result)
+    content, shared = await recommendation_flight.do(
+        fingerprint, request_health_recommendations_async, analysis_result, fingerprint
+    )
+    if shared:
+        record_upstream_call(shared=True)
+        current_span().add_event("singleflight_shared", {"stage": "llm"})
+        logger.info(f"复用进行中的API B请求结果: {fingerprint[:8]}...")
+    return content
+
+
+async def request_health_recommendations_async(analysis_result, fingerprint):
+    """
+    调用API B获取健康建议（异步），并写入缓存
+    """
+    start_time = time()
+    try:
+        content = await call_stage_completion_async("llm", partial(build_recommendation_payload, analysis_result))
+        elapsed_time = time() - start_time
+        logger.info(f"API B请求成功，耗时 {elapsed_time:.2f} 秒")
+
+        await asyncio.to_thread(remember_recommendations, analysis_result, fingerprint, content)
+        return content
+    except Exception as e:
+        elapsed_time = time() - start_time
+        logger.error(f"API B请求失败，耗时 {elapsed_time:.2f} 秒: {str(e)}")
+        raise
+
+
+async def analyze_report_page_async(page_number, page, preprocess=None) -> dict:
+    """预处理并分析多页报告中的一页（异步）"""
+    with tracer.span("report_page", attributes={"page": page_number}):
+        start_time = time()
+        base64_image, image_digest = await asyncio.to_thread(prepare_image, page.source, preprocess)
+        preprocess_time = time() - start_time
+        analysis_result = await analyze_medical_report_image_async(base64_image, image_digest)
+    return {
+        "page": page_number,
+        "source": page.label,
+        "analysis_result": analysis_result,
+        "preprocess_time": round(preprocess_time, 2),
+        "analysis_time": round(time() - start_time - preprocess_time, 2),
+    }
+
+
+async def prepare_report_page_async(page, preprocess=None):
+    start_time = time()
+    base64_image, image_digest = await asyncio.to_thread(prepare_image, page.source, preprocess)
+    return base64_image, image_digest, time() - start_time
+
+
+async def run_multi_page_pipeline_async(pages, preprocess=None) -> dict:
+    """
+    多页报告分析流程（异步）：各页并发预处理和调用API A，合并结果后只调用一次API B
+    """
+    upstream_calls = track_upstream_calls()
+    analysis_start = time()
+    if MULTI_IMAGE_MESSAGE:
+        prepared = await asyncio.gather(*(prepare_report_page_async(page, preprocess) for page in pages))
+        analysis_result = await analyze_medical_report_image_async(
+            [base64_image for base64_image, _, _ in prepared],
+            combine_page_digests(digest for _, digest, _ in prepared)
+        )
+        page_results = [
+            {"page": number, "source": page.label, "preprocess_time": round(preprocess_time, 2)}
+            for number, (page, (_, _, preprocess_time)) in enumerate(zip(pages, prepared), 1)
+        ]
+    else:
+        page_results = await asyncio.gather(*(
+            analyze_report_page_async(number, page, preprocess) for number, page in enumerate(pages, 1)
+        ))
+        analysis_result = merge_page_findings(page_results)
+    analysis_time = time() - analysis_start
+    logger.info(f"从API A收到 {len(pages)} 页的分析结果，长度: {len(analysis_result)} 字符，耗时: {analysis_time:.2f}秒")
+
+    recommendation_start = time()
+    health_recommendations = await get_health_recommendations_async(analysis_result)
+    recommendation_time = time() - recommendation_start
+    logger.info(f"从API B收到健康建议，长度: {len(health_recommendations)} 字符，耗时: {recommendation_time:.2f}秒")
+
+    return {
+        "analysis_result": analysis_result,
+        "health_recommendations": health_recommendations,
+        "analysis_time": round(analysis_time, 2),
+        "recommendation_time": round(recommendation_time, 2),
+        "cache_hit": upstream_calls.cache_hit,
+        "page_count": len(pages),
+        "pages": list(page_results)
+    }
+
+
+@app.route('/analyze_medical_report', methods=['POST'])
+async def analyze_medical_report():
+    """
+    分析医疗报告的主端点（异步）
+    """
+    request_start_time = time()
+    logger.info("收到医疗报告分析请求")
+    status = "error"  # 计入总耗时的结果：success / client_error / overload / error
+
+    try:
+        files = await request.files
+        form = await request.form
+        if 'image' not in files:
+            logger.warning("请求中未提供图像文件")
+            status = "client_error"
+            return jsonify({"error": "未提供图像文件"}), 400
+
+        image_files = files.getlist('image')
+
+        try:
+            if len(image_files) > MAX_REPORT_PAGES:
+                raise ValueError(f"报告页数超过限制: 最多 {MAX_REPORT_PAGES} 页")
+            for image_file in image_files:
+                validate_image_file(image_file, allow_pdf=True)
+        except ValueError as e:
+            logger.warning(f"图片验证失败: {str(e)}")
+            status = "client_error"
+            return jsonify({"error": str(e)}), 400
+
+        if len(image_files) > 1 or is_pdf_file(image_files[0].filename):
+            logger.info(f"正在处理多页报告: {', '.join(image_file.filename for image_file in image_files)}")
+            # PDF渲染在线程中串行执行（pdfium不是线程安全的）
+            pages = await asyncio.to_thread(collect_report_pages, image_files, MAX_REPORT_PAGES, PDF_RENDER_DPI)
+            result = await run_multi_page_pipeline_async(pages, form.get('preprocess'))
+            total_time = time() - request_start_time
+            status = "success"
+            logger.info(f"请求处理完成，总耗时: {total_time:.2f} 秒 (分析: {result['analysis_time']:.2f}s, 建议: {result['recommendation_time']:.2f}s)")
+            return jsonify(dict(result, processing_time=round(total_time, 2))), 200
+
+        image_file = image_files[0]
+        logger.info(f"正在处理图像文件: {image_file.filename}")
+        upstream_calls = track_upstream_calls()
+
+        # 图片解码、缩放、编码为CPU密集操作，放到线程中执行
+        base64_image, image_digest = await asyncio.to_thread(prepare_image, image_file.stream, form.get('preprocess'))
+
+        analysis_start = time()
+        analysis_result = await analyze_medical_report_image_async(base64_image, image_digest)
+        analysis_time = time() - analysis_start
+        logger.info(f"从API A收到分析结果，长度: {len(analysis_result)} 字符，耗时: {analysis_time:.2f}秒")
+
+        recommendation_start = time()
+        health_recommendations = await get_health_recommendations_async(analysis_result)
+        recommendation_time = time() - recommendation_start
+        logger.info(f"从API B收到健康建议，长度: {len(health_recommendations)} 字符，耗时: {recommendation_time:.2f}秒")
+
+        total_time = time() - request_start_time
+        status = "success"
+        logger.info(f"请求处理完成，总耗时: {total_time:.2f} 秒 (分析: {analysis_time:.2f}s, 建议: {recommendation_time:.2f}s)")
+
+        return jsonify({
+            "analysis_result": analysis_result,
+            "health_recommendations": health_recommendations,
+            "processing_time": round(total_time, 2),
+            "analysis_time": round(analysis_time, 2),
+            "recommendation_time": round(recommendation_time, 2),
+            "cache_hit": upstream_calls.cache_hit
+        }), 200
+
+    except ValueError as e:
+        logger.error(f"请求验证失败: {str(e)}")
+        status = "client_error"
+        return jsonify({"error": str(e)}), 400
+    except OverloadedError as e:
+        logger.warning(f"请求被准入控制拒绝: {str(e)}")
+        status = "overload"
+        return overloaded_response(e)
+    except Exception as e:
+        total_time = time() - request_start_time
+        logger.error(f"处理医疗报告时出错 (耗时 {total_time:.2f} 秒): {str(e)}", exc_info=True)
+        error_message = "服务器内部错误，请稍后重试"
+        if "OPENROUTER_API_KEY" in str(e):
+            error_message = "API配置错误，请联系管理员"
+        return jsonify({"error": error_message}), 500
+    finally:
+        # 失败和被拒绝的请求同样计入总耗时（过载时的尾延迟不被低估）
+        stage_duration.observe(time() - request_start_time, "total", status)
+
+
+@app.route('/analyze_medical_report', methods=['OPTIONS'])
+async def analyze_medical_report_options():
+    """
+    处理OPTIONS请求以支持跨域
+    """
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/cache/stats', methods=['GET'])
+async def cache_stats_endpoint():
+    """
+    缓存命中统计端点
+    """
+    return jsonify({
+        "enabled": ENABLE_CACHE and cache is not None,
+        "backend": cache.name if cache is not None else None,
+        "stats": cache_stats.snapshot(),
+        "indicators": indicator_cache_stats.snapshot(),
+        "similarity": similarity_index.snapshot() if similarity_index is not None else None,
+        "in_flight_dedup": {
+            "analysis": analysis_flight.snapshot(),
+            "recommendations": recommendation_flight.snapshot()
+        }
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    """
+    Prometheus指标端点（与同步模式相同的指标）
+    """
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/admission/stats', methods=['GET'])
+async def admission_stats_endpoint():
+    """
+    上游准入控制统计端点（与同步模式相同的格式）
+    """
+    return jsonify({
+        upstream: limiter.snapshot() for upstream, limiter in upstream_limiters.items()
+    }), 200
+
+
+@app.route('/endpoints', methods=['GET'])
+async def endpoints_endpoint():
+    """
+    模型端点状态（与同步模式共用同一个端点注册表）
+    """
+    return jsonify(endpoint_registry.snapshot()), 200
+
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """
+    健康检查端点
+    """
+    return jsonify({"status": "healthy", "mode": "async"}), 200
+
+
+if __name__ == '__main__':
+    port = int(os.getenv('PORT', '80'))
+    logger.info(f"正在启动医疗报告分析服务器（异步模式），端口 {port}")
+    app.run(host='0.0.0.0', port=port)
@@ -1,20 +1,48 @@
 import base64
+import logging
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 import requests
 import json
 from PIL import Image
 import io
-import sys
+
+from structured_logging import activate_request_log, configure_logging, deactivate_request_log, new_request_log
+
+# 配置日志（经队列由后台线程写入stderr，可选写入日志文件；不记录分析结果和健康建议的全文）
+LOG_SAMPLE_RATIO = float(os.getenv('LOG_SAMPLE_RATIO', '1.0'))  # 保留过程日志（请求内INFO级别）的请求比例，WARNING以上始终保留
+configure_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    log_format=os.getenv('LOG_FORMAT', 'json'),
+    log_file=os.getenv('LOG_FILE') or None,
+    max_bytes=int(os.getenv('LOG_MAX_BYTES', '52428800')),
+    backup_count=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+)
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+
+@app.before_request
+def before_request():
+    """为每个请求生成关联ID（或沿用请求头 X-Request-ID），写入该请求的所有日志"""
+    g.request_log = new_request_log(request.headers.get('X-Request-ID'), LOG_SAMPLE_RATIO)
+    g.log_token = activate_request_log(g.request_log)
+
+
+@app.teardown_request
+def teardown_request(exception=None):
+    deactivate_request_log(g.pop("log_token", None))
+
 @app.after_request
 def after_request(response):
     """设置跨域响应头"""
     response.headers.add('Access-Control-Allow-Origin', '*')  # 允许所有源跨域访问
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')  # 允许的请求头
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')  # 允许的请求方法
+    if "request_log" in g:
+        response.headers['X-Request-ID'] = g.request_log.request_id
     return response
 
 # API配置参数
@@ -171,54 +199,47 @@ def analyze_medical_report():
     接收图片文件，调用视觉模型分析异常指标，再调用语言模型生成健康建议
     返回格式：{"analysis_result": "异常指标分析", "health_recommendations": "健康建议"}
     """
-    print("收到医疗报告分析请求", file=sys.stderr)
+    logger.info("收到医疗报告分析请求")
     
     try:
         # 检查请求中是否包含图片文件
         if 'image' not in request.files:
-            print("请求中未提供图像文件", file=sys.stderr)
+            logger.warning("请求中未提供图像文件")
             return jsonify({"error": "未提供图像文件"}), 400
         
         image_file = request.files['image']
         
         # 检查图片文件是否为空
         if image_file.filename == '':
-            print("提供了空的图像文件", file=sys.stderr)
+            logger.warning("提供了空的图像文件")
             return jsonify({"error": "提供的图像文件为空"}), 400
         
-        print(f"正在处理图像文件: {image_file.filename}", file=sys.stderr)
+        logger.info(f"正在处理图像文件: {image_file.filename}")
 
-        # 将图片读取为字节流并调整大小
+        # 将图片读取为字节流并调整大小（最长边不超过1280像素）
         image_data = io.BytesIO(image_file.read())
-        print(f"调整图像大小，确保最长边不超过1280像素", file=sys.stderr)
         resized_image = resize_image(image_data, max_size=1280)
 
         # 将调整后的图片编码为Base64
-        print("将图像编码为base64", file=sys.stderr)
         base64_image = encode_image_to_base64(resized_image)
-        print("图像已成功编码为base64", file=sys.stderr)
+        logger.info(f"图像已编码为base64，大小: {len(base64_image)} 字符")
         
-        # 调用视觉语言模型分析医疗报告
-        print("将图像发送到视觉语言模型API进行医疗报告分析", file=sys.stderr)
+        # 调用视觉语言模型分析医疗报告（只记录长度：分析结果和健康建议含患者信息，不写入日志）
         analysis_result = analyze_medical_report_image(base64_image)
-        print(f"从视觉语言模型API收到分析结果: {analysis_result}", file=sys.stderr)
-        print(f"分析结果长度: {len(analysis_result)} 字符", file=sys.stderr)
+        logger.info(f"从视觉语言模型API收到分析结果，长度: {len(analysis_result)} 字符")
         
         # 调用大语言模型生成健康建议
-        print("将分析结果发送到大语言模型API获取健康建议", file=sys.stderr)
         health_recommendations = get_health_recommendations(analysis_result)
-        print(f"从大语言模型API收到健康建议: {health_recommendations}", file=sys.stderr)
-        print(f"健康建议长度: {len(health_recommendations)} 字符", file=sys.stderr)
+        logger.info(f"从大语言模型API收到健康建议，长度: {len(health_recommendations)} 字符")
 
         # 返回分析结果和健康建议给客户端
-        print("将分析结果和健康建议返回给客户端", file=sys.stderr)
         return jsonify({
             "analysis_result": analysis_result,
             "health_recommendations": health_recommendations
         }), 200
         
     except Exception as e:
-        print(f"处理医疗报告时出错: {str(e)}", file=sys.stderr)
+        logger.error(f"处理医疗报告时出错: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 
@@ -241,6 +262,6 @@ def health_check():
 
 
 if __name__ == '__main__':
-    print("正在启动医疗报告分析服务器，端口80", file=sys.stderr)
+    logger.info("正在启动医疗报告分析服务器，端口80")
     # 启动Flask服务，监听所有网卡的80端口，开启调试模式
     app.run(host='0.0.0.0', port=80, debug=True)
\ No newline at end of file
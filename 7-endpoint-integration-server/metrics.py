@@ -0,0 +1,221 @@
+"""
+Prometheus文本格式的运行指标：各阶段耗时直方图、缓存/重试/限流/超时计数、上游token用量和进行中请求数
+
+热路径上的记录不加锁：每个线程首次记录时登记一个分片（threading.local），之后只修改自己分片中的数值
+（一个分片只有一个线程写入）；抓取 /metrics 时汇总所有分片，已结束线程的分片并入基准值后移除。
+仪表（进行中请求数）在分片中记录增量，在一个线程中加一、在另一个线程中减一时汇总结果仍然正确。
+
+另提供请求级的上游调用计数（contextvars）：请求处理期间没有调用上游、也没有共享其他请求的进行中调用时，
+响应中的 cache_hit 为true。提交到线程池的任务需要用 contextvars.copy_context().run 执行才会计入同一个请求。
+"""
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+SHARD_COMPACT_THRESHOLD = 256  # 登记的分片数超过该值时合并已结束线程的分片（每个请求一个线程的服务器）
+
+
+class MetricsRegistry:
+    """指标注册表：登记指标，管理各线程的分片，汇总并输出Prometheus文本格式"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.metrics = []
+        self.shards = []  # (线程, 分片)；分片为 {(指标, 标签值): 数值或直方图计数列表}
+        self.retired = {}  # 已结束线程的分片合并后的数值
+
+    def counter(self, name, documentation, labelnames=()) -> "Counter":
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> "Gauge":
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS) -> "Histogram":
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def shard(self) -> dict:
+        """当前线程的分片（首次调用时登记）"""
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            with self.lock:
+                if len(self.shards) >= SHARD_COMPACT_THRESHOLD:
+                    self._compact()
+                self.shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _compact(self):
+        """把已结束线程的分片并入基准值（已结束的线程不会再写入，无需同步）"""
+        live_shards = []
+        for thread, shard in self.shards:
+            if thread.is_alive():
+                live_shards.append((thread, shard))
+            else:
+                _merge(self.retired, shard)
+        self.shards = live_shards
+
+    def collect(self) -> dict:
+        """汇总所有分片：{(指标, 标签值): 数值或直方图计数列表}"""
+        with self.lock:
+            self._compact()
+            totals = {}
+            _merge(totals, self.retired)
+            for _, shard in self.shards:
+                # dict.copy() 在C层完成，不会遇到其他线程同时插入新键导致的迭代错误
+                _merge(totals, shard.copy())
+        return totals
+
+    def render(self) -> str:
+        """Prometheus文本格式（text/plain; version=0.0.4）"""
+        totals = self.collect()
+        samples = {}
+        for (metric, labelvalues), value in totals.items():
+            samples.setdefault(metric, []).append((labelvalues, value))
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for labelvalues, value in sorted(samples.get(metric, ()), key=lambda sample: sample[0]):
+                lines.extend(metric.format_samples(labelvalues, value))
+        return "\n".join(lines) + "\n"
+
+
+def _merge(target, shard):
+    for key, value in shard.items():
+        if isinstance(value, list):
+            current = target.get(key)
+            target[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labelvalues, extra=()) -> str:
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def format_samples(self, labelvalues, value):
+        return [f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        shard = self.registry.shard()
+        key = (self, labelvalues)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, *labelvalues, amount=1):
+        shard = self.registry.shard()
+        key = (self, labelvalues)
+        shard[key] = shard.get(key, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    @contextmanager
+    def track(self, *labelvalues):
+        """进入时加一、退出时减一（可以跨线程退出，如流式响应的生成器）"""
+        self.inc(*labelvalues)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        shard = self.registry.shard()
+        key = (self, labelvalues)
+        counts = shard.get(key)
+        if counts is None:
+            # 各分桶（含+Inf）的计数，最后两项为总和与次数
+            counts = shard[key] = [0] * (len(self.buckets) + 3)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def format_samples(self, labelvalues, counts):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, [("le", bound)])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {_format_value(round(counts[-2], 6))}")
+        lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class UpstreamCalls:
+    """一个请求处理期间的上游调用次数（含共享其他请求的进行中调用）"""
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+
+    @property
+    def cache_hit(self) -> bool:
+        return self.calls == 0 and self.shared == 0
+
+
+current_upstream_calls: ContextVar[Optional[UpstreamCalls]] = ContextVar("current_upstream_calls", default=None)
+
+
+def track_upstream_calls() -> UpstreamCalls:
+    """开始统计当前请求（当前上下文及从中复制的上下文）的上游调用"""
+    calls = UpstreamCalls()
+    current_upstream_calls.set(calls)
+    return calls
+
+
+def record_upstream_call(shared=False):
+    calls = current_upstream_calls.get()
+    if calls is None:
+        return
+    if shared:
+        calls.shared += 1
+    else:
+        calls.calls += 1
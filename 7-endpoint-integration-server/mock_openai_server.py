@@ -0,0 +1,246 @@
+"""
+本地模拟的OpenAI兼容接口（/v1/chat/completions、/v1/models），用于基准测试和联调
+另提供 /v1/traces 作为OTLP/HTTP collector的替身：接收服务器导出的追踪数据，追加写入 --traces-file
+
+首token延迟可以按分布抽样（--latency 为均值）；--error-rate 按比例立即返回错误状态码（模拟上游限流和故障）
+
+用法：
+    python mock_openai_server.py --port 9000 --latency 2.0 --token-interval 0.02
+然后将服务器的 OPENROUTER_API_BASE 设置为 http://127.0.0.1:9000/v1
+    python mock_openai_server.py --port 9000 --latency 2.0 --latency-distribution lognormal --latency-sigma 0.6 \
+        --error-rate 0.05 --error-status 503 429 --retry-after 1
+    python mock_openai_server.py --port 9000 --traces-file traces/collector.jsonl
+然后设置 TRACING_EXPORTER=otlp、TRACING_OTLP_ENDPOINT=http://127.0.0.1:9000/v1/traces
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_ANALYSIS = "异常指标：\n1. 丙氨酸氨基转移酶（ALT）升高：68 U/L（参考范围 9-50 U/L）\n2. 总胆固醇（TC）偏高：6.2 mmol/L（参考范围 <5.2 mmol/L）"
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+MOCK_RECOMMENDATIONS = "健康建议：\n1. 饮食：减少高脂肪、高胆固醇食物，戒酒。\n2. 运动：每周至少150分钟中等强度有氧运动。\n3. 生活方式：规律作息，1-3个月后复查肝功能和血脂。"
+
+
+def has_image(messages):
+    """判断请求消息中是否包含图片"""
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+
+def mock_usage(request_length, content):
+    """模拟的token用量（请求体每4字节计1个token，回复每字符计1个token）"""
+    return {
+        "prompt_tokens": request_length // 4,
+        "completion_tokens": len(content),
+        "total_tokens": request_length // 4 + len(content)
+    }
+
+
+def sample_latency(distribution, mean, sigma=0.5):
+    """
+    按分布抽样一次延迟（秒），各分布的均值都为 mean
+    :param sigma: uniform 为相对均值的浮动比例（mean*(1±sigma)）；lognormal 为对数标准差（越大长尾越重）
+    """
+    if mean <= 0 or distribution == "fixed":
+        return max(mean, 0.0)
+    if distribution == "uniform":
+        return random.uniform(mean * max(1 - sigma, 0.0), mean * (1 + sigma))
+    if distribution == "exponential":
+        return random.expovariate(1 / mean)
+    if distribution == "lognormal":
+        return random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    raise ValueError(f"不支持的延迟分布: {distribution}（可选 {' / '.join(LATENCY_DISTRIBUTIONS)}）")
+
+
+def split_tokens(content, size=2):
+    """将回复切分为模拟token（每段若干字符）"""
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    latency_distribution = "fixed"
+    latency_sigma = 0.5
+    token_interval = 0.0
+    error_rate = 0.0
+    error_statuses = (503,)
+    retry_after = None  # 429/503错误响应的 Retry-After（秒）
+    responder = None  # 可选：根据请求体返回回复内容的函数（基准测试用于模拟不同图片和提示词的回复）
+    traces_file = None  # 可选：/v1/traces 收到的追踪数据追加写入的文件
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request_body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/").endswith("/traces"):
+            self.receive_traces(request_body)
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": "not found"})
+            return
+
+        if self.error_rate and random.random() < self.error_rate:
+            self.send_error_response(random.choice(self.error_statuses))
+            return
+        time.sleep(sample_latency(self.latency_distribution, self.latency, self.latency_sigma))
+        content = self.responder(request_body) if self.responder else None
+        if content is None:
+            content = MOCK_ANALYSIS if has_image(request_body.get("messages", [])) else MOCK_RECOMMENDATIONS
+        if request_body.get("stream"):
+            self.send_stream(request_body, content)
+            return
+        # 非流式请求同样需要等待全部token生成完毕
+        time.sleep(self.token_interval * len(split_tokens(content)))
+        self.send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request_body.get("model", "mock-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": mock_usage(length, content)
+        })
+
+    def send_error_response(self, status):
+        """OpenAI格式的错误响应；429/503按配置带 Retry-After"""
+        headers = {}
+        if status in (429, 503) and self.retry_after is not None:
+            headers["Retry-After"] = str(self.retry_after)
+        self.send_json(status, {"error": {"message": f"模拟的上游错误（{status}）", "type": "mock_error", "code": status}},
+                       headers)
+
+    def receive_traces(self, request_body):
+        """OTLP/HTTP JSON（ExportTraceServiceRequest）：保存在 server.trace_batches 中，并追加写入 traces_file"""
+        self.server.trace_batches.append(request_body)
+        if self.traces_file:
+            with open(self.traces_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(request_body, ensure_ascii=False) + "\n")
+        self.send_json(200, {})
+
+    def send_stream(self, request_body, content):
+        """以SSE格式逐token返回（首token延迟为latency，之后每token间隔token_interval）"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        request_length = int(self.headers.get("Content-Length", 0))
+        self.close_connection = True
+        try:
+            for index, token in enumerate(split_tokens(content)):
+                if index:
+                    time.sleep(self.token_interval)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request_body.get("model", "mock-model"),
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            if (request_body.get("stream_options") or {}).get("include_usage"):
+                # 与OpenAI/vLLM相同：最后一个数据块的choices为空，带有整个请求的usage
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "choices": [],
+                         "usage": mock_usage(request_length, content)}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前关闭连接（如推测任务被取消），停止生成
+            pass
+
+
+def create_server(host="127.0.0.1", port=9000, latency=0.0, token_interval=0.0, responder=None, traces_file=None,
+                  latency_distribution="fixed", latency_sigma=0.5, error_rate=0.0, error_statuses=(503,),
+                  retry_after=None):
+    """
+    创建模拟服务器（每个请求一个线程，可同时保持大量慢请求）
+    :param responder: 可选，fn(request_body) -> 回复内容；返回None时使用默认回复
+    :param traces_file: 可选，/v1/traces 收到的追踪数据追加写入的文件（OTLP/JSON，每行一批）
+    :param latency_distribution: 首token延迟的分布（fixed / uniform / exponential / lognormal，均值为 latency），见 sample_latency
+    :param error_rate: 按该比例立即返回 error_statuses 中随机的一个状态码
+    """
+    if latency_distribution not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"不支持的延迟分布: {latency_distribution}（可选 {' / '.join(LATENCY_DISTRIBUTIONS)}）")
+    handler = type("ConfiguredMockOpenAIHandler", (MockOpenAIHandler,), {
+        "latency": latency,
+        "latency_distribution": latency_distribution,
+        "latency_sigma": latency_sigma,
+        "token_interval": token_interval,
+        "error_rate": error_rate,
+        "error_statuses": tuple(error_statuses),
+        "retry_after": retry_after,
+        "responder": staticmethod(responder) if responder else None,
+        "traces_file": traces_file
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.trace_batches = []
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟OpenAI兼容接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的首token延迟（秒，按分布抽样时为均值）")
+    parser.add_argument("--latency-distribution", default="fixed", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="uniform：相对均值的浮动比例；lognormal：对数标准差")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="相邻token之间的间隔（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="立即返回错误的请求比例")
+    parser.add_argument("--error-status", type=int, nargs="+", default=[503], help="错误状态码（随机选择）")
+    parser.add_argument("--retry-after", type=float, default=None, help="429/503错误响应的 Retry-After（秒）")
+    parser.add_argument("--traces-file", help="/v1/traces 收到的追踪数据追加写入的文件")
+    args = parser.parse_args()
+
+    server = create_server(
+        args.host, args.port, args.latency, args.token_interval, traces_file=args.traces_file,
+        latency_distribution=args.latency_distribution, latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate, error_statuses=args.error_status, retry_after=args.retry_after
+    )
+    print(f"模拟OpenAI接口已启动: http://{args.host}:{args.port}/v1 (延迟 {args.latency_distribution} {args.latency}s，"
+          f"错误率 {args.error_rate:.0%})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+多页报告：把上传的多张图片和PDF展开为按顺序排列的页面，并合并各页的分析结果
+
+PDF渲染使用 pypdfium2（已列入 requirements.txt），在首次上传PDF时才导入。
+"""
+import os
+import threading
+from typing import List, NamedTuple, Union
+
+from PIL import Image
+
+PDF_EXTENSIONS = {'.pdf'}
+PDF_SIGNATURE = b"%PDF-"
+
+# pdfium不是线程安全的（即使是不同的文档），同一进程内的PDF解析和渲染串行执行
+pdfium_lock = threading.Lock()
+
+
+class ReportPage(NamedTuple):
+    label: str  # 页面名称，如 "blood.jpg" 或 "report.pdf#2"
+    source: Union[Image.Image, object]  # 已渲染的PDF页面，或上传图片的文件流
+
+
+def is_pdf_file(filename: str) -> bool:
+    return os.path.splitext((filename or '').lower())[1] in PDF_EXTENSIONS
+
+
+def render_pdf_pages(stream, dpi=150, max_pages=None) -> List[Image.Image]:
+    """
+    按顺序渲染PDF的各页（渲染串行完成，后续预处理再并行）
+    :param max_pages: 页数超过该值时抛出ValueError
+    """
+    try:
+        import pypdfium2
+    except ImportError:
+        raise ImportError("上传PDF需要安装pypdfium2包: pip install pypdfium2")
+
+    stream.seek(0)
+    if stream.read(len(PDF_SIGNATURE)) != PDF_SIGNATURE:
+        raise ValueError("无效的PDF文件")
+    stream.seek(0)
+    with pdfium_lock:
+        try:
+            document = pypdfium2.PdfDocument(stream)
+        except pypdfium2.PdfiumError as e:
+            raise ValueError(f"无法解析PDF文件: {str(e)}")
+        try:
+            page_count = len(document)
+            if max_pages is not None and page_count > max_pages:
+                raise ValueError(f"PDF页数超过限制: {page_count} (最多: {max_pages})")
+            images = []
+            for index in range(page_count):
+                page = document[index]
+                try:
+                    images.append(page.render(scale=dpi / 72).to_pil())
+                finally:
+                    page.close()
+            return images
+        finally:
+            document.close()
+
+
+def collect_report_pages(files, max_pages, pdf_dpi=150) -> List[ReportPage]:
+    """把上传的文件（图片或PDF）按上传顺序展开为页面列表"""
+    pages = []
+    for file in files:
+        if is_pdf_file(file.filename):
+            images = render_pdf_pages(file.stream, pdf_dpi, max_pages - len(pages))
+            pages.extend(ReportPage(f"{file.filename}#{number}", image) for number, image in enumerate(images, 1))
+        else:
+            pages.append(ReportPage(file.filename, file.stream))
+        if len(pages) > max_pages:
+            raise ValueError(f"报告页数超过限制: 最多 {max_pages} 页")
+    if not pages:
+        raise ValueError("PDF文件中没有页面")
+    return pages
+
+
+def merge_page_findings(page_results) -> str:
+    """合并各页的分析结果（作为一份报告的分析结果发送给健康建议模型）"""
+    return "\n\n".join(
+        f"【第{result['page']}页：{result['source']}】\n{result['analysis_result']}" for result in page_results
+    )
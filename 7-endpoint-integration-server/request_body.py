@@ -0,0 +1,60 @@
+"""
+由预先编码的字节块拼接而成的JSON请求体
+
+图片的base64数据（几MB）不需要先拼进data URL字符串、再经json.dumps序列化、再编码为bytes：
+请求体的其余部分序列化后按占位符切分为前后两段，base64字节原样夹在中间，
+发送时逐块写入socket，整个请求过程中base64数据只存在一份。
+"""
+import json
+from typing import AsyncIterator, Iterable, Iterator, Sequence, Tuple
+
+
+class PreEncodedJSONBody:
+    """
+    requests 会通过 __len__ 设置 Content-Length 并逐块发送（不使用chunked编码），
+    可重复迭代，因此重试时可以再次发送；异步模式（httpx）使用 aiter_chunks
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = list(chunks)
+        self.length = sum(len(chunk) for chunk in self.chunks)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self.chunks)
+
+    async def aiter_chunks(self) -> AsyncIterator[bytes]:
+        """
+        逐块异步产出（httpx.AsyncClient 只接受bytes或异步迭代器）；
+        配合显式的Content-Length请求头时 httpx 不使用chunked编码，每次重试重新调用即可再次发送
+        """
+        for chunk in self.chunks:
+            yield chunk
+
+
+def build_json_body(payload: dict, placeholder: str, *raw_chunks: bytes) -> PreEncodedJSONBody:
+    """
+    序列化payload，并用raw_chunks替换其中的占位符字符串
+    raw_chunks必须是JSON字符串中无需转义的内容（如 data:image/jpeg;base64, 前缀和base64字节）
+    """
+    return build_json_body_with_parts(payload, [(placeholder, raw_chunks)])
+
+
+def build_json_body_with_parts(payload: dict, parts: Sequence[Tuple[str, Sequence[bytes]]]) -> PreEncodedJSONBody:
+    """
+    序列化payload，并依次把每个占位符替换为对应的字节块（用于一条消息中包含多张图片）
+    占位符必须按在请求体中出现的顺序给出，且各自恰好出现一次
+    """
+    remaining = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    chunks = []
+    for placeholder, raw_chunks in parts:
+        placeholder_bytes = placeholder.encode("utf-8")
+        prefix, found, remaining = remaining.partition(placeholder_bytes)
+        if not found or placeholder_bytes in remaining or placeholder_bytes in prefix:
+            raise ValueError(f"占位符 {placeholder} 必须在请求体中恰好出现一次")
+        chunks.append(prefix)
+        chunks.extend(raw_chunks)
+    chunks.append(remaining)
+    return PreEncodedJSONBody(chunks)
@@ -0,0 +1,242 @@
+"""
+相似度缓存：按分析结果文本的字符n-gram集合查找已回答过的相近分析结果，复用其健康建议
+
+许多分析结果只是措辞不同（"总胆固醇偏高" 与 "TC高于参考范围"、不同的数值和标点），精确缓存无法命中。
+SimilarityIndex 只用CPU和标准库：
+
+- 特征：文本归一化（小写、数字统一为#、去掉空白和标点）后的字符2-gram和3-gram集合，
+  相似度为余弦相似度 |A∩B| / sqrt(|A|·|B|)，交集用集合运算计算
+- 命名空间：条目只与相同命名空间（模型、提示词版本、异常指标所属的类别等）的查询匹配，每个命名空间有独立的倒排索引；
+  查找时可以再用 accept 回调排除不可复用的条目（如指标方向相反）
+- 倒排索引：n-gram -> 条目ID；查询时按文档频率从低到高选取一部分n-gram（剩余部分的范数低于阈值，
+  不含这些n-gram的条目不可能达到阈值），再按n-gram数过滤（相似度达到阈值t时 t²·|A| <= |B| <= |A|/t²），
+  只对剩下的候选条目计算精确的相似度
+- 与健康建议缓存相同的过期时间（写入后ttl秒过期，查找时跳过并删除过期条目）和条目上限（超出时按LRU淘汰）；
+  定期（有新条目时）原子写入JSON文件，启动时加载未过期的条目并重建n-gram集合
+- 候选条目按与查询共享的低频n-gram数从多到少比较；每次查找有时间预算，超出时停止比较，
+  返回已找到的达到阈值的条目（没有则按未命中处理），计入budget_exceeded；
+  记录每次查找的耗时，snapshot() 返回p50/p95/p99
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, deque
+from itertools import count
+from time import perf_counter, sleep, time
+from typing import Callable, FrozenSet, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 2
+NGRAM_SIZES = (2, 3)
+DIGITS_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+# 去掉空白、标点和Markdown标记（保留汉字、字母、数字占位符和 + - ↑ ↓ 等有含义的符号）
+NOISE_PATTERN = re.compile(r"[\s*_`#:：,，.。;；、!！?？\"'“”‘’()（）\[\]【】<>《》|/\\=]+")
+LATENCY_SAMPLES = 1000  # 计算延迟分位数时保留的最近查找次数
+BUDGET_CHECK_INTERVAL = 64  # 每比较多少个候选条目检查一次时间预算
+
+
+def normalize_text(text: str) -> str:
+    """小写、数字统一为#、去掉空白和标点（不同患者的数值和格式差异不影响相似度）"""
+    return NOISE_PATTERN.sub("", DIGITS_PATTERN.sub("#", text.lower()))
+
+
+def ngram_set(text: str) -> FrozenSet[str]:
+    """文本的字符n-gram集合"""
+    normalized = normalize_text(text)
+    return frozenset(normalized[i:i + size] for size in NGRAM_SIZES for i in range(len(normalized) - size + 1))
+
+
+class SimilarityIndex:
+    """
+    分析结果 -> 健康建议 的相似度索引（线程安全，每个进程一个）
+    :param threshold: 余弦相似度阈值，达到阈值才视为命中
+    :param max_entries: 最多保存的条目数，超出时淘汰最久未使用的条目
+    :param path: 持久化文件路径（None表示不持久化）
+    :param max_lookup_ms: 单次查找的时间预算（毫秒，0表示不限制）
+    :param ttl: 条目写入后的过期时间（秒，0表示不过期）
+    """
+
+    def __init__(self, threshold=0.9, max_entries=5000, path=None, max_lookup_ms=5.0, ttl=0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_lookup_seconds = max_lookup_ms / 1000 if max_lookup_ms > 0 else None
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # 条目ID -> (命名空间, 分析结果, 健康建议, n-gram集合, 写入时间)，按使用时间排序
+        self.text_ids = {}  # (命名空间, 分析结果) -> 条目ID
+        self.postings = {}  # 命名空间 -> {n-gram -> 条目ID集合}
+        self.ids = count()
+        self.dirty = False
+        self.save_thread = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.counters = {"lookups": 0, "hits": 0, "budget_exceeded": 0, "inserts": 0, "evictions": 0, "expirations": 0}
+
+    def lookup(self, text: str, namespace: str,
+               accept: Optional[Callable[[str], bool]] = None) -> Optional[Tuple[str, float]]:
+        """
+        查找最相似的已回答分析结果
+        :param accept: fn(条目的分析结果) -> 是否可以复用；只对达到阈值的条目调用
+        :return: (健康建议, 相似度)；没有达到阈值（且被accept接受）的同命名空间条目时返回None
+        """
+        start = perf_counter()
+        grams = ngram_set(text)
+        with self.lock:
+            best_id, best_score = None, 0.0
+            expired = []
+            expires_before = time() - self.ttl if self.ttl else None
+            deadline = start + self.max_lookup_seconds if self.max_lookup_seconds else None
+            for checked, (entry_id, score) in enumerate(self._candidates(grams, self.postings.get(namespace)), 1):
+                if expires_before is not None and self.entries[entry_id][4] < expires_before:
+                    expired.append(entry_id)
+                elif score >= self.threshold and score > best_score and (
+                        accept is None or accept(self.entries[entry_id][1])):
+                    best_id, best_score = entry_id, score
+                if deadline and checked % BUDGET_CHECK_INTERVAL == 0 and perf_counter() > deadline:
+                    self.counters["budget_exceeded"] += 1
+                    break
+            for entry_id in expired:
+                self._remove(entry_id)
+                self.counters["expirations"] += 1
+            result = None
+            if best_id is not None:
+                self.entries.move_to_end(best_id)
+                result = (self.entries[best_id][2], best_score)
+                self.counters["hits"] += 1
+            self.counters["lookups"] += 1
+            self.latencies.append(perf_counter() - start)
+        return result
+
+    def _candidates(self, grams, postings):
+        """产出 (条目ID, 余弦相似度)；只检查命名空间内与查询共享低频n-gram且n-gram数相近的条目，共享越多越先检查"""
+        if not grams or not postings:
+            return
+        size = len(grams)
+        min_size, max_size = self.threshold ** 2 * size, size / self.threshold ** 2
+        # 达到阈值的条目与查询至少有 t·sqrt(|A|·|B|) >= t²·|A| 个共同n-gram，
+        # 因此必然包含按文档频率从低到高排列的前 |A| - ceil(t²·|A|) + 1 个n-gram中的至少一个
+        prefix_length = size - math.ceil(min_size) + 1
+        shared = Counter()
+        for gram in sorted(grams, key=lambda gram: len(postings.get(gram, ())))[:prefix_length]:
+            shared.update(postings.get(gram, ()))
+        for entry_id, _ in shared.most_common():
+            entry_grams = self.entries[entry_id][3]
+            if min_size <= len(entry_grams) <= max_size:
+                yield entry_id, len(grams & entry_grams) / math.sqrt(size * len(entry_grams))
+
+    def insert(self, text: str, value: str, namespace: str):
+        """加入（或更新）一条已回答的分析结果"""
+        grams = ngram_set(text)
+        if not grams:
+            return
+        with self.lock:
+            self._insert(namespace, text, value, grams, time())
+            self.counters["inserts"] += 1
+            self.dirty = True
+
+    def _insert(self, namespace, text, value, grams, created_at):
+        entry_id = self.text_ids.get((namespace, text))
+        if entry_id is not None:
+            self.entries[entry_id] = (namespace, text, value, grams, created_at)
+            self.entries.move_to_end(entry_id)
+            return
+        entry_id = next(self.ids)
+        self.entries[entry_id] = (namespace, text, value, grams, created_at)
+        self.text_ids[(namespace, text)] = entry_id
+        postings = self.postings.setdefault(namespace, {})
+        for gram in grams:
+            postings.setdefault(gram, set()).add(entry_id)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+
+    def _remove(self, entry_id):
+        namespace, text, _, grams, _ = self.entries.pop(entry_id)
+        del self.text_ids[(namespace, text)]
+        postings = self.postings[namespace]
+        for gram in grams:
+            posting = postings[gram]
+            posting.discard(entry_id)
+            if not posting:
+                del postings[gram]
+        if not postings:
+            del self.postings[namespace]
+
+    def load(self):
+        """从持久化文件加载条目（文件不存在或格式不符时从空索引开始）"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_FORMAT_VERSION:
+                logger.warning(f"相似度索引文件版本不符，忽略: {self.path}")
+                return
+            expires_before = time() - self.ttl if self.ttl else None
+            with self.lock:
+                for namespace, text, value, created_at in data["entries"]:
+                    if expires_before is None or created_at >= expires_before:
+                        self._insert(namespace, text, value, ngram_set(text), created_at)
+            logger.info(f"已加载相似度索引: {len(self.entries)} 条 ({self.path})")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"加载相似度索引失败，从空索引开始: {str(e)}")
+
+    def save(self):
+        """把条目（按使用时间顺序，不含向量）原子写入持久化文件"""
+        if not self.path:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = [[namespace, text, value, created_at]
+                       for namespace, text, value, _, created_at in self.entries.values()]
+            self.dirty = False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_FORMAT_VERSION, "entries": entries}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.dirty = True
+            logger.warning(f"保存相似度索引失败: {str(e)}")
+
+    def start_autosave(self, interval):
+        """启动后台保存线程：每隔interval秒在有新条目时保存一次（每个进程一个）"""
+        if not self.path or interval <= 0 or self.save_thread is not None:
+            return
+
+        def run():
+            while True:
+                sleep(interval)
+                self.save()
+
+        self.save_thread = threading.Thread(target=run, name="similarity-index-save", daemon=True)
+        self.save_thread.start()
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            lookups = self.counters["lookups"]
+            result = dict(
+                self.counters,
+                entries=len(self.entries),
+                namespaces=len(self.postings),
+                threshold=self.threshold,
+                hit_rate=round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            )
+
+        def percentile(fraction):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 3)
+
+        result["lookup_ms"] = {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99),
+                               "max": round(latencies[-1] * 1000, 3) if latencies else 0.0}
+        return result
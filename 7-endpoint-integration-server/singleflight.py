@@ -0,0 +1,129 @@
+"""
+单飞（single-flight）请求合并：同一键的并发调用只执行一次上游请求，其余调用等待并共享结果
+
+缓存只有在上游调用完成后才会写入，用户连续点击或前端重试时，同一张图片的并发请求
+会在此合并为一次API调用。提供线程版本（Flask）和asyncio版本（ASGI）。
+"""
+import asyncio
+from functools import partial
+from threading import Event, Lock
+from typing import Any, Callable, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.event = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlightStats:
+    """统计：实际执行的上游调用数、合并（节省）的调用数"""
+
+    def __init__(self):
+        self.executed = 0
+        self.shared = 0
+
+    def snapshot(self):
+        total = self.executed + self.shared
+        return {
+            "upstream_calls": self.executed,
+            "upstream_calls_saved": self.shared,
+            "saved_ratio": round(self.shared / total, 4) if total else 0.0
+        }
+
+
+class SingleFlight:
+    """线程版本"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = {}
+        self.stats = SingleFlightStats()
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        执行fn（同一键同一时刻只执行一次）
+        :return: (结果, 是否共享了其他请求的结果)
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                self.stats.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self.calls[key] = call
+                self.stats.executed += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result, False
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats.snapshot(), in_flight=len(self.calls))
+
+
+class _AsyncCall:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """
+    asyncio版本（只能在同一个事件循环中使用）
+    上游调用在独立的任务中执行，发起调用的请求被取消（如客户端断开）时其余等待者不受影响；
+    所有等待者都已取消时才取消该任务
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.stats = SingleFlightStats()
+
+    async def do(self, key: str, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        执行fn（协程函数，同一键同一时刻只执行一次）
+        :return: (结果, 是否共享了其他请求的结果)
+        """
+        call = self.calls.get(key)
+        shared = call is not None
+        if shared:
+            self.stats.shared += 1
+        else:
+            self.stats.executed += 1
+            # 任务复制当前上下文（链路追踪、上游调用统计等记录在发起调用的请求下）
+            call = _AsyncCall(asyncio.get_running_loop().create_task(fn(*args, **kwargs)))
+            self.calls[key] = call
+            call.task.add_done_callback(partial(self._forget, key, call))
+
+        call.waiters += 1
+        try:
+            # shield：某个等待者被取消时不影响正在执行的上游调用
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key, call, _task):
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    def snapshot(self):
+        return dict(self.stats.snapshot(), in_flight=len(self.calls))
@@ -0,0 +1,220 @@
+"""
+推测式健康建议：API A流式输出异常指标列表的同时，按指标并行生成健康建议
+
+默认流程中API B要等API A输出完整的分析结果后才开始，两段延迟直接相加。推测模式下：
+
+- IndicatorListParser 增量解析API A的流式输出，每一行异常指标完整输出后立即提交该指标的建议生成，
+  与API A剩余的输出（后续指标、结论等）重叠执行
+- 分析完成后以最终分析结果重新解析出的指标列表为准：不在列表中的推测任务被取消（关闭上游流式连接），
+  尚未提交的指标（如最后一行）立即补交，然后按指标顺序合并各项建议
+- 最终分析结果中没有可解析的异常指标列表（如"未发现异常指标"或自由格式的段落）时取消全部推测任务，
+  由调用方按原方式对整份分析结果生成一次建议
+"""
+import contextvars
+import logging
+import re
+import threading
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 列表项：- / * / • 开头，或 1. / 1、 / 1) / (1) 编号
+LIST_ITEM_PATTERN = re.compile(r"^(?:[-*•·]\s+|\d{1,2}\s*[.、)）]\s*|[（(]\d{1,2}[)）]\s*)(.+)$")
+# "标签：内容" 形式的行
+LABEL_PATTERN = re.compile(r"^([^：:]{1,30})[：:]\s*(.*)$")
+# 小标题关键词（如"异常指标："、"结论："、"### 健康提示"）
+SECTION_PATTERN = re.compile(r"(?:异常|正常)(?:指标|项目|结果)|概述|结论|总结|建议|注意事项|说明|诊断|提示|备注|注")
+SECTION_MAX_LENGTH = 8  # 小标题的最大长度（更长的标签视为指标名称）
+NO_FINDING_PATTERN = re.compile(r"^(?:无|没有|未发现|未见|均正常|均在正常)")
+MARKUP_PATTERN = re.compile(r"^#+\s*|\*\*|__|`")
+
+
+class SpeculationCancelled(Exception):
+    """推测任务已被取消（指标不在最终分析结果中，或分析失败）"""
+
+
+class CancelEvent(threading.Event):
+    """
+    推测任务的取消标记：set() 时调用已登记的回调（如中止上游连接），
+    阻塞在等待上游首个token或下一段输出上的任务立即结束，不必等到下一段输出到达后才检查
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.callbacks_lock = threading.Lock()
+        self.callbacks = []
+
+    def set(self):
+        with self.callbacks_lock:
+            super().set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"取消推测任务时出错: {str(e)}")
+
+    def add_callback(self, callback):
+        """登记取消时调用的回调；已取消时立即调用"""
+        with self.callbacks_lock:
+            if not self.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self.callbacks_lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+
+def strip_markup(text: str) -> str:
+    """去掉Markdown标记（标题#、加粗等）"""
+    return MARKUP_PATTERN.sub("", text).strip()
+
+
+def indicator_label(indicator: str) -> str:
+    """指标行中冒号之前的部分（如"丙氨酸氨基转移酶（ALT）升高"），没有冒号时返回整行"""
+    match = LABEL_PATTERN.match(indicator)
+    return match.group(1).strip() if match else indicator
+
+
+class IndicatorListParser:
+    """
+    增量解析分析结果中的异常指标列表：每一行完整输出后才判断该行（列表项的内容在换行前可能还不完整）
+    出现小标题之前的列表项视为异常指标（分析提示词要求只列出异常指标）；
+    "异常指标："等小标题之后的列表项为异常指标，"正常指标："、"结论："、"异常指标：无"等小标题之后的列表项忽略
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.in_abnormal_section = True
+
+    def feed(self, delta: str) -> List[str]:
+        """输入一段增量文本，返回其中新完成的异常指标行"""
+        self.buffer += delta
+        *lines, self.buffer = self.buffer.split("\n")
+        return [item for item in map(self._parse_line, lines) if item]
+
+    def finish(self) -> List[str]:
+        """输出结束：解析最后一行（没有换行结尾）"""
+        line, self.buffer = self.buffer, ""
+        item = self._parse_line(line)
+        return [item] if item else []
+
+    def _parse_line(self, line: str) -> Optional[str]:
+        is_heading_line = line.lstrip().startswith("#")
+        text = strip_markup(line)
+        if not text:
+            return None
+        match = LIST_ITEM_PATTERN.match(text)
+        content = strip_markup(match.group(1)) if match else text
+        label_match = LABEL_PATTERN.match(content)
+        label, rest = (label_match.group(1).strip(), label_match.group(2).strip()) if label_match else (content, "")
+
+        if is_heading_line or (len(label) <= SECTION_MAX_LENGTH and SECTION_PATTERN.search(label)):
+            # 小标题：决定之后的列表项是否为异常指标
+            self.in_abnormal_section = (
+                "异常" in label and not re.search(r"[无未]见?异常|未发现异常", label)
+                and not NO_FINDING_PATTERN.match(rest)
+            )
+            return None
+        if match and self.in_abnormal_section:
+            return content
+        return None
+
+
+def parse_indicator_items(analysis_result: str) -> List[str]:
+    """从完整的分析结果中解析异常指标行（去重，保持顺序）"""
+    parser = IndicatorListParser()
+    items = parser.feed(analysis_result) + parser.finish()
+    return list(dict.fromkeys(items))
+
+
+def merge_indicator_recommendations(indicators: List[str], recommendations: List[str]) -> str:
+    """按指标顺序合并各项健康建议"""
+    return "\n\n".join(
+        f"【{indicator_label(indicator)}】\n{recommendation.strip()}"
+        for indicator, recommendation in zip(indicators, recommendations)
+    )
+
+
+class SpeculativeRecommendations:
+    """
+    一次分析请求的推测式健康建议生成
+    :param executor: 执行各项指标建议生成的线程池
+    :param recommend_indicator: fn(indicator, cancel_event) -> 建议文本；cancel_event 为 CancelEvent，
+        应在其上登记中止上游请求的回调，被取消时抛出SpeculationCancelled
+    :param max_indicators: 最多并行生成的指标数，最终指标数超过该值时回退为对整份分析结果生成一次建议
+    """
+
+    def __init__(self, executor, recommend_indicator: Callable[[str, CancelEvent], str], max_indicators=12):
+        self.executor = executor
+        self.recommend_indicator = recommend_indicator
+        self.max_indicators = max_indicators
+        self.parser = IndicatorListParser()
+        self.tasks = {}  # 指标行 -> (future, cancel_event)，按提交顺序
+        self.speculated = 0  # 分析完成之前已提交的指标数
+        self.cancelled = 0
+        self.indicator_count = 0
+        self.fallback = False
+
+    def feed(self, delta: str):
+        """输入API A的一段流式输出，新完成的异常指标立即提交"""
+        for indicator in self.parser.feed(delta):
+            self._submit(indicator)
+
+    def _submit(self, indicator):
+        if indicator in self.tasks or len(self.tasks) >= self.max_indicators:
+            return
+        cancel_event = CancelEvent()
+        # 在复制的上下文中执行，任务中的上游调用计入发起推测的请求
+        future = self.executor.submit(contextvars.copy_context().run, self.recommend_indicator, indicator, cancel_event)
+        self.tasks[indicator] = (future, cancel_event)
+        logger.info(f"推测生成健康建议: {indicator_label(indicator)}")
+
+    def _cancel(self, indicator):
+        future, cancel_event = self.tasks.pop(indicator)
+        if not future.done():
+            cancel_event.set()
+            future.cancel()
+            self.cancelled += 1
+
+    def cancel(self):
+        """取消全部尚未完成的推测任务（分析失败或请求结束时调用；已完成的任务不受影响）"""
+        for indicator in list(self.tasks):
+            self._cancel(indicator)
+
+    def resolve(self, analysis_result: str) -> Optional[str]:
+        """
+        分析完成后调用：以最终分析结果为准取消、补交推测任务，等待并合并各项建议
+        :return: 合并后的健康建议；没有可用的异常指标列表时返回None（推测任务已全部取消）
+        """
+        self.speculated = len(self.tasks)
+        indicators = parse_indicator_items(analysis_result)
+        self.indicator_count = len(indicators)
+        if not indicators or len(indicators) > self.max_indicators:
+            logger.info(f"分析结果中异常指标数为 {len(indicators)}，取消推测任务，改为对整份分析结果生成建议")
+            self.fallback = True
+            self.cancel()
+            return None
+
+        for indicator in [indicator for indicator in self.tasks if indicator not in indicators]:
+            logger.info(f"指标不在最终分析结果中，取消推测任务: {indicator_label(indicator)}")
+            self._cancel(indicator)
+        for indicator in indicators:
+            self._submit(indicator)
+        try:
+            recommendations = [self.tasks[indicator][0].result() for indicator in indicators]
+        except Exception:
+            self.cancel()
+            raise
+        return merge_indicator_recommendations(indicators, recommendations)
+
+    def stats(self) -> dict:
+        return {
+            "indicators": self.indicator_count,
+            "speculated": self.speculated,
+            "cancelled": self.cancelled,
+            "fallback": self.fallback,
+        }
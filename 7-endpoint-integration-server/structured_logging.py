@@ -0,0 +1,269 @@
+"""
+请求热路径上的结构化、可采样、不阻塞的日志
+
+标准的 StreamHandler / FileHandler 在请求线程中格式化并同步写入stderr和日志文件，每条日志都要获取处理器的锁，
+并发请求在锁和磁盘写入上互相等待。configure_logging 改为：
+
+- 请求线程只做过滤和入队（QueueHandler，队列满时丢弃并计数，不阻塞请求）；
+  格式化为JSON（或原有的文本格式）、写入stderr和按大小轮转的日志文件都在后台线程中完成（QueueListener）
+- 每个请求一个关联ID（请求头 X-Request-ID，没有时生成），保存在 contextvars 中：
+  同一请求在线程池任务（contextvars.copy_context().run）中写的日志也带有相同的 request_id；启用链路追踪时同时记录 trace_id
+- 请求内的INFO及以下日志（逐步骤的过程日志）按请求采样：采样到的请求保留全部过程日志，其余请求只保留
+  WARNING及以上和标记为 ALWAYS_LOG 的日志（如每个请求一行的访问日志）
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from tracing import current_span
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+ALWAYS_LOG = {"always_log": True}  # 作为 extra 传入：不参与采样
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, default=str)
+# LogRecord 的标准属性，其余属性（通过 extra 传入）作为JSON字段输出
+STANDARD_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "taskName", "request_id", "trace_id", "always_log", "formatted"
+}
+
+
+class RequestLogContext:
+    """一个请求的日志上下文：关联ID和是否保留过程日志"""
+    __slots__ = ("request_id", "sampled")
+
+    def __init__(self, request_id, sampled):
+        self.request_id = request_id
+        self.sampled = sampled
+
+
+current_request_log: ContextVar[Optional[RequestLogContext]] = ContextVar("current_request_log", default=None)
+
+
+def new_request_log(request_id=None, sample_ratio=1.0) -> RequestLogContext:
+    """创建请求的日志上下文（请求头提供的ID格式不符时重新生成），并决定是否保留这个请求的过程日志"""
+    if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    return RequestLogContext(request_id, sample_ratio >= 1.0 or random.random() < sample_ratio)
+
+
+def activate_request_log(context):
+    """把请求的日志上下文设为当前上下文，返回用于 deactivate_request_log 的token"""
+    return current_request_log.set(context)
+
+
+def deactivate_request_log(token):
+    if token is None:
+        return
+    try:
+        current_request_log.reset(token)
+    except ValueError:
+        # 在其他上下文中结束（如流式响应的生成器），无需恢复
+        pass
+
+
+class RequestContextFilter(logging.Filter):
+    """在写日志的线程中补充 request_id / trace_id，并丢弃未采样请求的过程日志"""
+
+    def __init__(self):
+        super().__init__()
+        self.sampled_out = 0
+
+    def filter(self, record):
+        context = current_request_log.get()
+        if context is None:
+            record.request_id = None
+        else:
+            if (not context.sampled and record.levelno <= logging.INFO
+                    and not getattr(record, "always_log", False)):
+                self.sampled_out += 1
+                return False
+            record.request_id = context.request_id
+        span = current_span()
+        record.trace_id = span.trace_id if span.sampled else None
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """入队不阻塞：队列满时丢弃日志并计数（日志写入跟不上时不拖慢请求）"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # 在请求线程中只合并消息参数、把异常转为文本（对象可能在之后被修改）；格式化在后台线程中进行
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class BackgroundListener(QueueListener):
+    """
+    在后台线程中写出队列中的日志：连续写入时不逐条flush，队列取空时统一flush一次
+    （stderr和日志文件的写入合并为较少的系统调用）；stop 可以重复调用（重新配置和进程退出时）
+    """
+
+    def dequeue(self, block):
+        if block and self.queue.empty():
+            self.flush_handlers()
+        return self.queue.get(block)
+
+    def flush_handlers(self):
+        for handler in self.handlers:
+            handler.flush_buffer()
+
+    def enqueue_sentinel(self):
+        # 队列满时等待后台线程腾出空间，保证结束标记不丢失
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+            self.flush_handlers()
+
+
+class DeferredFlushMixin:
+    """emit 后不立即flush，由 BackgroundListener 在队列取空时调用 flush_buffer"""
+
+    def flush(self):
+        pass
+
+    def flush_buffer(self):
+        super().flush()
+
+
+class DeferredStreamHandler(DeferredFlushMixin, logging.StreamHandler):
+    pass
+
+
+class DeferredRotatingFileHandler(DeferredFlushMixin, RotatingFileHandler):
+    """按累计写入的字节数判断是否轮转（标准实现每条日志都要stat文件两次并seek）"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.size = None
+
+    def shouldRollover(self, record):
+        if self.maxBytes <= 0:
+            return False
+        if self.size is None:
+            self.size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        length = len(self.format(record).encode("utf-8")) + len(self.terminator)
+        rollover = self.size > 0 and self.size + length >= self.maxBytes
+        self.size = length if rollover else self.size + length
+        return rollover
+
+
+class CachedFormatter(logging.Formatter):
+    """格式化结果保存在日志记录上：stderr、日志文件和轮转检查（RotatingFileHandler 会再格式化一次以计算长度）只格式化一次"""
+
+    def format(self, record):
+        formatted = record.__dict__.get("formatted")
+        if formatted is None:
+            formatted = record.formatted = self.format_record(record)
+        return formatted
+
+    def format_record(self, record):
+        return super().format(record)
+
+
+class JsonFormatter(CachedFormatter):
+    """每条日志一行JSON：时间、级别、来源、消息、request_id、trace_id，以及通过 extra 传入的字段"""
+
+    def format_record(self, record):
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            payload["request_id"] = record.request_id
+        if getattr(record, "trace_id", None):
+            payload["trace_id"] = record.trace_id
+        for key in record.__dict__.keys() - STANDARD_RECORD_ATTRIBUTES:
+            payload[key] = record.__dict__[key]
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return JSON_ENCODER.encode(payload)
+
+
+class TextFormatter(CachedFormatter):
+    """原有的文本格式，请求内的日志在消息前加 [request_id]"""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def formatMessage(self, record):
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            record.message = f"[{request_id}] {record.message}"
+        return super().formatMessage(record)
+
+
+def create_handlers(log_format="json", log_file=None, max_bytes=0, backup_count=5):
+    """stderr和（可选的）按大小轮转的日志文件；log_file 中的 {pid} 替换为进程号（多进程部署时各写各的文件，避免轮转冲突）"""
+    formatter = JsonFormatter() if log_format == "json" else TextFormatter()
+    handlers = [DeferredStreamHandler(sys.stderr)]
+    if log_file:
+        log_file = log_file.replace("{pid}", str(os.getpid()))
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handlers.append(DeferredRotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(level="INFO", log_format="json", log_file=None, max_bytes=0, backup_count=5,
+                      queue_size=10000) -> NonBlockingQueueHandler:
+    """
+    把根日志记录器改为经队列异步写入（替换已有的处理器），返回队列处理器（dropped 为队列满时丢弃的条数，
+    filters[0].sampled_out 为采样丢弃的条数）
+    :param log_format: json / text
+    :param max_bytes: 日志文件达到该大小时轮转（0表示不轮转）
+    """
+    if log_format not in ("json", "text"):
+        raise ValueError(f"不支持的日志格式: {log_format}（可选 json / text）")
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    listener = BackgroundListener(log_queue, *create_handlers(log_format, log_file, max_bytes, backup_count),
+                                  respect_handler_level=True)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        if isinstance(handler, NonBlockingQueueHandler):
+            handler.listener.stop()
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    queue_handler.listener = listener
+    listener.start()
+    # 进程退出时写完队列中剩余的日志
+    atexit.register(listener.stop)
+    return queue_handler
@@ -0,0 +1,430 @@
+"""
+请求链路追踪（OpenTelemetry数据模型，W3C Trace Context传播，OTLP/JSON导出）
+
+一次分析请求的耗时可能来自排队等待并发名额、图片处理、重试退避或模型生成，日志中只有各阶段的总耗时。
+Tracer 为每个请求记录一棵span树：
+
+- 请求span（server）从请求头 traceparent 继承上游调用方的trace；其下为文件校验、图片处理（缩放、编码）、
+  缓存查找、每个阶段的模型调用，以及模型调用中的每一次HTTP尝试（client，含排队等待时间）和重试退避
+- 每次HTTP尝试把自己的 traceparent 写入发往模型端点的请求头（vLLM等支持OpenTelemetry的服务端可以接上同一条trace）
+- 当前span保存在 contextvars 中：提交到线程池的任务用 contextvars.copy_context().run 执行即可接在同一棵树上；
+  生成器中跨 yield 的span不激活（activate=False），避免调用方在生成器挂起期间创建的span挂到错误的父span下
+- 结束的span放入队列，由后台线程按批导出（不阻塞请求线程；队列满时丢弃并计数）：
+  file 追加写入OTLP/JSON（每行一个 ExportTraceServiceRequest），otlp 以OTLP/HTTP JSON发送到collector
+
+未启用导出时所有操作都是空操作。查看文件中的trace：
+    python tracing.py traces/spans.jsonl              # 最近一条trace
+    python tracing.py traces/spans.jsonl --trace-id <trace_id>
+"""
+import argparse
+import atexit
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import time_ns
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+INVALID_SPAN_ID = "0" * 16
+
+# OTLP SpanKind / StatusCode
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+EXPORT_QUEUE_SIZE = 4096  # 等待导出的span上限，超出时丢弃
+EXPORT_BATCH_SIZE = 256  # 每批导出的span数
+EXPORT_INTERVAL = 2.0  # 导出间隔（秒）
+
+
+class SpanContext:
+    """跨进程传播的span标识（来自请求头的远程父span）"""
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "sampled", "start_ns", "end_ns",
+                 "attributes", "events", "status", "status_message", "tracer")
+
+    def __init__(self, tracer, name, kind, trace_id, parent_id, sampled, attributes, start_ns=None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = start_ns or time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.events = []
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, attributes=None):
+        self.events.append((time_ns(), name, attributes or {}))
+
+    def set_error(self, message):
+        self.status = STATUS_ERROR
+        self.status_message = str(message)[:500]
+
+    def record_exception(self, exception):
+        self.add_event("exception", {"exception.type": type(exception).__name__,
+                                     "exception.message": str(exception)[:500]})
+        self.set_error(exception)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def end(self, end_ns=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time_ns()
+        if self.sampled:
+            self.tracer.processor.submit(self)
+
+
+class NoopSpan:
+    """未启用追踪时使用的空span"""
+    sampled = False
+    trace_id = INVALID_TRACE_ID
+    span_id = INVALID_SPAN_ID
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def set_error(self, message):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self, end_ns=None):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+current_span_var: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span():
+    """当前激活的span（没有时返回空span，可以直接调用set_attribute等方法）"""
+    return current_span_var.get() or NOOP_SPAN
+
+
+def parse_traceparent(header) -> Optional[SpanContext]:
+    """解析W3C traceparent请求头（格式不符或ID全为0时返回None）"""
+    match = TRACEPARENT_PATTERN.match((header or "").strip().lower())
+    if not match or match.group(1) == INVALID_TRACE_ID or match.group(2) == INVALID_SPAN_ID:
+        return None
+    return SpanContext(match.group(1), match.group(2), bool(int(match.group(3), 16) & 1))
+
+
+class Tracer:
+    """
+    :param service_name: 导出时的 service.name 资源属性
+    :param exporter: JsonlFileExporter / OtlpHttpExporter，None表示不启用追踪
+    :param sample_ratio: 新trace的采样比例（继承远程父span的采样决定）
+    """
+
+    def __init__(self, service_name, exporter=None, sample_ratio=1.0):
+        self.service_name = service_name
+        self.enabled = exporter is not None
+        self.sample_ratio = sample_ratio
+        self.processor = BatchSpanProcessor(exporter, service_name) if exporter is not None else None
+
+    def start_span(self, name, kind=INTERNAL, attributes=None, parent=None, start_ns=None):
+        """
+        创建span（不激活）；parent为None时使用当前激活的span，都没有时开始新的trace
+        :param parent: Span 或 SpanContext（来自请求头的远程父span）
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            parent = current_span_var.get()
+        if parent is None or parent is NOOP_SPAN:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            sampled = random.random() < self.sample_ratio
+        else:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        return Span(self, name, kind, trace_id, parent_id, sampled, attributes, start_ns)
+
+    def activate(self, span):
+        """把span设为当前span，返回用于 deactivate 的token"""
+        if span is NOOP_SPAN:
+            return None
+        return current_span_var.set(span)
+
+    def deactivate(self, token):
+        if token is None:
+            return
+        try:
+            current_span_var.reset(token)
+        except ValueError:
+            # 在其他上下文中结束（如生成器在另一个线程中被关闭），无需恢复
+            pass
+
+    @contextmanager
+    def span(self, name, kind=INTERNAL, attributes=None, parent=None, activate=True):
+        """在with块中记录一个span；抛出的异常记录为错误状态。生成器中跨yield的span应使用 activate=False"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        span = self.start_span(name, kind, attributes, parent)
+        token = self.activate(span) if activate else None
+        try:
+            yield span
+        except GeneratorExit:
+            span.set_attribute("cancelled", True)
+            raise
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            self.deactivate(token)
+            span.end()
+
+    def traced(self, name):
+        """装饰器：每次调用函数时记录一个span"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record_span(self, name, start_ns, end_ns, attributes=None, parent=None):
+        """记录一个已知起止时间的span（如在图片处理工作进程中执行的步骤）"""
+        if self.enabled:
+            self.start_span(name, INTERNAL, attributes, parent, start_ns).end(end_ns)
+
+    def inject(self, headers, span=None) -> dict:
+        """返回加上 traceparent 的请求头副本（span默认为当前span）"""
+        span = span or current_span()
+        if span is NOOP_SPAN:
+            return headers
+        return dict(headers, traceparent=span.traceparent())
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def span_to_otlp(span) -> dict:
+    """span的OTLP/JSON表示（traceId/spanId为十六进制字符串，时间为纳秒字符串）"""
+    result = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes(span.attributes),
+        "status": {"code": span.status, "message": span.status_message} if span.status else {},
+    }
+    if span.parent_id:
+        result["parentSpanId"] = span.parent_id
+    if span.events:
+        result["events"] = [
+            {"timeUnixNano": str(event_ns), "name": name, "attributes": _otlp_attributes(attributes)}
+            for event_ns, name, attributes in span.events
+        ]
+    return result
+
+
+def build_export_request(service_name, spans) -> dict:
+    """OTLP ExportTraceServiceRequest"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attributes({"service.name": service_name, "process.pid": os.getpid()})},
+        "scopeSpans": [{"scope": {"name": "medical_report_server"}, "spans": [span_to_otlp(span) for span in spans]}],
+    }]}
+
+
+class JsonlFileExporter:
+    """追加写入OTLP/JSON文件（每行一批；与OpenTelemetry Collector的file exporter格式相同）"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, payload: dict):
+        line = json.dumps(payload, ensure_ascii=False, separators=(",", ":")) + "\n"
+        # 每批一次write（O_APPEND），多个工作进程写同一个文件时各行不会交错
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class OtlpHttpExporter:
+    """以OTLP/HTTP JSON发送到collector（如 http://localhost:4318/v1/traces）"""
+
+    def __init__(self, endpoint, timeout=5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def export(self, payload: dict):
+        response = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class BatchSpanProcessor:
+    """结束的span进入队列，后台线程按批导出（首次提交时启动线程，gunicorn的工作进程各自启动）"""
+
+    def __init__(self, exporter, service_name, max_queue=EXPORT_QUEUE_SIZE, batch_size=EXPORT_BATCH_SIZE,
+                 interval=EXPORT_INTERVAL):
+        self.exporter = exporter
+        self.service_name = service_name
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.dropped = 0  # 队列满时丢弃的span数（下次导出时报告）
+
+    def submit(self, span):
+        if self.thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.interval)]
+            except queue.Empty:
+                continue
+            self._export(batch)
+
+    def _export(self, batch):
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            logger.warning(f"追踪数据导出队列已满，丢弃了 {dropped} 个span")
+        try:
+            self.exporter.export(build_export_request(self.service_name, batch))
+        except Exception as e:
+            logger.warning(f"导出追踪数据失败（丢弃 {len(batch)} 个span）: {str(e)}")
+
+    def flush(self):
+        """导出队列中剩余的span（进程退出时调用）"""
+        while not self.queue.empty():
+            self._export([])
+
+
+def create_exporter(kind, file_path=None, otlp_endpoint=None):
+    """按配置创建导出器：none / file / otlp"""
+    if kind == "none":
+        return None
+    if kind == "file":
+        return JsonlFileExporter(file_path)
+    if kind == "otlp":
+        return OtlpHttpExporter(otlp_endpoint)
+    raise ValueError(f"不支持的追踪导出方式: {kind}（可选 none / file / otlp）")
+
+
+def load_spans(path):
+    """读取OTLP/JSON文件中的所有span"""
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for resource_spans in json.loads(line)["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    spans.extend(scope_spans["spans"])
+    return spans
+
+
+def format_trace(spans) -> str:
+    """把一条trace的span按父子关系缩进输出：起始偏移、耗时、名称、属性"""
+    spans = sorted(spans, key=lambda span: int(span["startTimeUnixNano"]))
+    span_ids = {span["spanId"] for span in spans}
+    children = {}
+    for span in spans:
+        parent_id = span.get("parentSpanId")
+        children.setdefault(parent_id if parent_id in span_ids else None, []).append(span)
+    trace_start = int(spans[0]["startTimeUnixNano"])
+    lines = []
+
+    def visit(span, depth):
+        start = (int(span["startTimeUnixNano"]) - trace_start) / 1e6
+        duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+        attributes = ", ".join(f"{item['key']}={next(iter(item['value'].values()))}" for item in span["attributes"])
+        error = " [ERROR]" if span.get("status", {}).get("code") == STATUS_ERROR else ""
+        lines.append(f"{start:>10.1f}ms {duration:>10.1f}ms  {'  ' * depth}{span['name']}{error}"
+                     f"{'  (' + attributes + ')' if attributes else ''}")
+        for child in children.get(span["spanId"], []):
+            visit(child, depth + 1)
+
+    for root in children.get(None, []):
+        visit(root, 0)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看OTLP/JSON追踪文件中的trace")
+    parser.add_argument("path", help="追踪文件路径（TRACING_FILE_PATH）")
+    parser.add_argument("--trace-id", help="要查看的trace ID（默认为最近一条）")
+    args = parser.parse_args()
+
+    spans = load_spans(args.path)
+    if not spans:
+        print("文件中没有span")
+        return
+    trace_id = args.trace_id or max(spans, key=lambda span: int(span["endTimeUnixNano"]))["traceId"]
+    trace_spans = [span for span in spans if span["traceId"] == trace_id]
+    print(f"trace {trace_id}：{len(trace_spans)} 个span")
+    print(f"{'起始':>12}{'耗时':>12}  名称")
+    print(format_trace(trace_spans))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,9 @@ const AppState = {
     chatHistory: JSON.parse(localStorage.getItem('chatHistory') || '[]'),
     theme: localStorage.getItem('theme') || 'light',
     currentRequest: null,
-    serverUrl: 'http://101.32.126.91:80'
+    serverUrl: 'http://101.32.126.91:80',
+    // 流式模式：分析和建议边生成边显示（URL参数 stream=0 可关闭）
+    useStreaming: true
 };
 
 // DOM元素
@@ -38,6 +40,13 @@ function initializeApp() {
     if (urlParams.get('server')) {
         AppState.serverUrl = urlParams.get('server');
     }
+    if (urlParams.get('stream') === '0') {
+        AppState.useStreaming = false;
+    }
+    // 浏览器不支持流式读取响应时回退到普通模式
+    if (!window.fetch || !window.ReadableStream || !window.TextDecoder) {
+        AppState.useStreaming = false;
+    }
 }
 
 // 设置事件监听器
@@ -210,7 +219,173 @@ function handleSend() {
     if (!AppState.selectedImage) return;
     
     const imageFile = AppState.selectedImage;
-    sendImageToServer(imageFile);
+    submitImage(imageFile);
+}
+
+// 根据模式选择流式或普通请求
+function submitImage(imageFile) {
+    if (AppState.useStreaming) {
+        sendImageToServerStreaming(imageFile);
+    } else {
+        sendImageToServer(imageFile);
+    }
+}
+
+// 流式发送图片到服务器（server-sent events），分析结果和健康建议边生成边显示
+function sendImageToServerStreaming(imageFile) {
+    // 保存图片文件以便重试
+    AppState.lastImageFile = imageFile;
+    
+    hideWelcomeScreen();
+    displayUserImage(imageFile);
+    removeImage();
+    
+    const loadingMessageId = displayLoadingMessage();
+    updateStatus('分析中...');
+    
+    const formData = new FormData();
+    formData.append('image', imageFile);
+    
+    const controller = new AbortController();
+    AppState.currentRequest = controller;
+    const timeoutId = setTimeout(() => controller.abort(), 600000); // 10分钟
+    
+    let analysisText = '';
+    let recommendationText = '';
+    let analysisContent = null;
+    let recommendationContent = null;
+    let loadingRemoved = false;
+    
+    // 收到第一段内容时移除加载消息
+    const finishLoading = () => {
+        if (!loadingRemoved) {
+            loadingRemoved = true;
+            clearLoadingTimer();
+            removeMessageById(loadingMessageId);
+        }
+    };
+    
+    const handleEvent = (event, data) => {
+        if (event === 'analysis') {
+            finishLoading();
+            if (!analysisContent) {
+                analysisContent = createStreamingSection('analysis');
+            }
+            analysisText += data.delta;
+            analysisContent.innerHTML = convertMarkdownToHtml(analysisText);
+            scrollToBottom();
+        } else if (event === 'analysis_done') {
+            AppState.currentChat.push({
+                type: 'assistant',
+                content: 'analysis',
+                text: data.analysis_result
+            });
+        } else if (event === 'recommendation') {
+            if (!recommendationContent) {
+                recommendationContent = createStreamingSection('recommendation');
+            }
+            recommendationText += data.delta;
+            recommendationContent.innerHTML = convertMarkdownToHtml(recommendationText);
+            scrollToBottom();
+        } else if (event === 'done') {
+            if (data.processing_time) {
+                console.log(`处理完成，总耗时: ${data.processing_time}秒`);
+            }
+            AppState.currentChat.push({
+                type: 'assistant',
+                content: 'recommendations',
+                text: data.health_recommendations
+            });
+            showToast('分析完成', 'success');
+        } else if (event === 'error') {
+            throw new Error(data.error);
+        }
+    };
+    
+    fetch(`${AppState.serverUrl}/analyze_medical_report/stream`, {
+        method: 'POST',
+        body: formData,
+        signal: controller.signal
+    }).then(async (response) => {
+        if (!response.ok) {
+            let message = `服务器错误: ${response.status}`;
+            try {
+                const errorResponse = await response.json();
+                message += ` - ${errorResponse.error}`;
+            } catch (e) {
+                // 响应不是JSON，保留状态码信息
+            }
+            throw new Error(message);
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            // 每个事件以空行结束
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const parsed = parseSseFrame(frame);
+                if (parsed) {
+                    handleEvent(parsed.event, parsed.data);
+                }
+            }
+        }
+    }).catch((error) => {
+        finishLoading();
+        const message = error.name === 'AbortError'
+            ? '请求超时，请稍后重试。'
+            : (error.message || '网络错误，请检查连接。');
+        displayErrorMessage(message);
+        showToast('分析失败', 'error');
+        addRetryButton(message);
+    }).finally(() => {
+        clearTimeout(timeoutId);
+        AppState.currentRequest = null;
+        updateStatus('就绪');
+    });
+}
+
+// 解析一条SSE事件
+function parseSseFrame(frame) {
+    let event = 'message';
+    const dataLines = [];
+    frame.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    if (dataLines.length === 0) return null;
+    return { event, data: JSON.parse(dataLines.join('\n')) };
+}
+
+// 创建流式输出的消息区块，返回内容容器
+function createStreamingSection(kind) {
+    const message = createMessageElement('assistant');
+    const section = document.createElement('div');
+    section.className = kind === 'analysis' ? 'analysis-section' : 'recommendation-section';
+    
+    const title = document.createElement('h3');
+    title.innerHTML = kind === 'analysis'
+        ? '<span style="margin-right: 8px;">📊</span>检测结果分析'
+        : '<span style="margin-right: 8px;">💡</span>健康建议';
+    
+    const content = document.createElement('div');
+    content.className = 'markdown-content';
+    
+    section.appendChild(title);
+    section.appendChild(content);
+    message.querySelector('.message-content').appendChild(section);
+    elements.chatContainer.appendChild(message);
+    scrollToBottom();
+    return content;
 }
 
 // 发送图片到服务器
@@ -649,7 +824,7 @@ function addRetryButton(errorType) {
         if (AppState.lastImageFile) {
             retryBtn.disabled = true;
             retryBtn.textContent = '重试中...';
-            sendImageToServer(AppState.lastImageFile);
+            submitImage(AppState.lastImageFile);
         }
     };
     